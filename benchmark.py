@@ -0,0 +1,588 @@
+"""Benchmarks for SplunkManager against a synthetic SPLUNK_HOME
+
+Builds a Splunk-like tree (var/lib/splunk/<index> with hot, warm and cold
+buckets, .dat files, indexes.conf and a fake bin/splunk CLI), then times the
+manager's operations on it and saves the results as JSON:
+
+    python benchmark.py generate /tmp/splunk_home --indexes 3 --warm 8 --bucket-size 16M
+    python benchmark.py run --output results.json
+    python benchmark.py compare before.json results.json
+
+`run` generates a fresh tree in a temporary directory unless --home points at
+one made by `generate`. Index calls go through an in-process splunkd stand-in
+(splunkd_standin.py) or, with --api cli, through the fake splunk binary.
+The data is generated from --seed, so runs with the same options compare.
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import statistics
+import subprocess
+
+import SplunkManager
+import splunkd_standin
+
+BUCKET_SPAN = 86400
+FIRST_EVENT_TIME = 1700000000
+SYSTEM_INDEXES = ['_audit', '_internal', '_introspection', '_telemetry', 'history', 'main', 'summary']
+WRITE_BLOCK = 1024 * 1024
+
+# Share of a bucket's bytes per file; the rest goes to the small metadata files
+BUCKET_LAYOUT = [
+    ('rawdata/journal.gz', 0.55, 'journal'),
+    ('rawdata/slicesv2.dat', 0.02, 'random'),
+    ('rawdata/slicemin.dat', 0.005, 'random'),
+    ('{latest}-{earliest}-{id}.tsidx', 0.33, 'tsidx'),
+    ('bloomfilter', 0.06, 'bloom'),
+]
+METADATA_FILES = ['Hosts.data', 'Sources.data', 'SourceTypes.data', 'Strings.data']
+
+# Byte tables for bytes.translate: tsidx files deflate to about half, bloomfilters mostly to nothing
+TSIDX_TABLE = bytes(b & 0x0F for b in range(256))
+BLOOM_TABLE = bytes(b if b < 32 else 0 for b in range(256))
+
+FAKE_SPLUNK = '''#!{python}
+"""Fake splunk CLI written by benchmark.py: add/remove/list index and login against {splunk_db}"""
+import os
+import sys
+import time
+import shutil
+
+SPLUNK_DB = {splunk_db!r}
+AUTH = {auth!r}
+SYSTEM_INDEXES = {system_indexes!r}
+
+time.sleep({cli_delay!r})
+args = sys.argv[1:]
+auth = args[args.index('-auth') + 1] if '-auth' in args else None
+if auth != AUTH:
+    sys.stderr.write("Login failed\\n")
+    sys.exit(1)
+command = [arg for arg in args if arg != '-auth' and arg != auth]
+
+if command[:1] == ['login']:
+    print("Login successful.")
+elif command[:2] == ['list', 'index']:
+    names = set(SYSTEM_INDEXES)
+    names.update(name for name in os.listdir(SPLUNK_DB) if os.path.isdir(os.path.join(SPLUNK_DB, name)))
+    for name in sorted(names):
+        print(name)
+        for folder in ('db', 'colddb', 'thaweddb'):
+            print("\\t" + os.path.join(SPLUNK_DB, name, folder))
+elif command[:2] == ['add', 'index'] and len(command) == 3:
+    path = os.path.join(SPLUNK_DB, command[2])
+    if os.path.isdir(path):
+        sys.stderr.write('An error occurred: Index "%s" already exists\\n' % command[2])
+        sys.exit(22)
+    for folder in ('db', 'colddb', 'thaweddb'):
+        os.makedirs(os.path.join(path, folder))
+    print('Index "%s" added.' % command[2])
+elif command[:2] == ['remove', 'index'] and len(command) == 3:
+    path = os.path.join(SPLUNK_DB, command[2])
+    if not os.path.isdir(path):
+        sys.stderr.write("An error occurred: Could not find object id=%s\\n" % command[2])
+        sys.exit(22)
+    shutil.rmtree(path)
+    print('Index "%s" removed.' % command[2])
+else:
+    sys.stderr.write("An error occurred: fake splunk does not support %s\\n" % ' '.join(command))
+    sys.exit(1)
+'''
+
+
+def random_bytes(rng, length):
+    return rng.getrandbits(length * 8).to_bytes(length, 'little') if length else b''
+
+
+def write_generated(path, rng, size, kind):
+    """Write `size` bytes of the given kind: random, journal (gzip), tsidx or bloom"""
+    if kind == 'journal':
+        # Real journals are gzipped raw events; stored gzip blocks of random data deflate just as badly
+        with gzip.open(path, 'wb', compresslevel=0) as f:
+            for offset in range(0, size, WRITE_BLOCK):
+                f.write(random_bytes(rng, min(WRITE_BLOCK, size - offset)))
+        return
+    with open(path, 'wb') as f:
+        for offset in range(0, size, WRITE_BLOCK):
+            block = random_bytes(rng, min(WRITE_BLOCK, size - offset))
+            if kind == 'tsidx':
+                block = block.translate(TSIDX_TABLE)
+            elif kind == 'bloom':
+                block = block.translate(BLOOM_TABLE)
+            f.write(block)
+
+
+def write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def make_bucket(path, rng, size, latest, earliest, bucket_id):
+    """Create one bucket folder of about `size` bytes, returns (files, bytes) written"""
+    os.makedirs(os.path.join(path, 'rawdata'))
+    files = 0
+    total = 0
+    for template, share, kind in BUCKET_LAYOUT:
+        file_path = os.path.join(path, template.format(latest=latest, earliest=earliest, id=bucket_id))
+        write_generated(file_path, rng, int(size * share), kind)
+        files += 1
+        total += os.path.getsize(file_path)
+    for name in METADATA_FILES:
+        lines = [f"{name[:-5].lower()}::source{n}\t{rng.randint(1, 100000)}\t{earliest}\t{latest}"
+                 for n in range(rng.randint(5, 50))]
+        write_text(os.path.join(path, name), '\n'.join(lines) + '\n')
+    write_text(os.path.join(path, '.rawSize'), f"{int(size * 0.55 * 8)}\n")
+    write_text(os.path.join(path, 'splunk-autogen-params.dat'), "[default]\ntsidxWritingLevel = 2\n")
+    write_text(os.path.join(path, 'optimize.result'), "")
+    for name in METADATA_FILES + ['.rawSize', 'splunk-autogen-params.dat', 'optimize.result']:
+        files += 1
+        total += os.path.getsize(os.path.join(path, name))
+    return files, total
+
+
+def make_index(splunk_db, name, hot=1, warm=4, cold=2, bucket_size=8 * 1024 ** 2, jitter=0.25,
+               empty_dirs=True, seed=0):
+    """Create var/lib/splunk/<name> and <name>.dat, returns {'name', 'buckets', 'files', 'bytes'}"""
+    rng = random.Random(f"{seed}:{name}")
+    index_path = os.path.join(splunk_db, name)
+    for folder in ('db', 'colddb', 'thaweddb'):
+        os.makedirs(os.path.join(index_path, folder), exist_ok=True)
+    if empty_dirs:
+        os.makedirs(os.path.join(index_path, 'datamodel_summary'), exist_ok=True)
+        os.makedirs(os.path.join(index_path, 'summary'), exist_ok=True)
+
+    summary = {'name': name, 'buckets': 0, 'files': 0, 'bytes': 0}
+    # Oldest buckets first: cold, then warm, then the hot ones still being written
+    layout = [('colddb', 'db', cold), ('db', 'db', warm), ('db', 'hot', hot)]
+    bucket_id = 0
+    manifest = []
+    for folder, state, count in layout:
+        for _ in range(count):
+            earliest = FIRST_EVENT_TIME + bucket_id * BUCKET_SPAN
+            latest = earliest + BUCKET_SPAN - 1
+            if state == 'hot':
+                bucket_name = f"hot_v1_{bucket_id}"
+            else:
+                bucket_name = f"db_{latest}_{earliest}_{bucket_id}"
+                manifest.append(f'"{folder}/{bucket_name}" {bucket_id} {earliest} {latest}')
+            size = max(4096, int(bucket_size * (1 + rng.uniform(-jitter, jitter))))
+            files, written = make_bucket(os.path.join(index_path, folder, bucket_name), rng, size,
+                                         latest, earliest, bucket_id)
+            summary['buckets'] += 1
+            summary['files'] += files
+            summary['bytes'] += written
+            bucket_id += 1
+
+    write_text(os.path.join(index_path, 'db', '.bucketManifest'), '\n'.join(manifest) + '\n')
+    write_text(os.path.join(index_path, 'db', 'CreationTime'), f"{FIRST_EVENT_TIME}\n")
+    write_text(os.path.join(splunk_db, f"{name}.dat"), f"{bucket_id}\n")
+    for path in (os.path.join(index_path, 'db', '.bucketManifest'), os.path.join(index_path, 'db', 'CreationTime'),
+                 os.path.join(splunk_db, f"{name}.dat")):
+        summary['files'] += 1
+        summary['bytes'] += os.path.getsize(path)
+    return summary
+
+
+def write_fake_splunk(splunk_home, username='admin', password='changeme', cli_delay=0.0):
+    """Write bin/splunk (and bin/splunk.bat on Windows), returns the path to configure as splunk_path"""
+    bin_dir = os.path.join(splunk_home, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.join(bin_dir, 'splunk')
+    write_text(script, FAKE_SPLUNK.format(
+        python=sys.executable, splunk_db=os.path.join(splunk_home, 'var', 'lib', 'splunk'),
+        auth=f"{username}:{password}", system_indexes=SYSTEM_INDEXES, cli_delay=cli_delay
+    ))
+    os.chmod(script, 0o755)
+    if os.name == 'nt':
+        batch = os.path.join(bin_dir, 'splunk.bat')
+        write_text(batch, f'@"{sys.executable}" "{script}" %*\r\n')
+        return batch
+    return script
+
+
+def generate_splunk_home(splunk_home, indexes=1, hot=1, warm=4, cold=2, bucket_size=8 * 1024 ** 2,
+                         jitter=0.25, empty_dirs=True, seed=0, username='admin', password='changeme',
+                         cli_delay=0.0):
+    """Create a synthetic SPLUNK_HOME, returns a summary of what was generated
+
+    Indexes are named bench01, bench02... Each gets `cold` buckets in colddb,
+    `warm` and `hot` ones in db, a <name>.dat file and an indexes.conf stanza.
+    Bucket sizes vary by +/- jitter around bucket_size.
+    """
+    splunk_db = os.path.join(splunk_home, 'var', 'lib', 'splunk')
+    conf_dir = os.path.join(splunk_home, 'etc', 'system', 'local')
+    os.makedirs(splunk_db, exist_ok=True)
+    os.makedirs(conf_dir, exist_ok=True)
+
+    started = time.time()
+    summary = {'splunk_home': splunk_home, 'seed': seed, 'hot': hot, 'warm': warm, 'cold': cold,
+               'bucket_size': bucket_size, 'jitter': jitter, 'indexes': []}
+    stanzas = []
+    for number in range(1, indexes + 1):
+        name = f"bench{number:02d}"
+        summary['indexes'].append(make_index(splunk_db, name, hot, warm, cold, bucket_size, jitter,
+                                             empty_dirs, seed))
+        stanzas.append(f"[{name}]\nhomePath = $SPLUNK_DB/{name}/db\ncoldPath = $SPLUNK_DB/{name}/colddb\n"
+                       f"thawedPath = $SPLUNK_DB/{name}/thaweddb\n")
+    write_text(os.path.join(conf_dir, 'indexes.conf'), '\n'.join(stanzas))
+    summary['splunk_path'] = write_fake_splunk(splunk_home, username, password, cli_delay)
+    summary['files'] = sum(index['files'] for index in summary['indexes'])
+    summary['bytes'] = sum(index['bytes'] for index in summary['indexes'])
+    summary['duration'] = time.time() - started
+    return summary
+
+
+class RecordingExporter:
+    """Keeps the metrics records of the operations being timed, then passes them on"""
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.exporter.emit(record)
+
+
+class Benchmark:
+    """Times SplunkManager operations on a generated SPLUNK_HOME"""
+
+    def __init__(self, manager, splunk_home, workdir, repeat=3, verbose=False):
+        self.manager = manager
+        self.splunk_home = splunk_home
+        self.workdir = workdir
+        self.repeat = repeat
+        self.verbose = verbose
+        self.recorder = RecordingExporter(manager.metrics)
+        manager.metrics = self.recorder
+        self.results = []
+
+    def measure(self, name, run, setup=None, operation=None, repeat=None):
+        """Time run() `repeat` times (setup() is not timed), returns and records the case result
+
+        run() may return {'bytes', 'files'} to get throughput worked out. The
+        phases of the last matching metrics record are kept with the result.
+        """
+        timings = []
+        counts = {}
+        for _ in range(repeat or self.repeat):
+            output = sys.stdout if self.verbose else open(os.devnull, 'w')
+            try:
+                with contextlib.redirect_stdout(output):
+                    if setup:
+                        setup()
+                    del self.recorder.records[:]
+                    started = time.perf_counter()
+                    counts = run() or {}
+                    timings.append(time.perf_counter() - started)
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+        result = {
+            'name': name,
+            'runs': [round(seconds, 6) for seconds in timings],
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+        }
+        result.update(counts)
+        if counts.get('bytes'):
+            result['mb_per_second'] = counts['bytes'] / result['median'] / (1024 * 1024)
+        records = [r for r in self.recorder.records if r['operation'] == operation]
+        if records:
+            result['phases'] = records[-1]['phases']
+            result['counters'] = records[-1]['counters']
+        self.results.append(result)
+        print(f"{name:<24} median {result['median']:8.3f}s  min {result['min']:8.3f}s"
+              + (f"  {result['mb_per_second']:8.1f} MB/s" if 'mb_per_second' in result else ""))
+        return result
+
+    def skip(self, name, reason):
+        self.results.append({'name': name, 'skipped': reason})
+        print(f"{name:<24} skipped: {reason}")
+
+    def forget_sizes(self):
+        """Drop the size cache and index catalog so the next call scans and asks Splunk again"""
+        self.manager.size_cache.invalidate()
+        self.manager.index_catalog = SplunkManager.IndexCatalog(self.manager.fetch_index_names,
+                                                                self.manager.describe_index)
+
+    def run_listing(self, index_name):
+        manager = self.manager
+
+        def list_all():
+            indexes = manager.list_indexes()
+            return {'indexes': len(indexes), 'files': sum(i['files'] for i in indexes),
+                    'bytes': sum(i['bytes'] for i in indexes)}
+
+        self.measure('list_indexes_cold', list_all, self.forget_sizes, 'list_indexes')
+        self.measure('list_indexes_warm', list_all, None, 'list_indexes')
+        self.measure('get_index_size_cold', lambda: {'bytes': manager.get_index_size(index_name)},
+                     self.forget_sizes)
+        self.measure('get_index_size_warm', lambda: {'bytes': manager.get_index_size(index_name)})
+
+    def run_backup_restore(self, index_name, label, password=None):
+        """backup_index then restore_backup of the archive it made, each `repeat` times"""
+        manager = self.manager
+        backup_dir = os.path.join(self.workdir, 'backups', label)
+        archives = []
+
+        def setup_backup():
+            # Every run is a full backup into an empty folder
+            shutil.rmtree(backup_dir, ignore_errors=True)
+
+        def backup():
+            success, message = manager.backup_index(index_name, backup_dir, password)
+            if not success:
+                raise RuntimeError(f"backup_index failed: {message}")
+            record = next(r for r in self.recorder.records if r['operation'] == 'backup')
+            archives[:] = [name for name in os.listdir(backup_dir)
+                           if name.endswith(('.zip', SplunkManager.ENCRYPTED_SUFFIX))]
+            return {'files': record['counters']['files'], 'bytes': record['counters']['bytes_in'],
+                    'bytes_out': record['counters']['bytes_out']}
+
+        self.measure(f'backup_index_{label}', backup, setup_backup, 'backup')
+        archive = os.path.join(backup_dir, archives[0])
+
+        def restore():
+            success, message = manager.restore_backup(archive, password=password)
+            if not success:
+                raise RuntimeError(f"restore_backup failed: {message}")
+            record = next(r for r in self.recorder.records if r['operation'] == 'restore')
+            return {'files': record['counters']['files'], 'bytes': record['counters']['bytes_in']}
+
+        self.measure(f'restore_backup_{label}', restore, None, 'restore')
+
+    def run_stream_backup_restore(self, index_name, codec):
+        """run_stream_backup into a file then restore_backup from it, with stream_codec set to `codec`"""
+        manager = self.manager
+        manager.stream_codec = codec
+        backup_dir = os.path.join(self.workdir, 'backups', f'stream_{codec}')
+        archives = []
+
+        def setup_backup():
+            shutil.rmtree(backup_dir, ignore_errors=True)
+            os.makedirs(backup_dir)
+
+        def backup():
+            result = manager.run_stream_backup(index_name, backup_dir)
+            archives[:] = [result['archive']]
+            return {'files': result['files'], 'bytes': result['bytes_in'], 'bytes_out': result['bytes_out']}
+
+        self.measure(f'stream_backup_{codec}', backup, setup_backup, 'stream_backup')
+
+        def restore():
+            success, message = manager.restore_backup(archives[0])
+            if not success:
+                raise RuntimeError(f"restore_backup failed: {message}")
+            record = next(r for r in self.recorder.records if r['operation'] == 'restore')
+            return {'files': record['counters']['files'], 'bytes': record['counters']['bytes_in']}
+
+        self.measure(f'restore_stream_{codec}', restore, None, 'restore')
+
+    def run_conf_edits(self, stanzas=50):
+        """Define, then remove, `stanzas` index sections in indexes.conf in one edit each"""
+        manager = self.manager
+        names = [f"conf_bench_{n:03d}" for n in range(stanzas)]
+        define = {name: SplunkManager.restored_index_settings(name) for name in names}
+
+        def add():
+            changes, _ = manager.edit_indexes_conf(define=define)
+            return {'stanzas': len(changes or [])}
+
+        def remove():
+            changes, _ = manager.edit_indexes_conf(remove=names)
+            return {'stanzas': len(changes or [])}
+
+        # Each define needs the stanzas gone and each remove needs them there
+        self.measure('conf_define', add, lambda: manager.edit_indexes_conf(remove=names))
+        self.measure('conf_remove', remove, lambda: manager.edit_indexes_conf(define=define))
+
+
+def start_standin(splunk_home, index_names, username, password):
+    """Run splunkd_standin.py in a thread, returns (server, management_url)"""
+    server = splunkd_standin.make_server(username=username, password=password,
+                                         splunk_db=os.path.join(splunk_home, 'var', 'lib', 'splunk'))
+    server.state.indexes.update(index_names)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def generate_args(parser):
+    parser.add_argument('--indexes', type=int, default=1, help="number of indexes (bench01, bench02...)")
+    parser.add_argument('--hot', type=int, default=1, help="hot buckets per index")
+    parser.add_argument('--warm', type=int, default=4, help="warm buckets per index")
+    parser.add_argument('--cold', type=int, default=2, help="cold buckets per index")
+    parser.add_argument('--bucket-size', type=SplunkManager.parse_size, default='8M', help="average bucket size, e.g. 512K, 16M")
+    parser.add_argument('--jitter', type=float, default=0.25, help="bucket size variation (0.25 = +/-25%%)")
+    parser.add_argument('--no-empty-dirs', dest='empty_dirs', action='store_false',
+                        help="leave out the empty datamodel_summary/summary folders")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cli-delay', type=float, default=0.0,
+                        help="seconds the fake splunk CLI sleeps per call, like a real CLI's start-up")
+
+
+def generate_from_args(splunk_home, args):
+    return generate_splunk_home(splunk_home, args.indexes, args.hot, args.warm, args.cold, args.bucket_size,
+                                args.jitter, args.empty_dirs, args.seed, cli_delay=args.cli_delay)
+
+
+def run_benchmarks(args):
+    """Generate (or reuse) a SPLUNK_HOME, run every benchmark and write the JSON results"""
+
+    workdir = tempfile.mkdtemp(prefix='splunk_bench_')
+    original_cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    server = None
+    try:
+        if args.home:
+            splunk_home = os.path.abspath(args.home)
+            with open(os.path.join(splunk_home, 'benchmark.json'), 'r', encoding='utf-8') as f:
+                dataset = json.load(f)
+        else:
+            splunk_home = os.path.join(workdir, 'splunk_home')
+            print(f"Generating SPLUNK_HOME in {splunk_home}...")
+            dataset = generate_from_args(splunk_home, args)
+        index_names = [index['name'] for index in dataset['indexes']]
+        print(f"{len(index_names)} indexes, {dataset['files']} files, {dataset['bytes'] / 1024 ** 2:.1f} MB")
+
+        config = {'splunk_path': dataset['splunk_path'], 'username': 'admin', 'password': 'changeme',
+                  'compression_workers': args.workers,
+                  'metrics_file': os.path.join(workdir, 'metrics.jsonl')}
+        if args.api == 'rest':
+            server, config['management_url'] = start_standin(splunk_home, index_names, 'admin', 'changeme')
+        # config.txt, the size cache and the session cache are all read from the working directory
+        os.chdir(workdir)
+        with open(SplunkManager.CONFIG_FILE, 'w') as f:
+            json.dump(config, f)
+        manager = SplunkManager.SplunkManager(interactive=False)
+        manager.animate = False
+        if args.api == 'cli':
+            manager.use_rest = False
+
+        bench = Benchmark(manager, splunk_home, workdir, args.repeat, args.verbose)
+        # The largest index is the one backed up and restored
+        largest = max(dataset['indexes'], key=lambda index: index['bytes'])['name']
+        bench.run_listing(largest)
+        bench.run_backup_restore(largest, 'plain')
+        if SplunkManager.load_aesgcm():
+            bench.run_backup_restore(largest, 'aes_gcm', password='benchmark')
+        else:
+            bench.skip('backup_index_aes_gcm', "cryptography not installed")
+            bench.skip('restore_backup_aes_gcm', "cryptography not installed")
+        try:
+            import pyzipper  # noqa: F401
+            manager.encryption_mode = 'zip'
+            bench.run_backup_restore(largest, 'aes_zip', password='benchmark')
+            manager.encryption_mode = 'stream'
+        except ImportError:
+            bench.skip('backup_index_aes_zip', "pyzipper not installed")
+            bench.skip('restore_backup_aes_zip', "pyzipper not installed")
+        for codec in ('zstd', 'gzip'):
+            if codec == 'zstd' and not SplunkManager.load_zstandard():
+                bench.skip('stream_backup_zstd', "zstandard not installed")
+                bench.skip('restore_stream_zstd', "zstandard not installed")
+                continue
+            bench.run_stream_backup_restore(largest, codec)
+        manager.stream_codec = 'zstd'
+        bench.run_conf_edits(args.stanzas)
+
+        results = {
+            'format': 1,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'options': {'api': args.api, 'workers': args.workers, 'repeat': args.repeat},
+            'dataset': {key: value for key, value in dataset.items() if key not in ('splunk_home', 'splunk_path')},
+            'results': bench.results
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+    finally:
+        os.chdir(original_cwd)
+        if server:
+            server.shutdown()
+            server.server_close()
+        if args.keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_results(before_path, after_path):
+    """Print the median time of every case in two result files side by side"""
+    with open(before_path, 'r', encoding='utf-8') as f:
+        before = {result['name']: result for result in json.load(f)['results']}
+    with open(after_path, 'r', encoding='utf-8') as f:
+        after = json.load(f)['results']
+    print(f"{'Case':<24} {'Before':>10} {'After':>10} {'Change':>8}")
+    for result in after:
+        old = before.get(result['name'])
+        if 'median' not in result or not old or 'median' not in old:
+            print(f"{result['name']:<24} {'-':>10} {'-':>10} {'-':>8}")
+            continue
+        change = (result['median'] - old['median']) / old['median'] if old['median'] else 0.0
+        print(f"{result['name']:<24} {old['median']:>9.3f}s {result['median']:>9.3f}s {change:>+8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for SplunkManager on a synthetic SPLUNK_HOME")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="create a synthetic SPLUNK_HOME")
+    generate.add_argument('splunk_home')
+    generate_args(generate)
+
+    run = commands.add_parser('run', help="run the benchmarks and save JSON results")
+    run.add_argument('--home', help="SPLUNK_HOME made by 'generate' (default: generate a temporary one)")
+    generate_args(run)
+    run.add_argument('--api', choices=['rest', 'cli'], default='rest',
+                     help="talk to the splunkd stand-in or to the fake splunk CLI")
+    run.add_argument('--workers', type=int, default=0, help="compression workers (0 = all cores)")
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--stanzas', type=int, default=50, help="indexes.conf stanzas per conf edit")
+    run.add_argument('--output', default='benchmark_results.json')
+    run.add_argument('--keep', action='store_true', help="keep the working directory")
+    run.add_argument('--verbose', action='store_true', help="show SplunkManager's output")
+
+    compare = commands.add_parser('compare', help="compare two result files")
+    compare.add_argument('before')
+    compare.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        summary = generate_from_args(os.path.abspath(args.splunk_home), args)
+        with open(os.path.join(summary['splunk_home'], 'benchmark.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Generated {len(summary['indexes'])} indexes, {summary['files']} files, "
+              f"{summary['bytes'] / 1024 ** 2:.1f} MB in {summary['duration']:.1f}s")
+        print(f"splunk_path: {summary['splunk_path']}")
+    elif args.command == 'run':
+        run_benchmarks(args)
+    else:
+        compare_results(args.before, args.after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6391 @@
+import os
+import sys
+import re
+import json
+import subprocess
+import getpass
+import time
+import zipfile
+import tarfile
+import gzip
+import stat
+import zlib
+import struct
+import hashlib
+import base64
+import random
+import shutil
+import tempfile
+import platform
+import fnmatch
+import socket
+import sqlite3
+import argparse
+import contextlib
+import io
+import functools
+import itertools
+import inspect
+from urllib.parse import urlencode, urlsplit, quote
+from threading import Thread, Lock, Event, Semaphore, local
+from queue import Queue, Empty, Full
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed
+
+# Initialize colorama on Windows
+if platform.system() == 'Windows':
+    import colorama
+    colorama.init()
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+#  Splunk Index Manager v0.4
+#  Developed by Jacob Wilson • dfirvault@gmail.com
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+# Color and symbol constants
+class Style:
+    HEADER = "━" * 60
+    SUCCESS = "✓"
+    ERROR = "✗"
+    WARNING = "⚠"
+    INFO = "ℹ"
+    PROMPT = "➤"
+    DIVIDER = "─" * 60
+    BLUE = "\033[94m"
+    GREEN = "\033[92m"
+    YELLOW = "\033[93m"
+    RED = "\033[91m"
+    BOLD = "\033[1m"
+    END = "\033[0m"
+
+# Print formatted header
+def print_header():
+    print(f"\n{Style.BLUE}{Style.HEADER}{Style.END}")
+    print(f"{Style.BOLD}{Style.BLUE}  Splunk Index Manager {Style.END}v0.4")
+    print(f"  {Style.BLUE}Developed by Jacob Wilson • dfirvault@gmail.com{Style.END}")
+    print(f"{Style.BLUE}{Style.HEADER}{Style.END}\n")
+
+CONFIG_FILE = "config.txt"
+SIZE_CACHE_FILE = os.path.join(os.path.dirname(CONFIG_FILE), "size_cache.json")
+SESSION_FILE = os.path.join(os.path.dirname(CONFIG_FILE), "session.json")
+JOBS_DB = os.path.join(os.path.dirname(CONFIG_FILE), "jobs.db")
+METRICS_FILE = os.path.join(os.path.dirname(CONFIG_FILE), "metrics.jsonl")
+# metrics.jsonl is rotated to .1, .2, ... once it reaches this size
+METRICS_MAX_SIZE = 16 * 1024 * 1024
+METRICS_KEEP = 3
+# splunkd drops idle sessions after an hour by default (sessionTimeout in server.conf)
+SESSION_TTL = 3600
+DEFAULT_SPLUNK_PATHS = [
+    "/opt/splunk/bin/splunk",
+    "C:\\Program Files\\Splunk\\bin\\splunk.exe",
+    "/Applications/Splunk/bin/splunk"
+]
+
+DEFAULT_MANAGEMENT_URL = "https://127.0.0.1:8089"
+
+def parse_size(text):
+    """'512K', '16M', '4G' or a plain number of bytes"""
+    text = str(text).strip().upper()
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+class ConfigError(Exception):
+    """Raised when running headless without a usable config.txt"""
+
+# Skip spinners and bars when output isn't a terminal or SPLUNK_MANAGER_NO_ANIMATION is set
+ANIMATE_PROGRESS = sys.stdout.isatty() and not os.environ.get('SPLUNK_MANAGER_NO_ANIMATION')
+
+# Splunk bucket directories (hot, warm/cold and replicated) start with these prefixes
+BUCKET_PREFIXES = ('hot_', 'db_', 'rb_')
+
+# Size scans are I/O bound, so use more threads than cores
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def scan_tree(path):
+    """Return (total_bytes, file_count) for a directory tree, statting each file once"""
+    total_size = 0
+    file_count = 0
+    pending = [path]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file():
+                            total_size += entry.stat().st_size
+                            file_count += 1
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total_size, file_count
+
+class ProgressIndicator:
+    """Spinner or progress bar drawn on a background thread while an operation runs
+
+    The operation starts and stops it (or uses it as a context manager) and
+    reports progress with update(), so it never adds time of its own. Without
+    animation the message is printed once and updates are silent.
+    """
+    SPINNER = ['⣾','⣽','⣻','⢿','⡿','⣟','⣯','⣷']
+    BAR_WIDTH = 50
+
+    def __init__(self, message, total=None, animate=None, interval=0.1, unit=None):
+        self.message = message
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.detail = ""
+        self.animate = ANIMATE_PROGRESS if animate is None else animate
+        self.interval = interval
+        self.stopped = Event()
+        self.thread = None
+        self.frame = 0
+        self.width = 0
+        self.lock = Lock()
+
+    def start(self):
+        if not self.animate:
+            print(f"{Style.BLUE}•{Style.END} {self.message}")
+            return self
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def update(self, done=None, total=None, advance=0, detail=None, add_total=0):
+        """Record progress, the drawing thread picks it up on its next frame"""
+        with self.lock:
+            if total is not None:
+                self.total = total
+            if add_total:
+                self.total = (self.total or 0) + add_total
+            if done is not None:
+                self.done = done
+            self.done += advance
+            if detail is not None:
+                self.detail = detail
+
+    def _render(self):
+        with self.lock:
+            done, total, detail = self.done, self.total, self.detail
+        if total:
+            filled = min(self.BAR_WIDTH, int(self.BAR_WIDTH * done / total))
+            if self.unit == 'bytes':
+                counts = f"{done / (1024 * 1024):.1f}/{total / (1024 * 1024):.1f}MB"
+            else:
+                counts = f"{done}/{total}"
+            line = (f"[{Style.GREEN}{'█' * filled}{' ' * (self.BAR_WIDTH - filled)}{Style.END}] "
+                    f"{counts} {detail}")
+        else:
+            spinner = self.SPINNER[self.frame % len(self.SPINNER)]
+            line = f"{Style.BLUE}{spinner}{Style.END} {self.message} {detail}"
+        self.frame += 1
+        # Pad with spaces to wipe a longer previous frame
+        padding = max(0, self.width - len(line))
+        self.width = len(line)
+        print("\r" + line + " " * padding, end="", flush=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._render()
+
+    def stop(self):
+        """Stop drawing and clear the progress line"""
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        print("\r" + " " * self.width + "\r", end="", flush=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+class Metrics:
+    """Phase timings and counters of one operation (a backup, a restore, a REST call...)
+
+    Phases add up wall-clock seconds, so work done on several threads can sum
+    to more than the duration. While bound to a thread (see bound()), timed
+    calls deeper in the code (REST, CLI) are attributed to it via note().
+    """
+    thread_state = local()
+
+    def __init__(self, operation, **labels):
+        self.operation = operation
+        self.labels = {key: str(value) for key, value in labels.items() if value is not None}
+        self.started = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.success = True
+        self.lock = Lock()
+        self.last_lap = time.perf_counter()
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    def lap(self, name):
+        """Add the time since the previous lap (or the start) to a phase"""
+        now = time.perf_counter()
+        self.add_phase(name, now - self.last_lap)
+        self.last_lap = now
+
+    def count(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def bound(self):
+        """Attribute note() calls made on this thread to these metrics"""
+        previous = getattr(self.thread_state, 'metrics', None)
+        self.thread_state.metrics = self
+        try:
+            yield self
+        finally:
+            self.thread_state.metrics = previous
+
+    @classmethod
+    def current(cls):
+        """The metrics bound to this thread, or None"""
+        return getattr(cls.thread_state, 'metrics', None)
+
+    @classmethod
+    def note(cls, phase, seconds):
+        """Add one call's seconds to a phase of the bound metrics and count it as <phase>_calls"""
+        metrics = cls.current()
+        if metrics is not None:
+            metrics.add_phase(phase, seconds)
+            metrics.count(**{f'{phase}_calls': 1})
+
+    @classmethod
+    @contextlib.contextmanager
+    def timed(cls, phase):
+        """Time a block as one note(phase) call"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.note(phase, time.perf_counter() - started)
+
+    def record(self):
+        """The finished operation as a JSON-serialisable dict, with rates worked out"""
+        duration = time.time() - self.started
+        with self.lock:
+            counters = dict(self.counters)
+            phases = {name: round(seconds, 6) for name, seconds in self.phases.items()}
+        record = {
+            'operation': self.operation, 'labels': self.labels, 'success': self.success,
+            'started': self.started, 'duration': round(duration, 6), 'phases': phases, 'counters': counters
+        }
+        if duration > 0:
+            if 'files' in counters:
+                record['files_per_second'] = counters['files'] / duration
+            if 'bytes_in' in counters:
+                record['mb_per_second'] = counters['bytes_in'] / duration / (1024 * 1024)
+        if counters.get('bytes_in') and 'bytes_out' in counters:
+            record['ratio'] = counters['bytes_out'] / counters['bytes_in']
+        return record
+
+def prometheus_labels(labels):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items())) + '}'
+
+class MetricsExporter:
+    """Writes operation records as JSON lines and, optionally, a Prometheus textfile
+
+    The textfile (for node_exporter's textfile collector) holds the latest
+    record per operation and labels; that state is kept in <textfile>.json so
+    it survives between runs. Both files are replaced atomically. The JSON
+    lines file is rotated once it reaches max_size (0 = never), keeping
+    METRICS_KEEP older files.
+    """
+    PREFIX = 'splunk_manager'
+    GAUGES = [
+        ('last_run_timestamp_seconds', "Start time of the last run", lambda r: r['started']),
+        ('success', "1 if the last run succeeded", lambda r: int(r['success'])),
+        ('duration_seconds', "Duration of the last run", lambda r: r['duration']),
+        ('bytes_in', "Bytes read by the last run", lambda r: r['counters'].get('bytes_in')),
+        ('bytes_out', "Bytes written by the last run", lambda r: r['counters'].get('bytes_out')),
+        ('files', "Files handled by the last run", lambda r: r['counters'].get('files')),
+        ('files_per_second', "Files per second of the last run", lambda r: r.get('files_per_second')),
+        ('throughput_bytes_per_second', "Input bytes per second of the last run",
+         lambda r: r['mb_per_second'] * 1024 * 1024 if 'mb_per_second' in r else None),
+        ('compression_ratio', "Output/input bytes of the last run", lambda r: r.get('ratio')),
+    ]
+
+    def __init__(self, path=METRICS_FILE, textfile=None, max_size=METRICS_MAX_SIZE):
+        self.path = path
+        self.textfile = textfile
+        self.max_size = max_size
+        self.lock = Lock()
+
+    def rotate(self):
+        """Shift metrics.jsonl to .1 (and .1 to .2, ...) once it is too big"""
+        try:
+            if not self.max_size or os.path.getsize(self.path) < self.max_size:
+                return
+        except OSError:
+            return
+        for number in range(METRICS_KEEP - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{number}"):
+                os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def emit(self, record):
+        with self.lock:
+            try:
+                if self.path:
+                    self.rotate()
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, default=str) + '\n')
+                if self.textfile:
+                    self.write_textfile(record)
+            except OSError:
+                pass
+
+    def write_textfile(self, record):
+        state_path = self.textfile + '.json'
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                latest = json.load(f)
+        except (OSError, ValueError):
+            latest = {}
+        labels = dict(record['labels'], operation=record['operation'])
+        latest[prometheus_labels(labels)] = record
+        write_atomic(state_path, json.dumps(latest, default=str))
+
+        lines = []
+        for name, help_text, value_of in self.GAUGES:
+            lines.append(f"# HELP {self.PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {self.PREFIX}_{name} gauge")
+            for key, entry in sorted(latest.items()):
+                value = value_of(entry)
+                if value is not None:
+                    lines.append(f"{self.PREFIX}_{name}{key} {value}")
+        lines.append(f"# HELP {self.PREFIX}_phase_seconds Seconds spent per phase in the last run")
+        lines.append(f"# TYPE {self.PREFIX}_phase_seconds gauge")
+        for _, entry in sorted(latest.items()):
+            for phase, seconds in sorted(entry['phases'].items()):
+                labels = dict(entry['labels'], operation=entry['operation'], phase=phase)
+                lines.append(f"{self.PREFIX}_phase_seconds{prometheus_labels(labels)} {seconds}")
+        write_atomic(self.textfile, '\n'.join(lines) + '\n')
+
+def instrumented(operation, labels=None, succeeded=None):
+    """Decorator timing a SplunkManager method as an operation exported through self.metrics
+
+    labels(arguments) turns the call's arguments (by name, defaults applied)
+    into the record's labels and succeeded(result) tells whether a returned
+    result is a success; an exception never is. The method can reach its
+    Metrics with Metrics.current() to add phases and counters.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            metrics = Metrics(operation, **(labels(arguments.arguments) if labels else {}))
+            try:
+                with metrics.bound():
+                    result = method(self, *args, **kwargs)
+                if succeeded and not succeeded(result):
+                    metrics.success = False
+                return result
+            except BaseException:
+                metrics.success = False
+                raise
+            finally:
+                self.metrics.emit(metrics.record())
+        return wrapper
+    return decorate
+
+def write_atomic(path, text):
+    """Replace a file's contents via a temp file and rename
+
+    The temp file gets a unique name, so processes writing the same file
+    at once don't clobber each other's half-written copy.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        # mkstemp makes the file private, node_exporter has to be able to read the textfile
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+class SplunkRestError(Exception):
+    """Error from the splunkd management API (status is None when splunkd is unreachable)"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class SessionCache:
+    """Session keys kept on disk between runs, so each start doesn't log in again
+
+    The file is only readable by the current user. Keys are stored per user
+    and management URL with an expiry; a key splunkd rejects is dropped.
+    """
+
+    def __init__(self, path=SESSION_FILE, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = Lock()
+
+    @staticmethod
+    def cache_key(base_url, username):
+        return f"{username}@{base_url}"
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                sessions = json.load(f).get('sessions', {})
+            return sessions if isinstance(sessions, dict) else {}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _write(self, sessions):
+        temp_path = self.path + '.tmp'
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'sessions': sessions}, f)
+            os.replace(temp_path, self.path)
+            os.chmod(self.path, 0o600)
+        except OSError:
+            pass
+
+    def get(self, base_url, username):
+        """Return a cached session key that hasn't expired, or None"""
+        entry = self._read().get(self.cache_key(base_url, username))
+        if not entry or entry.get('expires', 0) <= time.time():
+            return None
+        return entry.get('session_key')
+
+    def put(self, base_url, username, session_key):
+        with self.lock:
+            sessions = {key: entry for key, entry in self._read().items()
+                        if entry.get('expires', 0) > time.time()}
+            sessions[self.cache_key(base_url, username)] = {
+                'session_key': session_key,
+                'expires': time.time() + self.ttl
+            }
+            self._write(sessions)
+
+    def discard(self, base_url, username, session_key=None):
+        """Forget the cached key (only if it is still session_key, when given)"""
+        with self.lock:
+            sessions = self._read()
+            key = self.cache_key(base_url, username)
+            entry = sessions.get(key)
+            if entry and (session_key is None or entry.get('session_key') == session_key):
+                del sessions[key]
+                self._write(sessions)
+
+class SplunkRestClient:
+    """Client for the splunkd management REST API
+
+    Keeps a small pool of keep-alive connections and authenticates once with a
+    session key instead of starting a `splunk` CLI process per operation. With
+    a session_cache the key is reused across runs until it expires or splunkd
+    answers 401.
+    """
+
+    def __init__(self, base_url, username, password, pool_size=4, timeout=30, session_cache=None):
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 8089
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session_cache = session_cache
+        self.session_key = session_cache.get(base_url, username) if session_cache else None
+        self.auth_lock = Lock()
+        self.pool = Queue(maxsize=pool_size)
+
+        # splunkd ships with a self-signed certificate, same as SPLUNK_CLI_SERVER_CERT_VERIFY=0.
+        # ssl and http.client are only loaded once a client is made, --help and offline commands start faster
+        import ssl
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+
+    def _connect(self):
+        import http.client
+        if self.scheme == 'http':
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPSConnection(
+            self.host, self.port, timeout=self.timeout, context=self.ssl_context
+        )
+
+    def _acquire(self):
+        try:
+            return self.pool.get_nowait()
+        except Empty:
+            return self._connect()
+
+    def _release(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def _send(self, method, path, params=None, headers=None):
+        """Send one request over a pooled connection, returns (status, body)"""
+        query = {'output_mode': 'json'}
+        body = None
+        if method in ('POST', 'PUT'):
+            body = urlencode({**query, **(params or {})})
+        else:
+            query.update(params or {})
+        url = f"{path}?{urlencode(query)}" if body is None else path
+        headers = dict(headers or {})
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        import http.client
+        # A pooled connection may have been closed by splunkd, so retry once on a fresh one
+        for attempt in range(2):
+            conn = self._acquire() if attempt == 0 else self._connect()
+            try:
+                with Metrics.timed('rest'):
+                    conn.request(method, url, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if attempt == 0:
+                    continue
+                raise SplunkRestError(f"Could not reach splunkd at {self.host}:{self.port}: {e}")
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, data
+
+    @staticmethod
+    def _parse(data):
+        try:
+            return json.loads(data.decode('utf-8')) if data else {}
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def _error_text(payload, status):
+        messages = payload.get('messages') or []
+        text = '; '.join(m.get('text', '') for m in messages if m.get('text'))
+        return text or f"HTTP {status}"
+
+    def login(self):
+        """Authenticate and store a session key"""
+        status, data = self._send('POST', '/services/auth/login', {
+            'username': self.username,
+            'password': self.password
+        })
+        payload = self._parse(data)
+        if status != 200 or 'sessionKey' not in payload:
+            raise SplunkRestError(f"Login failed: {self._error_text(payload, status)}", status)
+        self.session_key = payload['sessionKey']
+        if self.session_cache:
+            self.session_cache.put(self.base_url, self.username, self.session_key)
+        return self.session_key
+
+    def request(self, method, path, params=None):
+        """Send an authenticated request, logging in again once if the session expired"""
+        for attempt in range(2):
+            with self.auth_lock:
+                if not self.session_key:
+                    self.login()
+                session_key = self.session_key
+            status, data = self._send(method, path, params, {
+                'Authorization': f'Splunk {session_key}'
+            })
+            if status == 401 and attempt == 0:
+                with self.auth_lock:
+                    if self.session_key == session_key:
+                        self.session_key = None
+                        if self.session_cache:
+                            self.session_cache.discard(self.base_url, self.username, session_key)
+                continue
+            payload = self._parse(data)
+            if status >= 400:
+                raise SplunkRestError(self._error_text(payload, status), status)
+            return status, payload
+
+    def server_info(self):
+        """Return the server info entry, checking that the credentials work"""
+        _, payload = self.request('GET', '/services/server/info')
+        entries = payload.get('entry') or [{}]
+        return entries[0].get('content', {})
+
+    def list_indexes(self):
+        """Return the names of all indexes, metric indexes included"""
+        # Without datatype=all splunkd only lists event indexes
+        _, payload = self.request('GET', '/services/data/indexes', {'count': 0, 'datatype': 'all'})
+        return [entry['name'] for entry in payload.get('entry', [])]
+
+    def create_index(self, index_name):
+        """Create an index, returns False if it already existed"""
+        try:
+            self.request('POST', '/services/data/indexes', {'name': index_name})
+        except SplunkRestError as e:
+            if e.status == 409 or 'already exists' in str(e).lower():
+                return False
+            raise
+        return True
+
+    def remove_index(self, index_name):
+        """Remove an index"""
+        self.request('DELETE', f"/services/data/indexes/{quote(index_name, safe='')}")
+        return True
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+class IndexSizeCache:
+    """On-disk cache of bucket sizes keyed on the bucket directory state
+
+    Warm and cold buckets never change once rolled, so a bucket whose directory
+    (and rawdata directory) still has the same inode and mtime keeps its size.
+    Hot buckets are always walked again.
+    """
+
+    def __init__(self, path=SIZE_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.lock = Lock()
+        self.load()
+
+    def load(self):
+        """Load cached bucket sizes, starting empty if the file is missing or corrupted"""
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f).get('buckets', {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def save(self):
+        """Write the cache back to disk if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {'buckets': dict(self.entries)}
+            self.dirty = False
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def bucket_state(bucket_path):
+        """Return the inode/mtime fingerprint of a bucket directory"""
+        st = os.stat(bucket_path)
+        state = [st.st_ino, st.st_mtime_ns]
+        try:
+            rawdata = os.stat(os.path.join(bucket_path, 'rawdata'))
+            state += [rawdata.st_ino, rawdata.st_mtime_ns]
+        except OSError:
+            pass
+        return state
+
+    def scan_bucket(self, bucket_path):
+        """Return (total_bytes, file_count) for a bucket, walking it only if it changed"""
+        if os.path.basename(bucket_path).startswith('hot_'):
+            with self.lock:
+                self.misses += 1
+            return scan_tree(bucket_path)
+
+        try:
+            state = self.bucket_state(bucket_path)
+        except OSError:
+            return 0, 0
+
+        with self.lock:
+            entry = self.entries.get(bucket_path)
+            if entry and entry['state'] == state:
+                self.hits += 1
+                return entry['bytes'], entry['files']
+            self.misses += 1
+
+        size, count = scan_tree(bucket_path)
+        with self.lock:
+            self.entries[bucket_path] = {'state': state, 'bytes': size, 'files': count}
+            self.dirty = True
+        return size, count
+
+    def record(self, bucket_path, size, count):
+        """Store a bucket size measured elsewhere (e.g. by a backup scan)"""
+        if os.path.basename(bucket_path).startswith('hot_'):
+            return
+        try:
+            state = self.bucket_state(bucket_path)
+        except OSError:
+            return
+        with self.lock:
+            self.entries[bucket_path] = {'state': state, 'bytes': size, 'files': count}
+            self.dirty = True
+
+    def prune(self, index_path, live_buckets):
+        """Forget buckets under index_path that no longer exist"""
+        prefix = os.path.join(index_path, '')
+        live = set(live_buckets)
+        with self.lock:
+            stale = [path for path in self.entries
+                     if path.startswith(prefix) and path not in live]
+            for path in stale:
+                del self.entries[path]
+            if stale:
+                self.dirty = True
+
+    def invalidate(self, index_path=None):
+        """Drop cached sizes for one index folder (or everything), returns entries removed"""
+        with self.lock:
+            if index_path is None:
+                removed = len(self.entries)
+                self.entries = {}
+            else:
+                prefix = os.path.join(index_path, '')
+                stale = [path for path in self.entries if path.startswith(prefix)]
+                for path in stale:
+                    del self.entries[path]
+                removed = len(stale)
+            self.dirty = True
+        self.save()
+        return removed
+
+    def stats(self):
+        """Return hit/miss counters for this session and the number of cached buckets"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+def list_scan_units(index_path):
+    """Split an index folder into bucket folders, other folders and loose files
+
+    Returns (buckets, folders, loose_bytes, loose_files) so buckets and folders
+    can be scanned independently.
+    """
+    buckets = []
+    folders = []
+    loose_bytes = 0
+    loose_files = 0
+    try:
+        with os.scandir(index_path) as entries:
+            children = list(entries)
+    except OSError:
+        return buckets, folders, loose_bytes, loose_files
+
+    for child in children:
+        try:
+            if child.is_file():
+                loose_bytes += child.stat().st_size
+                loose_files += 1
+                continue
+            if not child.is_dir(follow_symlinks=False):
+                continue
+            # db/, colddb/, thaweddb/ hold the buckets one level down
+            with os.scandir(child.path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name.startswith(BUCKET_PREFIXES):
+                            buckets.append(entry.path)
+                        else:
+                            folders.append(entry.path)
+                    elif entry.is_file():
+                        loose_bytes += entry.stat().st_size
+                        loose_files += 1
+        except OSError:
+            continue
+    return buckets, folders, loose_bytes, loose_files
+
+class ConfStanza:
+    """One [stanza] of a .conf file, keeping its original lines"""
+
+    def __init__(self, name, header, leading=None):
+        self.name = name
+        self.header = header
+        # Comment lines right above the header go with the stanza
+        self.leading = leading or []
+        # Each item is (key or None, [raw lines]); comments and blanks have no key
+        self.items = []
+
+    def keys(self):
+        return [key for key, _ in self.items if key is not None]
+
+    def get(self, key, default=None):
+        for item_key, lines in self.items:
+            if item_key == key:
+                return ConfFile.value_of(lines)
+        return default
+
+    def set(self, key, value):
+        """Replace a key's line(s) in place, or add it after the last setting"""
+        line = f"{key} = {value}\n"
+        for position, (item_key, lines) in enumerate(self.items):
+            if item_key == key:
+                if ConfFile.value_of(lines) == str(value):
+                    return False
+                self.items[position] = (key, [line])
+                return True
+        last = max((n for n, (item_key, _) in enumerate(self.items) if item_key is not None), default=-1)
+        self.items.insert(last + 1, (key, [line]))
+        return True
+
+    def lines(self):
+        yield from self.leading
+        if self.header is not None:
+            yield self.header
+        for _, lines in self.items:
+            yield from lines
+
+class ConfFile:
+    """A Splunk .conf file parsed into stanzas, written back with comments and layout kept
+
+    Edits are made in memory; save() writes the file once, atomically.
+    """
+
+    def __init__(self, path, text=''):
+        self.path = path
+        self.dirty = False
+        # Settings before the first [stanza] header belong to [default]
+        self.stanzas = [ConfStanza(None, None)]
+        self.parse(text)
+
+    @classmethod
+    def load(cls, path):
+        """Parse a .conf file, an empty model if it doesn't exist"""
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                return cls(path, f.read())
+        except FileNotFoundError:
+            return cls(path)
+
+    def parse(self, text):
+        stanza = self.stanzas[-1]
+        continuing = None
+        for line in text.splitlines(keepends=True):
+            if continuing is not None:
+                # A value ending in a backslash carries on to the next line
+                continuing.append(line)
+                if not line.rstrip('\r\n').endswith('\\'):
+                    continuing = None
+                continue
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                leading = []
+                while stanza.items and stanza.items[-1][0] is None and \
+                        stanza.items[-1][1][0].lstrip().startswith('#'):
+                    leading.insert(0, stanza.items.pop()[1][0])
+                stanza = ConfStanza(stripped[1:-1].strip(), line, leading)
+                self.stanzas.append(stanza)
+            elif stripped and not stripped.startswith('#') and '=' in stripped:
+                lines = [line]
+                stanza.items.append((stripped.split('=', 1)[0].strip(), lines))
+                if stripped.endswith('\\'):
+                    continuing = lines
+            else:
+                stanza.items.append((None, [line]))
+
+    @staticmethod
+    def value_of(lines):
+        value = ''.join(lines).split('=', 1)[1]
+        return value.replace('\\\n', '\n').strip()
+
+    def find(self, name):
+        for stanza in self.stanzas[1:]:
+            if stanza.name == name:
+                return stanza
+        return None
+
+    def names(self):
+        return [stanza.name for stanza in self.stanzas[1:]]
+
+    def set_stanza(self, name, settings):
+        """Set keys of a stanza, adding the stanza at the end if it's new"""
+        stanza = self.find(name)
+        if stanza is None:
+            # Separate it from the previous stanza by one blank line
+            text = self.render()
+            if text and not text.endswith('\n'):
+                self.stanzas[-1].items.append((None, ['\n']))
+            if text.strip() and not text.endswith('\n\n'):
+                self.stanzas[-1].items.append((None, ['\n']))
+            stanza = ConfStanza(name, f"[{name}]\n")
+            self.stanzas.append(stanza)
+            self.dirty = True
+        for key, value in settings.items():
+            if stanza.set(key, value):
+                self.dirty = True
+        return stanza
+
+    def remove_stanza(self, name):
+        """Drop a stanza with its settings and comments, returns False if it wasn't there"""
+        stanza = self.find(name)
+        if stanza is None:
+            return False
+        self.stanzas.remove(stanza)
+        self.dirty = True
+        return True
+
+    def render(self):
+        return ''.join(line for stanza in self.stanzas for line in stanza.lines())
+
+    def save(self):
+        """Write the file if it changed, via a temp file and rename so it's never half written"""
+        if not self.dirty:
+            return False
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(self.render())
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(self.path):
+            shutil.copymode(self.path, temp_path)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+        return True
+
+def is_default_conf(path):
+    """True for the indexes.conf files Splunk ships in a default/ folder, which are never edited"""
+    return os.path.basename(os.path.dirname(os.path.abspath(path))) == 'default'
+
+class IndexesConfEdit:
+    """A batch of index stanza edits across the candidate indexes.conf files
+
+    Each file is parsed once, every edit is applied in memory and commit()
+    writes each changed file once. Files in default/ folders are only read:
+    new stanzas go to the first local file that exists (or default_path),
+    removals apply to every local file holding the stanza.
+    """
+
+    def __init__(self, locations, default_path=None):
+        self.locations = locations
+        self.default_path = default_path
+        self.files = {}
+        self.changes = []
+
+    def file(self, path):
+        if path not in self.files:
+            self.files[path] = ConfFile.load(path)
+        return self.files[path]
+
+    def existing(self):
+        return [self.file(path) for path in self.locations if os.path.exists(path)]
+
+    def writable(self):
+        """Existing files that may be edited: local ones, or the one the user picked"""
+        return [conf for conf in self.existing()
+                if not is_default_conf(conf.path) or conf.path == self.default_path]
+
+    def define(self, index_name, settings):
+        """Add or update an index stanza, returns the file it is in or None"""
+        holders = [conf for conf in self.writable() if conf.find(index_name)]
+        target = holders[0] if holders else next(iter(self.writable()), None)
+        if target is None:
+            if not self.default_path:
+                return None
+            target = self.file(self.default_path)
+        target.set_stanza(index_name, settings)
+        self.changes.append(('define', index_name, target.path))
+        return target.path
+
+    def remove(self, index_name):
+        """Remove an index stanza from every local file, returns the files it was removed from"""
+        removed = [conf.path for conf in self.writable() if conf.remove_stanza(index_name)]
+        for path in removed:
+            self.changes.append(('remove', index_name, path))
+        return removed
+
+    def paths(self, index_name):
+        """homePath/coldPath/thawedPath of an index, or None if no file defines it"""
+        for conf in self.existing():
+            stanza = conf.find(index_name)
+            if stanza is not None:
+                return conf.path, {key: stanza.get(key) for key in INDEX_PATH_KEYS if stanza.get(key) is not None}
+        return None
+
+    def commit(self):
+        """Write every changed file once, returns the paths written"""
+        written = []
+        for path, conf in self.files.items():
+            if conf.dirty:
+                folder = os.path.dirname(path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                conf.save()
+                written.append(path)
+        return written
+
+INDEX_PATH_KEYS = ('homePath', 'coldPath', 'thawedPath')
+
+def restored_index_settings(index_name):
+    """indexes.conf settings written for a restored index"""
+    return {
+        'coldPath': f"$SPLUNK_DB\\{index_name}\\colddb",
+        'enableDataIntegrityControl': 0,
+        'enableTsidxReduction': 0,
+        'homePath': f"$SPLUNK_DB\\{index_name}\\db",
+        'maxTotalDataSizeMB': 512000,
+        'thawedPath': f"$SPLUNK_DB\\{index_name}\\thaweddb"
+    }
+
+# How long the list of index names from Splunk is trusted before asking again
+INDEX_CATALOG_TTL = 300
+
+class IndexCatalog:
+    """Index names from Splunk kept in memory, with per-index details filled in lazily
+
+    fetch_names() is called at most once per ttl seconds; existence checks are
+    set lookups. describe(name) is only called the first time an index's
+    details (indexes.conf paths, size, buckets) are asked for. Creates,
+    deletes and restores update the catalog in place instead of refetching.
+    """
+
+    def __init__(self, fetch_names, describe, ttl=INDEX_CATALOG_TTL):
+        self.fetch_names = fetch_names
+        self.describe = describe
+        self.ttl = ttl
+        self.names = None
+        self.fetched_at = 0.0
+        self.details_by_name = {}
+        self.lock = Lock()
+
+    def refresh(self, force=False):
+        """Fetch the names again if forced or older than the TTL"""
+        with self.lock:
+            if not force and self.names is not None and time.time() - self.fetched_at < self.ttl:
+                return
+        names = self.fetch_names()
+        with self.lock:
+            if names is None:
+                # Keep what we had if Splunk couldn't be asked
+                if self.names is None:
+                    self.names = set()
+                return
+            self.names = set(names)
+            self.fetched_at = time.time()
+            self.details_by_name = {name: info for name, info in self.details_by_name.items()
+                                    if name in self.names}
+
+    def all_names(self):
+        self.refresh()
+        with self.lock:
+            return sorted(self.names)
+
+    def __contains__(self, index_name):
+        self.refresh()
+        with self.lock:
+            return index_name in self.names
+
+    def add(self, index_name):
+        """Record an index that was just created or restored"""
+        with self.lock:
+            if self.names is not None:
+                self.names.add(index_name)
+        self.forget_details(index_name)
+
+    def discard(self, index_name):
+        """Record an index that was just deleted"""
+        with self.lock:
+            if self.names is not None:
+                self.names.discard(index_name)
+        self.forget_details(index_name)
+
+    def forget_details(self, index_name):
+        """Drop cached details of an index whose data or config changed"""
+        with self.lock:
+            self.details_by_name.pop(index_name, None)
+
+    def update(self, index_name, **details):
+        """Store details already worked out elsewhere (e.g. sizes from a bulk scan)"""
+        with self.lock:
+            self.details_by_name.setdefault(index_name, {}).update(details)
+
+    def details(self, index_name, *keys):
+        """Return the details of an index, calling describe() for any of keys not known yet"""
+        with self.lock:
+            known = dict(self.details_by_name.get(index_name, {}))
+        if not keys or any(key not in known for key in keys):
+            known.update(self.describe(index_name))
+            self.update(index_name, **known)
+        return known
+
+# Index create/delete calls sent to Splunk at once (matches the REST connection pool)
+BULK_INDEX_CONCURRENCY = 4
+
+# How many indexes a batch backup archives at the same time
+BATCH_BACKUP_CONCURRENCY = 4
+
+class BackupError(Exception):
+    """A backup could not be started or written"""
+
+# Large files are compressed in chunks so a single big journal still uses every core
+COMPRESS_CHUNK_SIZE = 16 * 1024 * 1024
+DEFAULT_COMPRESS_LEVEL = 6
+# Raw chunks read but not yet written may take this much memory, whatever the core count
+COMPRESS_MEMORY_BUDGET = 256 * 1024 * 1024
+COMPRESS_MEMORY_UNIT = 1024 * 1024
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+def _gf2_matrix_times(matrix, vector):
+    total = 0
+    row = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return total
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, matrix[n]) for n in range(32)]
+
+def crc32_combine(crc1, crc2, len2):
+    """Combine CRC-32s of two consecutive blocks (port of zlib's crc32_combine)"""
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    while True:
+        even = _gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+def sample_is_incompressible(data, sample):
+    """Deflate the first sample[0] bytes at level 1, True if they don't shrink below ratio sample[1]"""
+    size, ratio = sample
+    return len(zlib.compress(data[:size], 1)) > min(size, len(data)) * ratio
+
+def compress_chunk(path, offset, length, level, final, sample=None):
+    """Read one chunk of a file and raw-deflate it (runs in a worker process)
+
+    Non-final chunks end with a sync flush so the chunks of a file can be
+    concatenated into one deflate stream. level None returns the data as is
+    (for ZIP_STORED members). sample=(size, ratio) deflates the first `size`
+    bytes at level 1 first and falls back to level 0 (stored deflate blocks)
+    if they don't shrink below `ratio`.
+    Returns (data, crc32, raw_length, sha256_hex, level_used, seconds,
+    read_seconds); seconds is the time spent hashing and compressing.
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    read_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    crc = zlib.crc32(data)
+    digest = hashlib.sha256(data).hexdigest()
+    if level is None:
+        return data, crc, len(data), digest, None, time.perf_counter() - started, read_seconds
+    if sample and len(data) > sample[0] and sample_is_incompressible(data, sample):
+        level = 0
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data)
+    compressed += compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return compressed, crc, len(data), digest, level, time.perf_counter() - started, read_seconds
+
+def hash_stream(f, chunk_size=COMPRESS_CHUNK_SIZE):
+    """Return (crc32, [sha256 per chunk], size) for a stream, matching what compress_chunk records"""
+    crc = 0
+    size = 0
+    digests = []
+    while True:
+        data = f.read(chunk_size)
+        if not data and digests:
+            break
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+        digests.append(hashlib.sha256(data).hexdigest())
+        if len(data) < chunk_size:
+            break
+    return crc, digests, size
+
+def hash_file(path, chunk_size=COMPRESS_CHUNK_SIZE):
+    """Return (crc32, [sha256 per chunk], size) for a file"""
+    with open(path, 'rb') as f:
+        return hash_stream(f, chunk_size)
+
+class CompressionPolicy:
+    """Pick how each file is compressed and keep ratio/time stats per category
+
+    Splunk journals are already gzip/zstd compressed, so re-deflating them burns
+    CPU for no gain: known compressed extensions are stored as is, tsidx and
+    bloomfilter files get a fast level, everything else the normal level.
+    With sampling on, other files whose first few KB don't compress are
+    written as stored deflate blocks. Rules can be overridden with the
+    compression_policy section of config.txt.
+    """
+    DEFAULTS = {
+        'store': ['.gz', '.zst', '.zstd', '.lz4', '.bz2', '.xz', '.zip', '.7z', '.tgz'],
+        'fast': ['.tsidx', 'bloomfilter'],
+        'fast_level': 1,
+        'level': DEFAULT_COMPRESS_LEVEL,
+        'sample': True,
+        'sample_size': 64 * 1024,
+        'sample_ratio': 0.9
+    }
+
+    def __init__(self, **rules):
+        unknown = set(rules) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown compression policy settings: {', '.join(sorted(unknown))}")
+        settings = dict(self.DEFAULTS, **rules)
+        self.store = tuple(suffix.lower() for suffix in settings['store'])
+        self.fast = tuple(suffix.lower() for suffix in settings['fast'])
+        self.fast_level = settings['fast_level']
+        self.level = settings['level']
+        self.sample = (settings['sample_size'], settings['sample_ratio']) if settings['sample'] else None
+        self.stats = {}
+        self.lock = Lock()
+
+    def classify(self, arcname):
+        """Return (category, zip method, zlib level) for an archive path"""
+        name = arcname.rsplit('/', 1)[-1].lower()
+        if name.endswith(self.store):
+            return 'compressed', zipfile.ZIP_STORED, None
+        if name.endswith(self.fast):
+            return 'index', zipfile.ZIP_DEFLATED, self.fast_level
+        return 'default', zipfile.ZIP_DEFLATED, self.level
+
+    def record(self, category, bytes_in, bytes_out, seconds, files=1):
+        with self.lock:
+            stats = self.stats.setdefault(category, {'files': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0})
+            stats['files'] += files
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['seconds'] += seconds
+
+    def report(self):
+        """Return per-category stats with compression ratio and throughput"""
+        with self.lock:
+            report = {}
+            for category, stats in self.stats.items():
+                report[category] = dict(
+                    stats,
+                    ratio=stats['bytes_out'] / stats['bytes_in'] if stats['bytes_in'] else 1.0,
+                    mb_per_second=stats['bytes_in'] / stats['seconds'] / (1024 * 1024) if stats['seconds'] else 0.0
+                )
+            return report
+
+def _dos_datetime(mtime):
+    """Convert a timestamp to the (time, date) pair stored in ZIP headers"""
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+class ZipStreamWriter:
+    """Append-only ZIP writer for members that were compressed elsewhere
+
+    Every member is written with a data descriptor, so the local header can go
+    out before the data is known and the output never needs to seek. The
+    result is a standard (ZIP64 when needed) archive that zipfile can read.
+    """
+
+    def __init__(self, fileobj, offset=0, entries=None):
+        """offset and entries continue an archive whose members up to offset are already written"""
+        self.fp = fileobj
+        self.offset = offset
+        self.entries = list(entries or [])
+        self.create_system = 0 if os.name == 'nt' else 3
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.offset += len(data)
+
+    def begin_member(self, arcname, mtime, mode, compress_type, size_hint=0):
+        """Write the local header for a member, returns the entry to pass to end_member"""
+        name = arcname.replace(os.sep, '/').encode('utf-8')
+        flags = 0x08 | (0x800 if not arcname.isascii() else 0)
+        # Deflate of incompressible data grows slightly, leave room before switching to ZIP64
+        zip64 = size_hint + (size_hint >> 10) + 64 >= ZIP64_LIMIT
+        dos_time, dos_date = _dos_datetime(mtime)
+        entry = {
+            'name': name, 'flags': flags, 'method': compress_type, 'time': dos_time,
+            'date': dos_date, 'mode': mode, 'offset': self.offset, 'zip64': zip64,
+            'crc': 0, 'compress_size': 0, 'file_size': 0
+        }
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else b''
+        size_field = ZIP64_LIMIT if zip64 else 0
+        self._write(struct.pack(
+            '<4sHHHHHLLLHH', b'PK\x03\x04', 45 if zip64 else 20, flags, compress_type,
+            dos_time, dos_date, 0, size_field, size_field, len(name), len(extra)
+        ))
+        self._write(name)
+        self._write(extra)
+        return entry
+
+    def write_data(self, entry, data):
+        self._write(data)
+        entry['compress_size'] += len(data)
+
+    def end_member(self, entry, crc, file_size):
+        """Write the data descriptor that closes a member"""
+        entry['crc'] = crc
+        entry['file_size'] = file_size
+        if entry['zip64']:
+            self._write(struct.pack('<4sLQQ', b'PK\x07\x08', crc, entry['compress_size'], file_size))
+        elif entry['compress_size'] >= ZIP64_LIMIT or file_size >= ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f"{entry['name'].decode('utf-8')} grew past 4GB while archiving")
+        else:
+            self._write(struct.pack('<4sLLL', b'PK\x07\x08', crc, entry['compress_size'], file_size))
+        self.entries.append(entry)
+
+    def write_member(self, arcname, data, mtime=None, mode=0o644):
+        """Store a small in-memory member (uncompressed)"""
+        entry = self.begin_member(arcname, mtime or time.time(), mode, zipfile.ZIP_STORED, len(data))
+        self.write_data(entry, data)
+        self.end_member(entry, zlib.crc32(data), len(data))
+
+    def add_directory(self, arcname, mtime, mode=0o755):
+        """Add an (empty) directory entry"""
+        if not arcname.endswith('/'):
+            arcname += '/'
+        entry = self.begin_member(arcname, mtime, mode | 0o40000, zipfile.ZIP_STORED)
+        self.end_member(entry, 0, 0)
+
+    def close(self):
+        """Write the central directory and end records"""
+        cd_start = self.offset
+        for entry in self.entries:
+            extra_fields = []
+            file_size, compress_size, offset = entry['file_size'], entry['compress_size'], entry['offset']
+            if file_size >= ZIP64_LIMIT:
+                extra_fields.append(file_size)
+                file_size = ZIP64_LIMIT
+            if compress_size >= ZIP64_LIMIT:
+                extra_fields.append(compress_size)
+                compress_size = ZIP64_LIMIT
+            if offset >= ZIP64_LIMIT:
+                extra_fields.append(offset)
+                offset = ZIP64_LIMIT
+            extra = b''
+            if extra_fields:
+                extra = struct.pack(f'<HH{len(extra_fields)}Q', 0x0001, 8 * len(extra_fields), *extra_fields)
+            version = 45 if extra_fields or entry['zip64'] else 20
+            external_attr = (entry['mode'] & 0xFFFF) << 16
+            if entry['name'].endswith(b'/'):
+                external_attr |= 0x10
+            self._write(struct.pack(
+                '<4s4B4HL2L5HLL', b'PK\x01\x02', version, self.create_system, version, 0,
+                entry['flags'], entry['method'], entry['time'], entry['date'], entry['crc'],
+                compress_size, file_size, len(entry['name']), len(extra), 0, 0, 0,
+                external_attr, offset
+            ))
+            self._write(entry['name'])
+            self._write(extra)
+
+        cd_size = self.offset - cd_start
+        count = len(self.entries)
+        if count >= ZIP_FILECOUNT_LIMIT or cd_start >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            eocd64_offset = self.offset
+            self._write(struct.pack(
+                '<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0, count, count, cd_size, cd_start
+            ))
+            self._write(struct.pack('<4sLQL', b'PK\x06\x07', 0, eocd64_offset, 1))
+        self._write(struct.pack(
+            '<4s4H2LH', b'PK\x05\x06', 0, 0, min(count, ZIP_FILECOUNT_LIMIT),
+            min(count, ZIP_FILECOUNT_LIMIT), min(cd_size, ZIP64_LIMIT),
+            min(cd_start, ZIP64_LIMIT), 0
+        ))
+        self.fp.flush()
+
+# Throttling: a backup on a live indexer shares the disk with splunkd
+THROTTLE_BURST = 1.0             # seconds of budget a bucket can save up
+THROTTLE_INTERVAL = 1.0          # seconds between adjustments of the adaptive rate
+THROTTLE_LATENCY_FACTOR = 2.0    # back off once reads take this many times the baseline
+THROTTLE_DECREASE = 0.5          # multiplicative decrease on slow reads
+THROTTLE_INCREASE = 0.05         # additive increase per healthy interval, as a share of the limit
+THROTTLE_MIN_RATE = 1024 * 1024  # never slow reading down below this many bytes per second
+THROTTLE_MIN_READ = 256 * 1024   # smaller reads are timed as if they were this big
+THROTTLE_LATENCY_FLOOR = 0.0005  # seconds per MB; a page cache baseline would make every disk read look slow
+LOW_PRIORITY_NICE = 10
+# ioprio_set has no wrapper in the C library; best-effort class (2) at its lowest level (7)
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+                       'armv7l': 314, 'ppc64le': 273, 's390x': 282}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_LOW = (2 << 13) | 7
+
+class TokenBucket:
+    """`rate` units per second with THROTTLE_BURST seconds of slack, not thread safe on its own"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate * THROTTLE_BURST
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.rate * THROTTLE_BURST, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take `amount` (going into debt if need be), returns the seconds to wait for it"""
+        self.refill(now)
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def set_rate(self, rate, now):
+        self.refill(now)
+        self.rate = rate
+        self.tokens = min(self.tokens, rate * THROTTLE_BURST)
+
+class IOThrottle:
+    """Bytes and files per second budget for reading index files, shared by all backups in a process
+
+    acquire() blocks until a read fits the budget; a limit of 0 leaves that
+    budget open. With adaptive=True the byte rate follows the disk (AIMD):
+    observe() is given how long reads took, and once every THROTTLE_INTERVAL
+    the rate is halved if reads got THROTTLE_LATENCY_FACTOR times slower
+    than the baseline, or raised a step back towards the limit if not. The
+    baseline follows the healthy intervals quickly and the slow ones only a
+    little, so a disk that stays busy is eventually probed again.
+    """
+
+    def __init__(self, bytes_per_second=0, files_per_second=0, adaptive=True):
+        self.limit = bytes_per_second or None
+        self.bytes = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.files = TokenBucket(files_per_second) if files_per_second else None
+        self.adaptive = adaptive
+        self.lock = Lock()
+        self.baseline = None
+        self.peak = 0.0
+        self.interval_started = time.monotonic()
+        self.interval_bytes = 0
+        self.interval_seconds = 0.0
+        self.interval_reads = 0
+        self.backoffs = 0
+        self.waited = 0.0
+
+    @property
+    def rate(self):
+        """Bytes per second allowed right now, None when unlimited"""
+        return self.bytes.rate if self.bytes else None
+
+    def acquire(self, size, files=0):
+        """Wait until `size` bytes and `files` files may be read, returns the seconds waited"""
+        with self.lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self.bytes and size:
+                wait = self.bytes.reserve(size, now)
+            if self.files and files:
+                wait = max(wait, self.files.reserve(files, now))
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def observe(self, size, seconds):
+        """Record that reading `size` bytes took `seconds`, adjusting the rate once per interval"""
+        if not self.adaptive:
+            return
+        with self.lock:
+            self.interval_bytes += size
+            self.interval_seconds += seconds * (1024 * 1024) / max(size, THROTTLE_MIN_READ)
+            self.interval_reads += 1
+            now = time.monotonic()
+            elapsed = now - self.interval_started
+            if elapsed < THROTTLE_INTERVAL:
+                return
+            latency = self.interval_seconds / self.interval_reads
+            throughput = self.interval_bytes / elapsed
+            self.peak = max(self.peak, throughput)
+            self.interval_started = now
+            self.interval_bytes = 0
+            self.interval_seconds = 0.0
+            self.interval_reads = 0
+            if self.baseline is None:
+                self.baseline = max(latency, THROTTLE_LATENCY_FLOOR)
+                return
+            if latency > self.baseline * THROTTLE_LATENCY_FACTOR:
+                # Reads are queueing behind splunkd: back off from what actually went through
+                rate = min(self.rate or throughput, throughput) * THROTTLE_DECREASE
+                rate = max(rate, THROTTLE_MIN_RATE)
+                if self.bytes:
+                    self.bytes.set_rate(rate, now)
+                else:
+                    self.bytes = TokenBucket(rate)
+                self.backoffs += 1
+                self.baseline += (latency - self.baseline) * 0.05
+                return
+            self.baseline = max(self.baseline + (latency - self.baseline) * 0.3, THROTTLE_LATENCY_FLOOR)
+            if self.bytes and self.bytes.rate != self.limit:
+                ceiling = self.limit or self.peak
+                rate = self.bytes.rate + ceiling * THROTTLE_INCREASE
+                if self.limit is None and rate >= ceiling:
+                    self.bytes = None
+                else:
+                    self.bytes.set_rate(min(rate, ceiling), now)
+
+def lower_priority():
+    """Lower the CPU and disk priority of the calling process, returns what couldn't be lowered
+
+    Used as the initializer of compression worker processes. psutil is used
+    when installed (it covers Windows), otherwise nice() and the Linux
+    ioprio_set call. The disk priority only counts with the bfq or cfq I/O
+    schedulers. The idle I/O class is avoided, it can starve a backup on a
+    busy indexer for good.
+    """
+    warnings = []
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil:
+        process = psutil.Process()
+        try:
+            if os.name == 'nt':
+                process.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+                process.ionice(psutil.IOPRIO_LOW)
+            else:
+                process.nice(max(process.nice(), LOW_PRIORITY_NICE))
+                if hasattr(process, 'ionice'):
+                    process.ionice(psutil.IOPRIO_CLASS_BE, 7)
+        except (psutil.Error, OSError, ValueError) as e:
+            warnings.append(f"Could not lower process priority: {e}")
+        return warnings
+
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(max(0, LOW_PRIORITY_NICE - os.nice(0)))
+        except OSError as e:
+            warnings.append(f"Could not lower CPU priority: {e}")
+    else:
+        warnings.append("Lowering process priority on this platform needs psutil: pip install psutil")
+        return warnings
+    if sys.platform.startswith('linux'):
+        number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+        if number is None:
+            warnings.append(f"Don't know how to lower disk priority on {platform.machine()}, "
+                            "install psutil: pip install psutil")
+            return warnings
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, IOPRIO_LOW) != 0:
+            warnings.append(f"Could not lower disk priority: {os.strerror(ctypes.get_errno())}")
+    return warnings
+
+class ParallelArchiveWriter:
+    """Compress files in a process pool and write them in order from a single writer thread
+
+    Files are split into COMPRESS_CHUNK_SIZE chunks that are deflated
+    independently and stitched back into one member, so the output stays a
+    standard ZIP that restore_backup can read. With a throttle, chunks are
+    only handed to the workers as its budget allows and the workers' read
+    times are fed back to it; low_priority lowers the workers' CPU and disk
+    priority.
+    """
+
+    def __init__(self, fileobj, workers=0, policy=None, chunk_size=COMPRESS_CHUNK_SIZE, checkpoint=None,
+                 throttle=None, low_priority=False):
+        self.checkpoint = checkpoint
+        self.throttle = throttle
+        self.low_priority = low_priority
+        if checkpoint:
+            self.zip = ZipStreamWriter(fileobj, checkpoint.offset, checkpoint.entries)
+        else:
+            self.zip = ZipStreamWriter(fileobj)
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = policy or CompressionPolicy()
+        self.chunk_size = chunk_size
+        self.bytes_in = 0
+        # Seconds the workers spent deflating and the writer thread spent appending to the file
+        self.compress_seconds = 0.0
+        self.write_seconds = 0.0
+        # Seconds the submitting thread waited for the throttle
+        self.throttle_seconds = 0.0
+        # arcname -> {'size', 'crc', 'sha256'} for everything written, used for the manifest
+        self.members = dict(checkpoint.members) if checkpoint else {}
+
+    def add_directory(self, arcname, mtime):
+        self.zip.add_directory(arcname, mtime)
+
+    def _chunks(self, size):
+        if size <= self.chunk_size:
+            return [(0, size)]
+        return [(offset, min(self.chunk_size, size - offset))
+                for offset in range(0, size, self.chunk_size)]
+
+    def release_units(self, units):
+        # Semaphore.release(n) needs Python 3.9
+        for _ in range(units):
+            self.in_flight.release()
+
+    def _write_results(self, pending, progress, errors):
+        """Writer thread: take futures in submission order and append them to the archive"""
+        entry = None
+        crc = 0
+        file_size = 0
+        digests = []
+        seconds = 0.0
+        sampled_out = False
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            file_path, arcname, mtime, mode, size, category, method, index, count, future, units = item
+            if errors:
+                # Keep draining so the submitting thread never blocks on the memory budget
+                self.release_units(units)
+                continue
+            try:
+                data, chunk_crc, chunk_length, digest, level, chunk_seconds, read_seconds = future.result()
+                self.compress_seconds += chunk_seconds
+                if self.throttle:
+                    self.throttle.observe(chunk_length, read_seconds)
+                write_started = time.perf_counter()
+                if index == 0:
+                    if self.checkpoint:
+                        self.checkpoint.before_member(arcname, self.zip)
+                    entry = self.zip.begin_member(arcname, mtime, mode, method, size)
+                    crc = 0
+                    file_size = 0
+                    digests = []
+                    seconds = 0.0
+                    sampled_out = False
+                self.zip.write_data(entry, data)
+                crc = crc32_combine(crc, chunk_crc, chunk_length) if index else chunk_crc
+                file_size += chunk_length
+                digests.append(digest)
+                seconds += chunk_seconds
+                sampled_out = sampled_out or (level == 0 and category == 'default')
+                if index == count - 1:
+                    self.zip.end_member(entry, crc, file_size)
+                    self.members[arcname] = {'size': file_size, 'crc': crc, 'sha256': digests}
+                    if self.checkpoint:
+                        self.checkpoint.member_written(arcname, entry, self.members[arcname], size, mtime)
+                    self.policy.record('incompressible' if sampled_out else category,
+                                       file_size, entry['compress_size'], seconds)
+                    self.bytes_in += file_size
+                self.write_seconds += time.perf_counter() - write_started
+                if progress:
+                    progress.update(advance=chunk_length)
+            except Exception as e:
+                errors.append(e)
+            self.release_units(units)
+
+    def add_files(self, files, progress=None):
+        """Compress and write (file_path, arcname, size, mtime, mode) entries in order"""
+        errors = []
+        # Chunks are only read once there is room for them in COMPRESS_MEMORY_BUDGET
+        self.in_flight = Semaphore(max(COMPRESS_MEMORY_BUDGET, 2 * self.chunk_size) // COMPRESS_MEMORY_UNIT)
+        pending = Queue()
+        writer = Thread(target=self._write_results, args=(pending, progress, errors), daemon=True)
+        writer.start()
+
+        pool = None
+        if self.workers > 1:
+            initializer = lower_priority if self.low_priority else None
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initializer)
+        try:
+            for file_path, arcname, size, mtime, mode in files:
+                if errors:
+                    break
+                category, method, level = self.policy.classify(arcname)
+                sample = self.policy.sample if category == 'default' else None
+                chunks = self._chunks(size)
+                for index, (offset, length) in enumerate(chunks):
+                    final = index == len(chunks) - 1
+                    # Only this thread acquires, so taking the units one at a time can't deadlock
+                    units = max(1, -(-length // COMPRESS_MEMORY_UNIT))
+                    for _ in range(units):
+                        self.in_flight.acquire()
+                    if self.throttle:
+                        self.throttle_seconds += self.throttle.acquire(length, 1 if index == 0 else 0)
+                    args = (file_path, offset, length, level, final, sample)
+                    if pool:
+                        future = pool.submit(compress_chunk, *args)
+                    else:
+                        future = Future()
+                        try:
+                            future.set_result(compress_chunk(*args))
+                        except Exception as e:
+                            future.set_exception(e)
+                    pending.put((file_path, arcname, mtime, mode, size, category, method,
+                                 index, len(chunks), future, units))
+        finally:
+            pending.put(None)
+            writer.join()
+            if pool:
+                pool.shutdown()
+        if errors:
+            raise errors[0]
+        if self.checkpoint:
+            self.checkpoint.commit(self.zip)
+
+    def write_member(self, arcname, data):
+        self.zip.write_member(arcname, data)
+
+    def close(self):
+        self.zip.close()
+
+# Streaming encryption: the finished ZIP stream is sealed in AES-256-GCM frames
+ENCRYPTED_SUFFIX = '.zip.aes'
+ENCRYPTION_MAGIC = b'SPLKAES1'
+ENCRYPTION_FRAME_SIZE = 1024 * 1024
+ENCRYPTION_TAG_SIZE = 16
+# scrypt cost: 2**15 x 8 x 128 bytes = 32MB of memory and ~0.1s per key
+SCRYPT_LOG_N = 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+def load_aesgcm():
+    """Return cryptography's (AESGCM, InvalidTag), or None if it isn't installed"""
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.exceptions import InvalidTag
+    except ImportError:
+        return None
+    return AESGCM, InvalidTag
+
+@functools.lru_cache(maxsize=16)
+def derive_key(password, salt, log_n=SCRYPT_LOG_N, r=SCRYPT_R, p=SCRYPT_P):
+    """scrypt a password into a 256-bit key (cached, every restore thread opens the archive)"""
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=1 << log_n, r=r, p=p,
+                          maxmem=(256 << log_n) * r + (1 << 20), dklen=32)
+
+def open_local(path):
+    return open(path, 'rb')
+
+def is_stream_encrypted(path, open_raw=None):
+    """True if the file is a streaming AES-GCM backup (checked by its header, not its name)"""
+    try:
+        with (open_raw or open_local)(path) as f:
+            return f.read(len(ENCRYPTION_MAGIC)) == ENCRYPTION_MAGIC
+    except OSError:
+        return False
+
+class EncryptingWriter:
+    """File-like object sealing everything written to it in AES-256-GCM frames
+
+    The header holds the scrypt salt and parameters. The data is cut into
+    ENCRYPTION_FRAME_SIZE frames, each encrypted with its index as nonce and
+    the header as associated data; the last frame is flagged so a truncated
+    file fails authentication. Every frame but the last is full size, so a
+    reader can seek to any offset. finish() writes the last frame.
+    """
+
+    def __init__(self, fileobj, password, frame_size=ENCRYPTION_FRAME_SIZE):
+        AESGCM, _ = load_aesgcm()
+        salt = os.urandom(16)
+        self.header = ENCRYPTION_MAGIC + struct.pack('>BBBBL16s', 1, SCRYPT_LOG_N, SCRYPT_R, SCRYPT_P,
+                                                     frame_size, salt)
+        self.cipher = AESGCM(derive_key(password, salt))
+        self.fp = fileobj
+        self.frame_size = frame_size
+        self.frame = 0
+        self.buffer = bytearray()
+        self.seconds = 0.0
+        self.fp.write(self.header)
+
+    def _seal(self, data, final):
+        started = time.perf_counter()
+        sealed = self.cipher.encrypt(self.frame.to_bytes(12, 'big'), bytes(data),
+                                     self.header + (b'\x01' if final else b'\x00'))
+        self.seconds += time.perf_counter() - started
+        self.fp.write(sealed)
+        self.frame += 1
+
+    def write(self, data):
+        self.buffer += data
+        # Hold back a full frame: only finish() knows which frame is the last
+        while len(self.buffer) > self.frame_size:
+            self._seal(memoryview(self.buffer)[:self.frame_size], False)
+            del self.buffer[:self.frame_size]
+        return len(data)
+
+    def flush(self):
+        self.fp.flush()
+
+    def finish(self):
+        self._seal(self.buffer, True)
+        self.buffer = bytearray()
+        self.fp.flush()
+
+def open_encryption_header(fp, password):
+    """Read an EncryptingWriter header from fp, returns (header, cipher, frame_size, InvalidTag)"""
+    crypto = load_aesgcm()
+    if crypto is None:
+        raise RuntimeError("Backup uses streaming AES-GCM encryption, install cryptography: "
+                           "pip install cryptography")
+    AESGCM, invalid_tag = crypto
+    if not password:
+        raise RuntimeError("Backup is encrypted, a password is needed")
+    header = read_full(fp, len(ENCRYPTION_MAGIC) + 24)
+    if len(header) < len(ENCRYPTION_MAGIC) + 24:
+        raise zipfile.BadZipFile("Encrypted backup is truncated")
+    magic, version, log_n, r, p, frame_size, salt = struct.unpack('>8sBBBBL16s', header)
+    if magic != ENCRYPTION_MAGIC or version != 1:
+        raise zipfile.BadZipFile("Not a streaming encrypted backup")
+    return header, AESGCM(derive_key(password, salt, log_n, r, p)), frame_size, invalid_tag
+
+def read_full(fp, size):
+    """Read size bytes, or fewer only at the end of the stream (pipes return short reads)"""
+    parts = []
+    while size > 0:
+        data = fp.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+class DecryptingReader(io.RawIOBase):
+    """Seekable read-only view of the plaintext of an EncryptingWriter file, for zipfile
+
+    Frames are decrypted on demand and the last one is kept, so zipfile's
+    small reads and seeks only cost one frame each and a member is never
+    held in memory whole. Raises RuntimeError for a wrong password and
+    zipfile.BadZipFile for a frame that fails authentication.
+    """
+
+    def __init__(self, path, password, open_raw=None):
+        self.fp = (open_raw or open_local)(path)
+        try:
+            self.header, self.cipher, frame_size, self.invalid_tag = open_encryption_header(self.fp, password)
+            self.frame_size = frame_size
+            sealed_size = frame_size + ENCRYPTION_TAG_SIZE
+            body = self.fp.seek(0, io.SEEK_END) - len(self.header)
+            self.frames = max(1, -(-body // sealed_size))
+            last = body - (self.frames - 1) * sealed_size
+            if last < ENCRYPTION_TAG_SIZE:
+                raise zipfile.BadZipFile("Encrypted backup is truncated")
+            self.size = (self.frames - 1) * frame_size + last - ENCRYPTION_TAG_SIZE
+            self.position = 0
+            self.cached = (None, b'')
+            try:
+                self._frame(0)
+            except zipfile.BadZipFile:
+                raise RuntimeError("Bad password for encrypted backup (or the archive is damaged)")
+        except BaseException:
+            self.fp.close()
+            raise
+
+    def _frame(self, index):
+        if self.cached[0] != index:
+            sealed_size = self.frame_size + ENCRYPTION_TAG_SIZE
+            self.fp.seek(len(self.header) + index * sealed_size)
+            sealed = self.fp.read(sealed_size)
+            final = index == self.frames - 1
+            try:
+                data = self.cipher.decrypt(index.to_bytes(12, 'big'), sealed,
+                                           self.header + (b'\x01' if final else b'\x00'))
+            except self.invalid_tag:
+                raise zipfile.BadZipFile(f"Encrypted frame {index} failed authentication")
+            self.cached = (index, data)
+        return self.cached[1]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = max(0, min(size, self.size - self.position))
+        parts = []
+        while size > 0:
+            index, start = divmod(self.position, self.frame_size)
+            data = self._frame(index)[start:start + size]
+            if not data:
+                raise zipfile.BadZipFile(f"Encrypted frame {index} is shorter than expected")
+            parts.append(data)
+            self.position += len(data)
+            size -= len(data)
+        return b''.join(parts)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.fp.close()
+        super().close()
+
+class DecryptedZipFile(zipfile.ZipFile):
+    """Read-only ZipFile over a streaming encrypted backup, closing the decrypting reader with it"""
+
+    def __init__(self, path, password, open_raw=None):
+        self.reader = None
+        self.reader = DecryptingReader(path, password, open_raw)
+        super().__init__(self.reader, 'r')
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.reader:
+                self.reader.close()
+
+PARTIAL_SUFFIX = '.partial'
+CHECKPOINT_SUFFIX = '.checkpoint'
+# Write a checkpoint at the first bucket boundary after this much archive data
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+CHECKPOINT_FORMAT = 1
+
+class BackupCheckpoint:
+    """Progress log of a backup being written to <archive>.partial, so an interrupted run can resume
+
+    The first line describes the backup. A line is appended whenever complete
+    buckets (at least CHECKPOINT_BYTES since the last line) are synced to the
+    partial archive, holding their central directory entries, manifest
+    members, their (size, mtime) when scanned and the archive offset they end
+    at. Resuming truncates the partial archive to the last recorded offset
+    and skips those files, unless they changed since (see drop_changed).
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self.offset = 0
+        self.entries = []
+        self.members = {}
+        self.stats = {}
+        self.bucket = None
+        self.pending_entries = []
+        self.pending_members = {}
+        self.pending_stats = {}
+        self.committed_offset = 0
+
+    @staticmethod
+    def path_for(zip_filename):
+        return zip_filename + CHECKPOINT_SUFFIX
+
+    @classmethod
+    def create(cls, zip_filename, header):
+        checkpoint = cls(cls.path_for(zip_filename), dict(header, format=CHECKPOINT_FORMAT))
+        checkpoint.rewrite()
+        return checkpoint
+
+    @classmethod
+    def load(cls, zip_filename):
+        """Read a checkpoint, returns None if it is missing or unreadable
+
+        A torn last line (the process died while appending) is ignored, and
+        the file is rewritten as one compact line so appends start clean.
+        """
+        try:
+            with open(cls.path_for(zip_filename), 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            header = json.loads(lines[0])
+        except (OSError, ValueError, IndexError):
+            return None
+        if not isinstance(header, dict) or header.get('format') != CHECKPOINT_FORMAT:
+            return None
+        checkpoint = cls(cls.path_for(zip_filename), header)
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            checkpoint.entries.extend(dict(entry, name=entry['name'].encode('utf-8'))
+                                      for entry in record['entries'])
+            checkpoint.members.update(record['members'])
+            checkpoint.stats.update(record.get('stats', {}))
+            checkpoint.offset = record['offset']
+        checkpoint.committed_offset = checkpoint.offset
+        checkpoint.rewrite()
+        return checkpoint
+
+    def record_line(self, entries, members, stats, offset):
+        return json.dumps({
+            'offset': offset,
+            'entries': [dict(entry, name=entry['name'].decode('utf-8')) for entry in entries],
+            'members': members,
+            'stats': stats
+        })
+
+    def rewrite(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.header) + '\n')
+            if self.entries:
+                f.write(self.record_line(self.entries, self.members, self.stats, self.offset) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def before_member(self, arcname, zip_writer):
+        """Called before a member is written; a new bucket may close a checkpoint"""
+        bucket = bucket_of(arcname)
+        if bucket != self.bucket and zip_writer.offset - self.committed_offset >= CHECKPOINT_BYTES:
+            self.commit(zip_writer)
+        self.bucket = bucket
+
+    def member_written(self, arcname, entry, member, size, mtime):
+        self.pending_entries.append(entry)
+        self.pending_members[arcname] = member
+        self.pending_stats[arcname] = [size, mtime]
+
+    def drop_changed(self, files):
+        """Forget archived members that are gone from, or differ in size or mtime from, `files`
+
+        files are the (file_path, arcname, size, mtime, mode) entries of the
+        new scan; hot buckets keep growing between runs. The dropped members'
+        data stays in the partial archive but the central directory won't
+        point at it, so they are archived again. Returns their arcnames.
+        """
+        current = {arcname: [size, mtime] for _, arcname, size, mtime, _ in files}
+        changed = [arcname for arcname in self.members if self.stats.get(arcname) != current.get(arcname)]
+        if changed:
+            dropped = {arcname.encode('utf-8') for arcname in changed}
+            self.entries = [entry for entry in self.entries if entry['name'] not in dropped]
+            for arcname in changed:
+                del self.members[arcname]
+                self.stats.pop(arcname, None)
+            self.rewrite()
+        return changed
+
+    def commit(self, zip_writer):
+        """Sync the archive, then record everything written so far as done"""
+        if not self.pending_entries:
+            return
+        zip_writer.fp.flush()
+        os.fsync(zip_writer.fp.fileno())
+        line = self.record_line(self.pending_entries, self.pending_members, self.pending_stats, zip_writer.offset)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries.extend(self.pending_entries)
+        self.members.update(self.pending_members)
+        self.stats.update(self.pending_stats)
+        self.offset = self.committed_offset = zip_writer.offset
+        self.pending_entries = []
+        self.pending_members = {}
+        self.pending_stats = {}
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+LOCK_SUFFIX = '.lock'
+
+def lock_file(fd):
+    """Take an exclusive lock on an open file without waiting, returns False if someone else holds it"""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+class BackupLock:
+    """Exclusive lock on <archive>.lock, held by the run writing an archive
+
+    Two runs backing up the same index (both job worker slots, or cron
+    overlapping a manual run) would otherwise resume the same .partial and
+    write over each other. The OS drops the lock when its process dies, so
+    a crash never leaves a stale lock; the file holds hostname:pid of the
+    owner for anyone looking.
+    """
+
+    def __init__(self, path, fd):
+        self.path = path
+        self.fd = fd
+
+    @staticmethod
+    def path_for(zip_filename):
+        return zip_filename + LOCK_SUFFIX
+
+    @classmethod
+    def acquire(cls, zip_filename):
+        """Lock an archive, returns the BackupLock or None if another run holds it"""
+        path = cls.path_for(zip_filename)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if not lock_file(fd):
+                os.close(fd)
+                return None
+            # The previous owner may have removed the file between our open and lock
+            try:
+                if os.path.samestat(os.fstat(fd), os.stat(path)):
+                    break
+            except OSError:
+                pass
+            os.close(fd)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{socket.gethostname()}:{os.getpid()}\n".encode('utf-8'))
+        return cls(path, fd)
+
+    def release(self):
+        if self.fd is None:
+            return
+        # Windows can't remove a file that is still open, POSIX must remove it before unlocking
+        if os.name != 'nt':
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        os.close(self.fd)
+        self.fd = None
+        if os.name == 'nt':
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+def backup_index_name(backup_file):
+    """Index name from a <index>_backup_<timestamp>.zip filename"""
+    return os.path.basename(backup_file).split('_backup_')[0]
+
+def is_partial_backup(path):
+    """Whether a file is an unfinished backup (or has a checkpoint next to it)"""
+    return path.endswith((PARTIAL_SUFFIX, CHECKPOINT_SUFFIX)) or os.path.exists(path + CHECKPOINT_SUFFIX)
+
+# Stored at the root of every backup archive, lists what the backup holds
+MANIFEST_NAME = "backup_manifest.json"
+MANIFEST_FORMAT = 1
+
+def bucket_of(arcname):
+    """Return the bucket an archive path belongs to (index/db/db_...), or None"""
+    parts = arcname.split('/')
+    if len(parts) >= 4 and parts[2].startswith(BUCKET_PREFIXES):
+        return '/'.join(parts[:3])
+    return None
+
+class IndexScan:
+    """Result of one stat pass over an index, shared by sizing, progress and archiving
+
+    files are (path, arcname, size, mtime, mode) in archive order, dirs are
+    (arcname, mtime) of empty folders and buckets maps bucket folder paths to
+    (bytes, file count). Archive names always use '/'.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.dirs = []
+        self.buckets = {}
+
+    @property
+    def total_bytes(self):
+        return sum(item[2] for item in self.files)
+
+def scan_level(path, arcname):
+    """Stat the entries of one folder, returns (files, empty_dirs, subfolders)
+
+    subfolders are (path, arcname) pairs in name order; the folder itself is
+    reported in empty_dirs when it has no entries.
+    """
+    files = []
+    subfolders = []
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return files, [], subfolders
+    if not entries:
+        try:
+            return files, [(arcname, os.stat(path).st_mtime)], subfolders
+        except OSError:
+            return files, [], subfolders
+    for entry in entries:
+        child_arcname = f"{arcname}/{entry.name}"
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append((entry.path, child_arcname))
+            elif entry.is_file():
+                st = entry.stat()
+                files.append((entry.path, child_arcname, st.st_size, st.st_mtime, st.st_mode))
+        except OSError:
+            continue
+    return files, [], subfolders
+
+def scan_subtree(path, arcname):
+    """Stat every file under a folder once with os.scandir, returns (files, empty_dirs)"""
+    files = []
+    dirs = []
+    pending = [(path, arcname)]
+    while pending:
+        level_files, level_dirs, subfolders = scan_level(*pending.pop())
+        files.extend(level_files)
+        dirs.extend(level_dirs)
+        # Depth-first in name order, so archive order follows the folder layout
+        pending.extend(reversed(subfolders))
+    return files, dirs
+
+def iter_index_scan(index_folder, dat_file=None, workers=None):
+    """Stat the .dat file and index folder a bucket at a time, yields (files, dirs, bucket path)
+
+    Units come in archive order: the .dat file and the files of the top two
+    levels first, then one per bucket (or other subfolder of db/, colddb/...).
+    bucket path is None for units that aren't buckets. Buckets are scanned on
+    `workers` threads, only a few ahead of the consumer, so memory doesn't
+    grow with the size of the index.
+    """
+    if dat_file and os.path.exists(dat_file):
+        st = os.stat(dat_file)
+        yield [(dat_file, os.path.basename(dat_file), st.st_size, st.st_mtime, st.st_mode)], [], None
+    if not os.path.isdir(index_folder):
+        return
+
+    # List the top two levels here (db/, colddb/, ...), then scan the buckets below in parallel
+    files, dirs, children = scan_level(index_folder, os.path.basename(index_folder))
+    units = []
+    for child in children:
+        child_files, child_dirs, subfolders = scan_level(*child)
+        files.extend(child_files)
+        dirs.extend(child_dirs)
+        units.extend(subfolders)
+    yield files, dirs, None
+
+    def finished(path, future):
+        files, dirs = future.result()
+        return files, dirs, path if os.path.basename(path).startswith(BUCKET_PREFIXES) else None
+
+    workers = workers or SCAN_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ahead = []
+        for path, arcname in units:
+            ahead.append((path, pool.submit(scan_subtree, path, arcname)))
+            if len(ahead) >= 2 * workers:
+                yield finished(*ahead.pop(0))
+        for path, future in ahead:
+            yield finished(path, future)
+
+def scan_index(index_folder, dat_file=None, workers=None):
+    """Stat the .dat file and index folder once, scanning buckets in parallel
+
+    Returns an IndexScan.
+    """
+    scan = IndexScan()
+    for files, dirs, bucket_path in iter_index_scan(index_folder, dat_file, workers):
+        scan.files.extend(files)
+        scan.dirs.extend(dirs)
+        if bucket_path:
+            scan.buckets[bucket_path] = (sum(item[2] for item in files), len(files))
+    return scan
+
+def select_changed_files(files, base_manifest):
+    """Split files into those to store and manifest entries reusable from the base backup
+
+    A bucket is reused only if it isn't hot and holds exactly the same files,
+    with the same sizes and mtimes, as in the base manifest. Files outside
+    buckets are always stored.
+    """
+    base_files = base_manifest.get('files', {})
+    base_buckets = {}
+    for arcname, entry in base_files.items():
+        bucket = bucket_of(arcname)
+        if bucket:
+            base_buckets.setdefault(bucket, {})[arcname] = entry
+
+    current_buckets = {}
+    to_store = []
+    for item in files:
+        bucket = bucket_of(item[1])
+        if bucket and not bucket.rsplit('/', 1)[-1].startswith('hot_'):
+            current_buckets.setdefault(bucket, []).append(item)
+        else:
+            to_store.append(item)
+
+    reused = {}
+    for bucket, items in current_buckets.items():
+        previous = base_buckets.get(bucket, {})
+        unchanged = len(previous) == len(items) and all(
+            arcname in previous
+            and previous[arcname]['size'] == size
+            and previous[arcname]['mtime'] == mtime
+            for _, arcname, size, mtime, _ in items
+        )
+        if unchanged:
+            for _, arcname, *_ in items:
+                reused[arcname] = dict(previous[arcname])
+        else:
+            to_store.extend(items)
+
+    # Keep archive order stable (.dat first, then folder order)
+    order = {item[1]: position for position, item in enumerate(files)}
+    to_store.sort(key=lambda item: order[item[1]])
+    return to_store, reused
+
+def read_backup_manifest(zip_ref):
+    """Return the manifest of an open backup archive, or None for older backups"""
+    try:
+        data = zip_ref.read(MANIFEST_NAME)
+    except KeyError:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+def plan_restore_chain(backup_file, manifest):
+    """Work out which archives of an incremental chain hold which files
+
+    Returns [(archive_path, [member names])] oldest first. The archives are
+    expected next to backup_file. Raises BackupError if one is missing.
+    """
+    in_s3 = is_s3_url(backup_file)
+    backup_dir = backup_file.rsplit('/', 1)[0] if in_s3 else os.path.dirname(os.path.abspath(backup_file))
+    this_archive = manifest['archive']
+    by_archive = {}
+    for arcname, entry in manifest['files'].items():
+        by_archive.setdefault(entry.get('archive', this_archive), []).append(arcname)
+
+    plan = []
+    chain = manifest.get('chain') or [this_archive]
+    for archive in chain + [a for a in by_archive if a not in chain]:
+        if archive not in by_archive:
+            continue
+        if archive == this_archive:
+            path = backup_file
+        else:
+            path = s3_join(backup_dir, archive) if in_s3 else os.path.join(backup_dir, archive)
+        # Objects in S3 only turn out to be missing when they are opened
+        if not in_s3 and not os.path.exists(path):
+            raise BackupError(f"Incremental backup needs {archive}, which is missing from {backup_dir}")
+        plan.append((path, by_archive[archive]))
+    return plan
+
+# Split backups are <index>_backup_<timestamp>.vol001.zip, .vol002.zip... (.zip.aes when encrypted)
+VOLUME_NAME = re.compile(r'^(?P<stem>.+)\.vol(?P<number>\d{3,})(?P<suffix>\.zip(?:\.aes)?)$')
+# Room left per file for its headers, data descriptor and manifest entry when filling a volume
+VOLUME_FILE_OVERHEAD = 512
+
+def volume_filename(stem, number, suffix):
+    return f"{stem}.vol{number:03d}{suffix}"
+
+class VolumeSplitter:
+    """Cut the units of iter_index_scan into volumes of whole buckets as they are scanned
+
+    A volume is closed before a bucket that would take it past volume_size,
+    counting input bytes: deflate never grows data by more than a few bytes
+    per block, so the archive stays within the size. A bucket bigger than
+    volume_size gets a volume of its own. Only the volume being written is
+    held: its files and dirs are in self.files and self.dirs.
+    """
+
+    def __init__(self, units, volume_size):
+        self.units = iter(units)
+        self.volume_size = volume_size
+        self.next_unit = next(self.units, None)
+        self.files = []
+        self.dirs = []
+
+    @property
+    def done(self):
+        return self.next_unit is None
+
+    def volume_files(self):
+        """Yield the files of the next volume, for ParallelArchiveWriter.add_files"""
+        self.files = []
+        self.dirs = []
+        volume_bytes = 0
+        while self.next_unit is not None:
+            files, dirs, _ = self.next_unit
+            unit_bytes = sum(item[2] + (item[2] >> 10) + VOLUME_FILE_OVERHEAD for item in files)
+            if self.files and volume_bytes + unit_bytes > self.volume_size:
+                return
+            self.next_unit = next(self.units, None)
+            self.files.extend(files)
+            self.dirs.extend(dirs)
+            volume_bytes += unit_bytes
+            yield from files
+
+def volume_paths(backup_file, manifest, open_archive):
+    """Return the paths of every volume of the split backup backup_file is part of, in order
+
+    backup_file can be any volume. The number of volumes is only known once
+    the last one is written, so only its manifest has it: the highest
+    numbered volume in the folder is read unless manifest already is the
+    last. Raises BackupError if a volume is missing (or still a .partial).
+    """
+    name = os.path.basename(backup_file)
+    match = VOLUME_NAME.match(name)
+    if not match:
+        raise BackupError(f"{name} is a volume of a split backup but has been renamed")
+    backup_dir = os.path.dirname(os.path.abspath(backup_file))
+    stem, suffix = match.group('stem'), match.group('suffix')
+    found = set()
+    for other in os.listdir(backup_dir):
+        other_match = VOLUME_NAME.match(other)
+        if other_match and other_match.group('stem') == stem and other_match.group('suffix') == suffix:
+            found.add(int(other_match.group('number')))
+    count = manifest['volume'].get('count')
+    if count is None:
+        last = max(found)
+        with open_archive(os.path.join(backup_dir, volume_filename(stem, last, suffix))) as zip_ref:
+            count = ((read_backup_manifest(zip_ref) or {}).get('volume') or {}).get('count')
+        if count != last:
+            raise BackupError(f"Split backup {stem} is missing its last volume(s), found up to volume {last}")
+    missing = [str(number) for number in range(1, count + 1) if number not in found]
+    if missing:
+        raise BackupError(f"Split backup {stem} is missing volume(s) {', '.join(missing)} of {count}")
+    return [os.path.join(backup_dir, volume_filename(stem, number, suffix)) for number in range(1, count + 1)]
+
+def read_volume(path, number, open_archive, manifest=None):
+    """Return the manifest of volume `number` of a split backup (manifest if already read)
+
+    Raises BackupError if the archive isn't that volume (or is one of another backup).
+    """
+    if manifest is None:
+        with open_archive(path) as zip_ref:
+            manifest = read_backup_manifest(zip_ref)
+    if (not manifest or (manifest.get('volume') or {}).get('number') != number
+            or manifest.get('archive') != os.path.basename(path)):
+        raise BackupError(f"{os.path.basename(path)} is not volume {number} of this backup")
+    return manifest
+
+def load_volume_set(backup_file, manifest, open_archive):
+    """Combine the manifests of every volume of a split backup into one
+
+    For a split backup used as the base of an incremental one, whose manifest
+    lists every file anyway. The result lists each file with the volume
+    holding it, ready for plan_restore_chain. Restore and verify go through
+    the volumes one at a time instead.
+    """
+    paths = volume_paths(backup_file, manifest, open_archive)
+    this_volume = manifest['volume']['number']
+
+    def read(number_path):
+        number, path = number_path
+        return read_volume(path, number, open_archive, manifest if number == this_volume else None)
+
+    # Every volume has its own small manifest, read them side by side
+    with ThreadPoolExecutor(max_workers=min(RESTORE_WORKERS, len(paths))) as pool:
+        manifests = list(pool.map(read, enumerate(paths, 1)))
+    combined = dict(manifest, archive=os.path.basename(backup_file), files={}, dirs=[], chain=[])
+    for volume in manifests:
+        combined['files'].update(volume['files'])
+        combined['dirs'].extend(volume.get('dirs', []))
+        combined['chain'].append(volume['archive'])
+    return combined
+
+# Extraction is mostly waiting on zlib and disk, both of which release the GIL
+RESTORE_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Small members are extracted in batches so a task isn't scheduled per tiny file
+RESTORE_BATCH_BYTES = 8 * 1024 * 1024
+RESTORE_BATCH_FILES = 256
+
+def archive_opener(path, password=None, s3=None):
+    """Return (open_archive, is_encrypted) for a backup archive
+
+    open_archive(path) opens an archive with pyzipper when the backup is
+    encrypted (and pyzipper is installed) and sets the password. Streaming
+    AES-GCM archives are recognised by their header and decrypted on the fly.
+    s3:// archives are read through `s3` (an S3Storage) with ranged GETs.
+    """
+    def open_raw(archive_path):
+        return s3.open(archive_path) if is_s3_url(archive_path) else open_local(archive_path)
+
+    if is_stream_encrypted(path, open_raw):
+        is_encrypted = True
+    else:
+        with open_raw(path) as f, zipfile.ZipFile(f, 'r') as zip_ref:
+            is_encrypted = any(info.flag_bits & 0x1 for info in zip_ref.infolist())
+    zip_class = zipfile.ZipFile
+    if is_encrypted:
+        try:
+            import pyzipper
+            zip_class = pyzipper.AESZipFile
+        except ImportError:
+            pass
+
+    def open_archive(archive_path):
+        # Archives of an incremental chain may be encrypted either way
+        if is_stream_encrypted(archive_path, open_raw):
+            return DecryptedZipFile(archive_path, password, open_raw)
+        zip_ref = S3ZipFile(s3, archive_path) if is_s3_url(archive_path) else zip_class(archive_path, 'r')
+        if password:
+            zip_ref.setpassword(password.encode('utf-8'))
+        return zip_ref
+    return open_archive, is_encrypted
+
+def verify_member(zip_ref, info, entry, chunk_size):
+    """Decompress one member and compare it with its manifest entry, returns an error or None
+
+    Without a manifest entry only the CRC is checked (zipfile raises on mismatch).
+    """
+    try:
+        with zip_ref.open(info) as f:
+            _, digests, size = hash_stream(f, chunk_size)
+    except (zipfile.BadZipFile, RuntimeError, OSError, zlib.error, ValueError) as e:
+        return f"{info.filename}: {e}"
+    if entry is not None:
+        if size != entry['size']:
+            return f"{info.filename}: size {size} does not match manifest ({entry['size']})"
+        if digests != entry['sha256']:
+            return f"{info.filename}: SHA-256 does not match manifest"
+    return None
+
+class ArchiveHandles:
+    """Archive handles opened per worker thread, so threads never share a file position"""
+
+    def __init__(self, open_archive):
+        self.open_archive = open_archive
+        self.thread_state = local()
+        self.handles = []
+        self.lock = Lock()
+
+    def get(self, archive_path):
+        if not hasattr(self.thread_state, 'handles'):
+            self.thread_state.handles = {}
+        if archive_path not in self.thread_state.handles:
+            zip_ref = self.open_archive(archive_path)
+            self.thread_state.handles[archive_path] = zip_ref
+            with self.lock:
+                self.handles.append(zip_ref)
+        return self.thread_state.handles[archive_path]
+
+    def close(self):
+        with self.lock:
+            for zip_ref in self.handles:
+                zip_ref.close()
+            self.handles = []
+
+def batch_members(items, size_of):
+    """Group items into batches of about RESTORE_BATCH_BYTES / RESTORE_BATCH_FILES"""
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        if batch and (batch_bytes >= RESTORE_BATCH_BYTES or len(batch) >= RESTORE_BATCH_FILES):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += size_of(item)
+    if batch:
+        yield batch
+
+def run_batches(function, batches, workers):
+    """Run function(batch) on a thread pool, cancelling the rest if one raises"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(function, batch) for batch in batches]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+class RestorePlan:
+    """Files and folders a restore will write, built from each archive's central directory"""
+
+    def __init__(self, dest_root):
+        self.dest_root = os.path.abspath(dest_root)
+        self.files = []
+        self.dirs = set()
+        self.total_bytes = 0
+
+    def target_path(self, name):
+        """Map an archive path under dest_root, refusing absolute paths and '..'"""
+        parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+        if not parts or '..' in parts or name.startswith('/') or ':' in parts[0]:
+            raise BackupError(f"Refusing to extract unsafe path from backup: {name}")
+        return os.path.join(self.dest_root, *parts)
+
+    def add_archive(self, archive_path, infolist, index_name, members=None):
+        """Plan the .dat file and index folder members of one archive
+
+        members limits the plan to those names (from an incremental manifest).
+        """
+        wanted = set(members) if members is not None else None
+        dat_name = f"{index_name}.dat"
+        prefix = f"{index_name}/"
+        for info in infolist:
+            name = info.filename
+            if wanted is not None:
+                if name not in wanted:
+                    continue
+            elif name != dat_name and not name.startswith(prefix):
+                continue
+            target = self.target_path(name)
+            if info.is_dir():
+                self.dirs.add(target)
+                continue
+            self.dirs.add(os.path.dirname(target))
+            self.files.append((archive_path, info, target))
+            self.total_bytes += info.file_size
+
+    def add_dirs(self, arcnames):
+        for arcname in arcnames:
+            self.dirs.add(self.target_path(arcname))
+
+    def create_dirs(self):
+        """Create every target folder up front, so workers only write files"""
+        for folder in sorted(self.dirs):
+            os.makedirs(folder, exist_ok=True)
+
+    def has_dat(self, index_name):
+        return any(info.filename == f"{index_name}.dat" for _, info, _ in self.files)
+
+    def folder_files(self, index_name):
+        return sum(1 for _, info, _ in self.files if info.filename.startswith(f"{index_name}/"))
+
+    def extract(self, open_archive, workers=RESTORE_WORKERS, progress=None):
+        """Extract all planned files on a thread pool
+
+        open_archive(path) must return an open zipfile/pyzipper handle with the
+        password set; every worker thread opens its own handle per archive.
+        """
+        handles = ArchiveHandles(open_archive)
+
+        def extract_batch(batch):
+            for archive_path, info, target in batch:
+                with handles.get(archive_path).open(info) as source, open(target, 'wb') as dest:
+                    shutil.copyfileobj(source, dest, 1024 * 1024)
+                if progress:
+                    progress.update(advance=info.file_size)
+
+        try:
+            run_batches(extract_batch, batch_members(self.files, lambda item: item[1].file_size), workers)
+        finally:
+            handles.close()
+
+# Streaming backups: one index as a tar through zstd (gzip without zstandard), for pipes and tape
+STREAM_SUFFIXES = {'zstd': '.tar.zst', 'gzip': '.tar.gz'}
+STREAM_HEADER_NAME = "backup_stream.json"
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_LEVEL = 3
+# journal.gz is already compressed, so gzip only pays off on tsidx and metadata at a fast level
+GZIP_STREAM_LEVEL = 1
+STREAM_COPY_SIZE = 1024 * 1024
+
+def load_zstandard():
+    """Return the zstandard module, or None if it isn't installed"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def is_stream_backup(path):
+    """True for '-' (stdin), a named pipe or a .tar.zst/.tar.gz backup file (.aes when encrypted)"""
+    if path == '-':
+        return True
+    name = path[:-len('.aes')] if path.endswith('.aes') else path
+    if name.endswith(tuple(STREAM_SUFFIXES.values())):
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+@contextlib.contextmanager
+def open_backup_stream(path):
+    """Open a streaming backup for reading: '-' is stdin (left open), anything else a file or named pipe"""
+    if path == '-':
+        yield sys.stdin.buffer
+    else:
+        with open(path, 'rb') as f:
+            yield f
+
+class ChunkHasher:
+    """hash_stream for data arriving in pieces: crc32 and a SHA-256 per chunk_size bytes"""
+
+    def __init__(self, chunk_size=COMPRESS_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.crc = 0
+        self.size = 0
+        self.digests = []
+        self.sha = hashlib.sha256()
+        self.pending = 0
+
+    def update(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.chunk_size - self.pending)
+            self.sha.update(view[:take])
+            self.pending += take
+            view = view[take:]
+            if self.pending == self.chunk_size:
+                self.digests.append(self.sha.hexdigest())
+                self.sha = hashlib.sha256()
+                self.pending = 0
+
+    def result(self):
+        """(crc32, [sha256 per chunk], size), the same as hash_stream over all the data"""
+        digests = list(self.digests)
+        if self.pending or not digests:
+            digests.append(self.sha.hexdigest())
+        return self.crc, digests, self.size
+
+class HashingReader:
+    """Read the first `size` bytes of a file for tarfile, hashing them on the way
+
+    Reads wait for `throttle` (an IOThrottle) when one is given and report
+    how long they took to it.
+    """
+
+    def __init__(self, fp, size, chunk_size=COMPRESS_CHUNK_SIZE, throttle=None):
+        self.fp = fp
+        self.remaining = size
+        self.hasher = ChunkHasher(chunk_size)
+        self.throttle = throttle
+        self.throttle_seconds = 0.0
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if self.throttle:
+            self.throttle_seconds += self.throttle.acquire(size)
+            started = time.perf_counter()
+            data = self.fp.read(size)
+            self.throttle.observe(len(data), time.perf_counter() - started)
+        else:
+            data = self.fp.read(size)
+        self.remaining -= len(data)
+        self.hasher.update(data)
+        return data
+
+class CountingWriter:
+    """Pass writes through to fileobj, counting bytes and the time spent writing"""
+
+    def __init__(self, fileobj):
+        self.fp = fileobj
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def write(self, data):
+        started = time.perf_counter()
+        self.fp.write(data)
+        self.seconds += time.perf_counter() - started
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        self.fp.flush()
+
+class PrefixedStream(io.RawIOBase):
+    """Reader giving back bytes already taken from fp before the rest of it, to sniff a pipe"""
+
+    def __init__(self, prefix, fp):
+        self.prefix = prefix
+        self.fp = fp
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            data, self.prefix = self.prefix[:len(buffer)], self.prefix[len(buffer):]
+        else:
+            data = self.fp.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+class DecryptingStream(io.RawIOBase):
+    """Sequential reader of an EncryptingWriter stream, for pipes where DecryptingReader can't seek
+
+    Reads one frame ahead so it knows which frame is the last without the
+    file size; a stream cut at a frame boundary fails authentication.
+    """
+
+    def __init__(self, fp, password):
+        self.fp = fp
+        self.header, self.cipher, self.frame_size, self.invalid_tag = open_encryption_header(fp, password)
+        self.sealed_size = self.frame_size + ENCRYPTION_TAG_SIZE
+        self.frame = 0
+        self.data = b''
+        self.next_sealed = read_full(fp, self.sealed_size)
+        try:
+            self._advance()
+        except BackupError:
+            raise RuntimeError("Bad password for encrypted backup (or the archive is damaged)")
+
+    def _advance(self):
+        sealed = self.next_sealed
+        if not sealed:
+            return False
+        self.next_sealed = read_full(self.fp, self.sealed_size)
+        final = not self.next_sealed
+        try:
+            self.data = self.cipher.decrypt(self.frame.to_bytes(12, 'big'), sealed,
+                                            self.header + (b'\x01' if final else b'\x00'))
+        except self.invalid_tag:
+            raise BackupError(f"Encrypted frame {self.frame} failed authentication "
+                              f"(damaged, or the stream was cut short)")
+        self.frame += 1
+        return True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.data:
+            if not self._advance():
+                return 0
+        data, self.data = self.data[:len(buffer)], self.data[len(buffer):]
+        buffer[:len(data)] = data
+        return len(data)
+
+def sniff_stream(fileobj):
+    """Return (stream, is_encrypted) for a backup stream, the stream still yields the sniffed bytes"""
+    magic = read_full(fileobj, len(ENCRYPTION_MAGIC))
+    return PrefixedStream(magic, fileobj), magic == ENCRYPTION_MAGIC
+
+def open_stream_compressor(fileobj, codec, threads=0):
+    """Wrap fileobj in a zstd or gzip writer; close() ends the stream but leaves fileobj open
+
+    zstd compresses on `threads` threads (0 = all cores), gzip on one.
+    """
+    if codec == 'zstd':
+        zstd = load_zstandard()
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL, threads=threads or -1).stream_writer(fileobj, closefd=False)
+    return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=GZIP_STREAM_LEVEL, mtime=0)
+
+def open_stream_decompressor(fileobj, password=None):
+    """Return (reader, codec) for a backup stream, decrypting it first if it is encrypted"""
+    stream, encrypted = sniff_stream(fileobj)
+    if encrypted:
+        stream = DecryptingStream(stream, password)
+    magic = read_full(stream, len(ZSTD_MAGIC))
+    stream = PrefixedStream(magic, stream)
+    if magic == ZSTD_MAGIC:
+        zstd = load_zstandard()
+        if zstd is None:
+            raise BackupError("Backup stream is zstd compressed, install zstandard: pip install zstandard")
+        return zstd.ZstdDecompressor().stream_reader(stream, closefd=False), 'zstd'
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream, mode='rb'), 'gzip'
+    raise BackupError("Not a streaming backup (expected zstd or gzip data)")
+
+def add_json_member(tar, name, data):
+    payload = json.dumps(data).encode('utf-8')
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = time.time()
+    tar.addfile(info, io.BytesIO(payload))
+
+def read_stream_backup(fileobj, password=None, dest_root=None, progress=None):
+    """Read a streaming backup front to back, returns (header, manifest, {arcname: hashes}, errors)
+
+    Every file is hashed as it is read and, with dest_root, written under it
+    the way RestorePlan lays out an archive. The manifest is the last member
+    of the stream, so the files are only checked against it at the end.
+    Raises RuntimeError for a missing or wrong password.
+    """
+    plan = RestorePlan(dest_root or '.')
+    header = manifest = None
+    seen = {}
+    errors = []
+    created = set()
+    try:
+        reader, _ = open_stream_decompressor(fileobj, password)
+        with reader, tarfile.open(fileobj=reader, mode='r|') as tar:
+            for member in tar:
+                if member.name in (STREAM_HEADER_NAME, MANIFEST_NAME):
+                    data = json.loads(tar.extractfile(member).read().decode('utf-8'))
+                    if member.name == MANIFEST_NAME:
+                        manifest = data
+                        continue
+                    header = data
+                    if progress:
+                        progress.update(total=header.get('bytes'))
+                    continue
+                if header is None:
+                    raise BackupError("Not a streaming backup of an index (no header)")
+                index_name = header['index']
+                if member.name != f"{index_name}.dat" and not member.name.startswith(f"{index_name}/"):
+                    errors.append(f"{member.name}: not part of index {index_name}, skipped")
+                    continue
+                target = plan.target_path(member.name)
+                if member.isdir():
+                    if dest_root:
+                        os.makedirs(target, exist_ok=True)
+                    continue
+                if not member.isfile():
+                    errors.append(f"{member.name}: not a regular file, skipped")
+                    continue
+                folder = os.path.dirname(target)
+                if dest_root and folder not in created:
+                    os.makedirs(folder, exist_ok=True)
+                    created.add(folder)
+                hasher = ChunkHasher(header.get('chunk_size', COMPRESS_CHUNK_SIZE))
+                with tar.extractfile(member) as source, \
+                        (open(target, 'wb') if dest_root else contextlib.nullcontext()) as dest:
+                    while True:
+                        data = source.read(STREAM_COPY_SIZE)
+                        if not data:
+                            break
+                        hasher.update(data)
+                        if dest:
+                            dest.write(data)
+                        if progress:
+                            progress.update(advance=len(data))
+                seen[member.name] = hasher.result()
+    except RuntimeError:
+        raise
+    except Exception as e:
+        errors.append(f"Unable to read backup stream: {e}")
+
+    if header is None:
+        if not errors:
+            errors.append("Not a streaming backup of an index (no header)")
+    elif manifest is None:
+        errors.append("Stream ends before its manifest, it was cut short")
+    else:
+        for arcname, entry in manifest['files'].items():
+            got = seen.get(arcname)
+            if got is None:
+                errors.append(f"{arcname}: missing from stream")
+            elif got[2] != entry['size']:
+                errors.append(f"{arcname}: size {got[2]} does not match manifest ({entry['size']})")
+            elif got[0] != entry['crc'] or got[1] != entry['sha256']:
+                errors.append(f"{arcname}: checksum does not match manifest")
+    return header, manifest, seen, errors
+
+# Backups to S3-compatible object storage (AWS, MinIO...): s3://bucket/prefix as the backup folder
+S3_PART_SIZE = 64 * 1024 * 1024
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PARTS = 10000
+S3_CONCURRENCY = 4
+S3_ATTEMPTS = 5
+# Restore reads archives with ranged GETs: small ones for zip headers, blocks read ahead for file data
+S3_READ_BLOCK = 8 * 1024 * 1024
+S3_READ_AHEAD = 2
+S3_MIN_READ = 64 * 1024
+# Owners of an upload rewrite their marker while uploading; one from another host is stale after S3_LOCK_STALE
+S3_LOCK_REFRESH = 60
+S3_LOCK_STALE = 15 * 60
+
+def is_s3_url(path):
+    return isinstance(path, str) and path.startswith('s3://')
+
+def split_s3_url(url):
+    """'s3://bucket/some/key' -> ('bucket', 'some/key')"""
+    bucket, _, key = url[len('s3://'):].partition('/')
+    return bucket, key
+
+def s3_join(url, name):
+    return f"{url.rstrip('/')}/{name}"
+
+def load_boto3():
+    """Return the boto3 module, or None if it isn't installed"""
+    try:
+        import boto3
+    except ImportError:
+        return None
+    return boto3
+
+def s3_retry(description, call, attempts=S3_ATTEMPTS):
+    """Run call() until it succeeds, backing off exponentially with jitter; raises BackupError at the end
+
+    botocore already retries throttling and 5xx answers, this also covers
+    connections dropped in the middle of a body.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == attempts:
+                raise BackupError(f"{description} failed after {attempts} attempts: {e}")
+            time.sleep(min(30.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random()))
+
+class S3Storage:
+    """S3 client with the settings from config.txt; credentials come from boto3's usual sources"""
+
+    def __init__(self, endpoint_url=None, region=None, part_size=S3_PART_SIZE, concurrency=S3_CONCURRENCY):
+        boto3 = load_boto3()
+        if boto3 is None:
+            raise BackupError("S3 backups need boto3: pip install boto3")
+        from botocore.config import Config
+        self.part_size = max(S3_MIN_PART_SIZE, part_size)
+        self.concurrency = max(1, concurrency)
+        # One pooled connection per upload thread, restore worker and read-ahead
+        self.client = boto3.session.Session().client(
+            's3', endpoint_url=endpoint_url or None, region_name=region or None,
+            config=Config(max_pool_connections=max(10, self.concurrency, RESTORE_WORKERS * (S3_READ_AHEAD + 1)),
+                          retries={'max_attempts': 3, 'mode': 'standard'}))
+
+    def open(self, url):
+        return S3Reader(self.client, url)
+
+    def upload(self, url, total_size=0, resume=None, lock=None):
+        """Start (or with resume=(upload_id, parts) carry on) a multipart upload to url
+
+        The part size grows for objects that would need more than S3_MAX_PARTS
+        parts; a resumed upload keeps the part size it was started with. lock
+        is the S3UploadLock of url, kept fresh while parts go up.
+        """
+        part_size = max(self.part_size, -(-total_size // (S3_MAX_PARTS - 100)))
+        upload_id, uploaded = resume or (None, {})
+        if uploaded:
+            part_size = uploaded[min(uploaded)][1]
+        return S3MultipartUpload(self.client, url, part_size, self.concurrency, upload_id, uploaded, lock)
+
+    def list_uploads(self, folder_url, index_name, suffix='.zip'):
+        """Return the unfinished backup uploads of an index, newest first"""
+        bucket, prefix = split_s3_url(s3_join(folder_url, f"{index_name}_backup_"))
+        # A bucket can hold more unfinished uploads than one listing page (1000)
+        uploads = []
+        for page in self.client.get_paginator('list_multipart_uploads').paginate(Bucket=bucket, Prefix=prefix):
+            uploads.extend(upload for upload in page.get('Uploads', []) if upload['Key'].endswith(suffix))
+        # Keys carry the backup's timestamp, which settles uploads started in the same second
+        uploads.sort(key=lambda upload: (upload['Initiated'], upload['Key']), reverse=True)
+        return [(f"s3://{bucket}/{upload['Key']}", upload['UploadId']) for upload in uploads]
+
+    def find_upload(self, folder_url, index_name):
+        """Return (url, upload_id, {part number: (ETag, size)}, lock) of the newest unfinished plain backup upload
+
+        Uploads another live run owns are skipped; the one returned is locked
+        for this run. Returns None if there is nothing to resume.
+        """
+        for url, upload_id in self.list_uploads(folder_url, index_name):
+            lock = S3UploadLock.acquire(self.client, url)
+            if lock is None:
+                continue
+            bucket, key = split_s3_url(url)
+            parts = {}
+            paginator = self.client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+                for part in page.get('Parts', []):
+                    parts[part['PartNumber']] = (part['ETag'].strip('"'), part['Size'])
+            return url, upload_id, parts, lock
+        return None
+
+    def in_use(self, url):
+        """Whether an object or an unfinished upload already has this key"""
+        bucket, key = split_s3_url(url)
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise BackupError(f"Checking {url} failed: {e}")
+        uploads = self.client.list_multipart_uploads(Bucket=bucket, Prefix=key).get('Uploads', [])
+        return any(upload['Key'] == key for upload in uploads)
+
+    def abort_uploads(self, folder_url, index_name):
+        """Abort the unfinished backup uploads of an index no live run owns, returns how many
+
+        Their parts are billed until aborted and a new backup replaces them.
+        """
+        aborted = 0
+        for url, upload_id in self.list_uploads(folder_url, index_name, suffix=''):
+            lock = S3UploadLock.acquire(self.client, url)
+            if lock is None:
+                continue
+            bucket, key = split_s3_url(url)
+            try:
+                s3_retry(f"Aborting upload of {url}", lambda: self.client.abort_multipart_upload(
+                    Bucket=bucket, Key=key, UploadId=upload_id))
+                aborted += 1
+            finally:
+                lock.release()
+        return aborted
+
+class S3UploadLock:
+    """Marker object <key>.lock/<hostname>:<pid>:<token> owning an unfinished upload
+
+    S3 has no locks, so a run writes its marker and then lists the markers
+    of the key: if another live owner shows up it deletes its own and leaves
+    the upload alone. Two runs racing for an upload can both back off, but
+    never both win; each tries once more after a random pause, so usually
+    one of them does. An owner on this host is live while its process is, one
+    on another host while it rewrites its marker (see S3_LOCK_STALE).
+    """
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.refreshed = 0.0
+
+    @staticmethod
+    def prefix_for(key):
+        return key + LOCK_SUFFIX + '/'
+
+    @classmethod
+    def acquire(cls, client, url):
+        """Take the lock of an upload, returns the S3UploadLock or None if another live run owns it"""
+        bucket, key = split_s3_url(url)
+        prefix = cls.prefix_for(key)
+        owner = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+        lock = cls(client, bucket, prefix + owner)
+        for attempt in range(2):
+            if attempt:
+                time.sleep(0.1 + random.random())
+            lock.refresh()
+            if not lock.contended(prefix):
+                return lock
+            lock.release()
+        return None
+
+    def contended(self, prefix):
+        """Whether another live owner has a marker under prefix; removes those of runs that died"""
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            for marker in page.get('Contents', []):
+                if marker['Key'] == self.key:
+                    continue
+                if self.owner_alive(marker['Key'][len(prefix):], marker['LastModified']):
+                    return True
+                S3UploadLock(self.client, self.bucket, marker['Key']).release()
+        return False
+
+    @staticmethod
+    def owner_alive(owner, last_modified):
+        # The token tells apart two runs (job worker threads) of one process
+        host, pid = (owner.split(':') + ['', ''])[:2]
+        if host == socket.gethostname() and pid.isdigit():
+            return process_alive(int(pid))
+        return time.time() - last_modified.timestamp() < S3_LOCK_STALE
+
+    def refresh(self):
+        s3_retry(f"Writing lock s3://{self.bucket}/{self.key}", lambda: self.client.put_object(
+            Bucket=self.bucket, Key=self.key, Body=b''))
+        self.refreshed = time.monotonic()
+
+    def refresh_due(self):
+        return time.monotonic() - self.refreshed >= S3_LOCK_REFRESH
+
+    def release(self):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self.key)
+        except Exception:
+            pass
+
+class S3MultipartUpload:
+    """File-like object uploading what is written to it as the parts of an S3 multipart upload
+
+    Parts are uploaded on `concurrency` threads and write() blocks while that
+    many are in flight, so no more than concurrency + 1 parts are held in
+    memory. Each part is retried with backoff. `uploaded` holds the parts of
+    an interrupted upload: a part whose MD5 matches its ETag is not sent
+    again. Nothing is visible in the bucket until complete(); close() alone
+    leaves the upload open to be resumed.
+    """
+
+    def __init__(self, client, url, part_size, concurrency, upload_id=None, uploaded=None, lock=None):
+        self.client = client
+        self.url = url
+        self.bucket, self.key = split_s3_url(url)
+        self.part_size = part_size
+        if upload_id is None:
+            upload_id = s3_retry(f"Starting upload of {url}", lambda: self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)['UploadId'])
+        self.upload_id = upload_id
+        self.uploaded = uploaded or {}
+        self.lock = lock
+        self.buffer = bytearray()
+        self.number = 0
+        self.parts = {}
+        self.parts_reused = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.futures = []
+        self.slots = Semaphore(concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def write(self, data):
+        self.buffer += data
+        self.bytes += len(data)
+        while len(self.buffer) >= self.part_size:
+            part = bytes(memoryview(self.buffer)[:self.part_size])
+            del self.buffer[:self.part_size]
+            self._submit(part)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _submit(self, data):
+        # Stop feeding parts as soon as one has failed for good
+        for future in self.futures:
+            if future.done() and future.exception():
+                raise future.exception()
+        if self.lock and self.lock.refresh_due():
+            self.lock.refresh()
+        started = time.perf_counter()
+        self.slots.acquire()
+        self.seconds += time.perf_counter() - started
+        self.number += 1
+        future = self.pool.submit(self._upload_part, self.number, data)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+
+    def _upload_part(self, number, data):
+        md5 = hashlib.md5(data).digest()
+        if self.uploaded.get(number) == (md5.hex(), len(data)):
+            self.parts[number] = md5.hex()
+            self.parts_reused += 1
+            return
+        response = s3_retry(f"Upload of part {number} of {self.url}", lambda: self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number,
+            Body=data, ContentMD5=base64.b64encode(md5).decode('ascii')))
+        self.parts[number] = response['ETag'].strip('"')
+
+    def complete(self):
+        """Upload the last part, wait for the others and make the object visible"""
+        if self.buffer or not self.number:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        started = time.perf_counter()
+        for future in self.futures:
+            future.result()
+        self.seconds += time.perf_counter() - started
+        parts = [{'PartNumber': number, 'ETag': f'"{etag}"'} for number, etag in sorted(self.parts.items())]
+        s3_retry(f"Completing upload of {self.url}", lambda: self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts}))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+class S3Reader(io.RawIOBase):
+    """Seekable read-only view of an S3 object, fetched with ranged GETs
+
+    Reads far from the last one (zip headers, the central directory) fetch
+    only what is asked for, at least S3_MIN_READ. Sequential reads fetch
+    S3_READ_BLOCK blocks and keep S3_READ_AHEAD more downloading in the
+    background. Every restore worker opens its own reader, so the members of
+    an archive download in parallel ranges.
+    """
+
+    def __init__(self, client, url, block_size=S3_READ_BLOCK, read_ahead=S3_READ_AHEAD):
+        self.client = client
+        self.url = url
+        self.bucket, self.key = split_s3_url(url)
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.size = s3_retry(f"Reading {url}", lambda: self.client.head_object(
+            Bucket=self.bucket, Key=self.key)['ContentLength'])
+        self.position = 0
+        # Nothing is loaded yet, so the first read doesn't count as sequential
+        self.start = -1
+        self.data = b''
+        self.ahead = {}
+        self.pool = ThreadPoolExecutor(max_workers=read_ahead) if read_ahead else None
+
+    def _get(self, start, length):
+        end = min(self.size, start + length) - 1
+
+        def get():
+            data = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}")['Body'].read()
+            if len(data) != end - start + 1:
+                raise IOError(f"short read, got {len(data)} of {end - start + 1} bytes")
+            return data
+        return s3_retry(f"Reading bytes {start}-{end} of {self.url}", get)
+
+    def _load(self, position, wanted):
+        sequential = position == self.start + len(self.data)
+        future = self.ahead.pop(position, None)
+        if future is not None:
+            self.data = future.result()
+        else:
+            self.data = self._get(position, max(wanted, self.block_size if sequential else S3_MIN_READ))
+        self.start = position
+        # Read-ahead only pays off for sequential reads, drop it after a seek elsewhere
+        for start in [start for start in self.ahead if start < position]:
+            self.ahead.pop(start).cancel()
+        if self.pool and (sequential or future is not None):
+            start = position + len(self.data)
+            for _ in range(self.read_ahead):
+                if start >= self.size:
+                    break
+                if start not in self.ahead:
+                    self.ahead[start] = self.pool.submit(self._get, start, self.block_size)
+                start += self.block_size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = max(0, min(size, self.size - self.position))
+        parts = []
+        while size > 0:
+            offset = self.position - self.start
+            if not 0 <= offset < len(self.data):
+                self._load(self.position, size)
+                offset = 0
+            data = self.data[offset:offset + size]
+            parts.append(data)
+            self.position += len(data)
+            size -= len(data)
+        return b''.join(parts)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.pool:
+            for future in self.ahead.values():
+                future.cancel()
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        super().close()
+
+class S3ZipFile(zipfile.ZipFile):
+    """Read-only ZipFile over an S3 object, closing its reader with it"""
+
+    def __init__(self, s3, url):
+        self.reader = None
+        self.reader = s3.open(url)
+        super().__init__(self.reader, 'r')
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.reader:
+                self.reader.close()
+
+# Jobs run one at a time per worker slot; each backup still compresses on several processes
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 5
+JOB_KINDS = ('backup', 'restore', 'verify')
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week
+
+    Supports *, lists, ranges and steps (e.g. '30 2 * * 1-5', '*/15 * * * *').
+    Like cron, when both day fields are restricted either one matching is enough.
+    """
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELDS)
+        )
+        # 7 is Sunday too
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_text = part.split('/', 1)
+                step = int(step_text)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Cron field '{field}' is outside {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, day):
+        in_month = day.day in self.days
+        in_week = day.isoweekday() % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def next_after(self, timestamp):
+        """Return the first matching minute after timestamp (local time), as a timestamp"""
+        start = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        # Five years covers every valid day/month combination, including 29 February
+        for _ in range(366 * 5):
+            if day.month in self.months and self.day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate.timestamp()
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+class JobQueue:
+    """Backup, restore and verify jobs kept in SQLite, so they outlive the terminal that queued them
+
+    Workers claim the queued job with the highest priority (oldest first) and
+    record progress and results in the same database. Schedules turn into
+    queued jobs when their cron expression comes due.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            worker TEXT,
+            progress_done INTEGER NOT NULL DEFAULT 0,
+            progress_total INTEGER,
+            result TEXT,
+            error TEXT,
+            schedule TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority DESC, id);
+        CREATE TABLE IF NOT EXISTS schedules (
+            name TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            cron TEXT NOT NULL,
+            next_run REAL NOT NULL,
+            last_job INTEGER
+        );
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        with contextlib.closing(self.connect()) as conn:
+            conn.executescript(self.SCHEMA)
+
+    def connect(self):
+        # Autocommit, with explicit BEGIN IMMEDIATE where a read and a write must be atomic
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def execute(self, sql, params=()):
+        with contextlib.closing(self.connect()) as conn:
+            cursor = conn.execute(sql, params)
+            return cursor.fetchall(), cursor.lastrowid, cursor.rowcount
+
+    @staticmethod
+    def job_dict(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def submit(self, kind, params, priority=0, schedule=None):
+        """Queue a job, returns its id"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        _, job_id, _ = self.execute(
+            "INSERT INTO jobs (kind, params, priority, created, schedule) VALUES (?, ?, ?, ?, ?)",
+            (kind, json.dumps(params), priority, time.time(), schedule))
+        return job_id
+
+    def claim(self, worker):
+        """Mark the next queued job as running for worker and return it, or None"""
+        with contextlib.closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started = ?, worker = ? WHERE id = ?",
+                         (time.time(), worker, row['id']))
+            conn.execute("COMMIT")
+        job = self.job_dict(row)
+        job.update(status='running', worker=worker)
+        return job
+
+    def update_progress(self, job_id, done, total):
+        self.execute("UPDATE jobs SET progress_done = ?, progress_total = ? WHERE id = ?",
+                     (int(done), int(total) if total else None, job_id))
+
+    def finish(self, job_id, result=None, error=None):
+        self.execute("UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                     ('failed' if error else 'done', time.time(),
+                      json.dumps(result, default=str) if result is not None else None, error, job_id))
+
+    def cancel(self, job_id):
+        """Cancel a job that hasn't started, returns False if it wasn't queued"""
+        _, _, count = self.execute("UPDATE jobs SET status = 'cancelled', finished = ? "
+                                   "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+        return count == 1
+
+    def get(self, job_id):
+        rows, _, _ = self.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self.job_dict(rows[0]) if rows else None
+
+    def list(self, status=None, limit=50):
+        if status:
+            rows, _, _ = self.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+                                      (status, limit))
+        else:
+            rows, _, _ = self.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [self.job_dict(row) for row in rows]
+
+    def requeue_orphans(self):
+        """Put jobs back in the queue whose worker process on this host is gone"""
+        rows, _, _ = self.execute("SELECT id, worker FROM jobs WHERE status = 'running'")
+        requeued = 0
+        for row in rows:
+            host, _, pid = (row['worker'] or '').rpartition(':')
+            if host != socket.gethostname() or not pid.isdigit() or process_alive(int(pid)):
+                continue
+            _, _, count = self.execute("UPDATE jobs SET status = 'queued', started = NULL, worker = NULL "
+                                       "WHERE id = ? AND status = 'running'", (row['id'],))
+            requeued += count
+        return requeued
+
+    def add_schedule(self, name, kind, params, cron, priority=0):
+        """Create or replace a named schedule, returns its next run time"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        next_run = CronSchedule(cron).next_after(time.time())
+        self.execute("INSERT OR REPLACE INTO schedules (name, kind, params, priority, cron, next_run) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", (name, kind, json.dumps(params), priority, cron, next_run))
+        return next_run
+
+    def remove_schedule(self, name):
+        _, _, count = self.execute("DELETE FROM schedules WHERE name = ?", (name,))
+        return count == 1
+
+    def schedules(self):
+        rows, _, _ = self.execute("SELECT * FROM schedules ORDER BY name")
+        return [dict(row, params=json.loads(row['params'])) for row in rows]
+
+    def enqueue_due(self, now=None):
+        """Queue a job for every schedule that has come due, returns the new job ids"""
+        now = now or time.time()
+        job_ids = []
+        with contextlib.closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for row in conn.execute("SELECT * FROM schedules WHERE next_run <= ?", (now,)).fetchall():
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, params, priority, created, schedule) VALUES (?, ?, ?, ?, ?)",
+                    (row['kind'], row['params'], row['priority'], now, row['name']))
+                # Runs missed while no worker was up collapse into this one
+                next_run = CronSchedule(row['cron']).next_after(now)
+                conn.execute("UPDATE schedules SET next_run = ?, last_job = ? WHERE name = ?",
+                             (next_run, cursor.lastrowid, row['name']))
+                job_ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        return job_ids
+
+def process_alive(pid):
+    """Whether a process with this pid exists on this machine"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+class JobProgress(ProgressIndicator):
+    """Progress indicator that saves progress to the job queue (at most once a second)"""
+
+    def __init__(self, queue, job_id, message, interval=1.0):
+        super().__init__(message, animate=False)
+        self.queue = queue
+        self.job_id = job_id
+        self.save_interval = interval
+        self.saved_at = 0.0
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        if time.time() - self.saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        self.saved_at = time.time()
+        with self.lock:
+            done, total = self.done, self.total
+        try:
+            self.queue.update_progress(self.job_id, done, total)
+        except sqlite3.Error:
+            pass
+
+    def stop(self):
+        self.save()
+
+class JobWorker:
+    """Runs queued jobs on a pool of threads until stopped
+
+    Each loop queues due schedules, then claims jobs while a slot is free.
+    """
+
+    def __init__(self, manager, queue, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.manager = manager
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = {}
+        self.stopping = Event()
+
+    def run_job(self, job):
+        with JobProgress(self.queue, job['id'], f"Job {job['id']}: {job['kind']}") as progress:
+            try:
+                result = self.manager.run_job(job, progress)
+                error = result.get('error') if isinstance(result, dict) else None
+            except Exception as e:
+                result, error = None, str(e)
+        self.queue.finish(job['id'], result, error)
+
+    def run(self, once=False):
+        """Work through the queue; with once=True stop when it is empty"""
+        requeued = self.queue.requeue_orphans()
+        if requeued:
+            self.manager.print_warning(f"Requeued {requeued} job(s) left running by a worker that stopped")
+        while not self.stopping.is_set():
+            self.queue.enqueue_due()
+            for job_id, thread in list(self.running.items()):
+                if not thread.is_alive():
+                    del self.running[job_id]
+            while len(self.running) < self.workers:
+                job = self.queue.claim(self.name)
+                if job is None:
+                    break
+                self.manager.print_info(f"Starting job {job['id']} ({job['kind']})")
+                thread = Thread(target=self.run_job, args=(job,), daemon=True)
+                thread.start()
+                self.running[job['id']] = thread
+            if once and not self.running:
+                break
+            self.stopping.wait(1 if self.running else self.poll_interval)
+
+    def stop(self):
+        self.stopping.set()
+
+class SplunkManager:
+    def __init__(self, interactive=True):
+        """Load config.txt, prompting for anything missing
+
+        With interactive=False nothing is prompted and no dialog is opened:
+        a missing Splunk path or credentials raise ConfigError instead, and
+        SPLUNK_MANAGER_USERNAME / SPLUNK_MANAGER_PASSWORD override config.txt.
+        """
+        self.interactive = interactive
+        self.splunk_path = ""
+        self.username = ""
+        self.password = ""
+        # What config.txt holds; credentials from the environment are used but never saved
+        self.saved_username = ""
+        self.saved_password = ""
+        self.management_url = DEFAULT_MANAGEMENT_URL
+        self.rest_client = None
+        self.use_rest = True
+        self.animate = ANIMATE_PROGRESS
+        self.compression_workers = 0
+        self.compression_policy = {}
+        self.metrics_file = METRICS_FILE
+        self.metrics_textfile = None
+        self.metrics_max_size = METRICS_MAX_SIZE
+        self.encryption_mode = 'stream'
+        self.volume_size = 0
+        self.stream_codec = 'zstd'
+        self.s3_endpoint_url = None
+        self.s3_region = None
+        self.s3_part_size = S3_PART_SIZE
+        self.s3_concurrency = S3_CONCURRENCY
+        self.s3 = None
+        self.throttle_bytes_per_second = 0
+        self.throttle_files_per_second = 0
+        self.throttle_adaptive = True
+        self.low_priority = False
+        self.throttle = None
+        self.throttle_lock = Lock()
+        self.size_cache = IndexSizeCache()
+        self.session_cache = SessionCache()
+        self.index_catalog = IndexCatalog(self.fetch_index_names, self.describe_index)
+        self.load_config()
+        self.metrics = MetricsExporter(self.metrics_file, self.metrics_textfile, parse_size(self.metrics_max_size or 0))
+        if interactive:
+            self.verify_splunk()
+
+    def s3_storage(self):
+        """Return the S3 client for s3:// backup folders, created on first use"""
+        if self.s3 is None:
+            self.s3 = S3Storage(self.s3_endpoint_url, self.s3_region, parse_size(self.s3_part_size),
+                                self.s3_concurrency)
+        return self.s3
+
+    def io_throttle(self):
+        """Return the IOThrottle every backup in this process reads through, None without limits"""
+        with self.throttle_lock:
+            if self.throttle is None:
+                bytes_per_second = parse_size(self.throttle_bytes_per_second or 0)
+                files_per_second = float(self.throttle_files_per_second or 0)
+                if not bytes_per_second and not files_per_second:
+                    return None
+                self.throttle = IOThrottle(bytes_per_second, files_per_second, self.throttle_adaptive)
+            return self.throttle
+
+    def archive_opener(self, path, password=None):
+        """archive_opener with this manager's S3 settings for s3:// archives"""
+        return archive_opener(path, password, self.s3_storage() if is_s3_url(path) else None)
+
+    def open_raw(self, path):
+        """Open a backup file, or an s3:// object, for reading"""
+        return self.s3_storage().open(path) if is_s3_url(path) else open_local(path)
+
+    def progress(self, message, total=None, unit=None):
+        """Return a progress indicator for an operation, use it as a context manager"""
+        return ProgressIndicator(message, total, animate=self.animate, unit=unit)
+
+    def print_success(self, message):
+        print(f"{Style.GREEN}{Style.SUCCESS} {message}{Style.END}")
+
+    def print_error(self, message):
+        print(f"{Style.RED}{Style.ERROR} {message}{Style.END}")
+
+    def print_warning(self, message):
+        print(f"{Style.YELLOW}{Style.WARNING} {message}{Style.END}")
+
+    def print_info(self, message):
+        print(f"{Style.BLUE}{Style.INFO} {message}{Style.END}")
+
+    def print_divider(self):
+        print(f"{Style.BLUE}{Style.DIVIDER}{Style.END}")
+
+    def load_config(self):
+        """Load configuration from file or prompt user for input"""
+        if os.path.exists(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    config = json.load(f)
+                    self.splunk_path = config.get('splunk_path', '')
+                    self.saved_username = config.get('username', '')
+                    self.saved_password = config.get('password', '')
+                    self.management_url = config.get('management_url', DEFAULT_MANAGEMENT_URL)
+                    self.compression_workers = config.get('compression_workers', 0)
+                    self.compression_policy = config.get('compression_policy', {})
+                    self.metrics_file = config.get('metrics_file', METRICS_FILE)
+                    self.metrics_textfile = config.get('metrics_textfile')
+                    self.metrics_max_size = config.get('metrics_max_size', METRICS_MAX_SIZE)
+                    self.encryption_mode = config.get('encryption_mode', 'stream')
+                    self.volume_size = config.get('volume_size', 0)
+                    self.stream_codec = config.get('stream_codec', 'zstd')
+                    self.s3_endpoint_url = config.get('s3_endpoint_url')
+                    self.s3_region = config.get('s3_region')
+                    self.s3_part_size = config.get('s3_part_size', S3_PART_SIZE)
+                    self.s3_concurrency = config.get('s3_concurrency', S3_CONCURRENCY)
+                    self.throttle_bytes_per_second = config.get('throttle_bytes_per_second', 0)
+                    self.throttle_files_per_second = config.get('throttle_files_per_second', 0)
+                    self.throttle_adaptive = config.get('throttle_adaptive', True)
+                    self.low_priority = config.get('low_priority', False)
+            except:
+                # Config file is corrupted, we'll recreate it
+                pass
+        
+        self.username = os.environ.get('SPLUNK_MANAGER_USERNAME', self.saved_username)
+        self.password = os.environ.get('SPLUNK_MANAGER_PASSWORD', self.saved_password)
+        if not self.interactive:
+            if not self.splunk_path or not os.path.exists(self.splunk_path):
+                raise ConfigError(f"Splunk binary not found, set splunk_path in {CONFIG_FILE}")
+            if not self.username or not self.password:
+                raise ConfigError(f"Splunk credentials missing from {CONFIG_FILE} "
+                                  "(or SPLUNK_MANAGER_USERNAME / SPLUNK_MANAGER_PASSWORD)")
+            return
+
+        # If Splunk path isn't set or doesn't exist, prompt user
+        if not self.splunk_path or not os.path.exists(self.splunk_path):
+            self.prompt_splunk_path()
+            
+        # If credentials aren't set, prompt user
+        if not self.username or not self.password:
+            self.prompt_credentials()
+            
+        self.save_config()
+        
+    def prompt_splunk_path(self):
+        """Prompt user for Splunk binary path"""
+        from tkinter import Tk, filedialog, messagebox
+        root = Tk()
+        root.withdraw()
+        
+        # Try to find Splunk binary in common locations
+        for path in DEFAULT_SPLUNK_PATHS:
+            if os.path.exists(path):
+                use_default = messagebox.askyesno(
+                    "Splunk Path Found",
+                    f"Splunk binary found at {path}. Use this location?"
+                )
+                if use_default:
+                    self.splunk_path = path
+                    root.destroy()
+                    return
+        
+        # If not found in common locations, ask user
+        messagebox.showinfo(
+            "Splunk Path",
+            "Please select the Splunk binary (splunk or splunk.exe)"
+        )
+        self.splunk_path = filedialog.askopenfilename(
+            title="Select Splunk binary"
+        )
+        root.destroy()
+        
+    def prompt_credentials(self):
+        """Prompt user for Splunk credentials"""
+        print(f"\n{Style.YELLOW}🔑 Splunk Credentials Required{Style.END}")
+        self.username = input(f"{Style.PROMPT} Enter Splunk username: ")
+        self.password = getpass.getpass(f"{Style.PROMPT} Enter Splunk password: ")
+        self.saved_username = self.username
+        self.saved_password = self.password
+        
+    def save_config(self):
+        """Save configuration to file"""
+        with open(CONFIG_FILE, 'w') as f:
+            json.dump({
+                'splunk_path': self.splunk_path,
+                'username': self.saved_username,
+                'password': self.saved_password,
+                'management_url': self.management_url,
+                'compression_workers': self.compression_workers,
+                'compression_policy': self.compression_policy,
+                'metrics_file': self.metrics_file,
+                'metrics_textfile': self.metrics_textfile,
+                'metrics_max_size': self.metrics_max_size,
+                'encryption_mode': self.encryption_mode,
+                'volume_size': self.volume_size,
+                'stream_codec': self.stream_codec,
+                's3_endpoint_url': self.s3_endpoint_url,
+                's3_region': self.s3_region,
+                's3_part_size': self.s3_part_size,
+                's3_concurrency': self.s3_concurrency,
+                'throttle_bytes_per_second': self.throttle_bytes_per_second,
+                'throttle_files_per_second': self.throttle_files_per_second,
+                'throttle_adaptive': self.throttle_adaptive,
+                'low_priority': self.low_priority
+            }, f)
+            
+    def verify_splunk(self):
+        """Verify Splunk binary and credentials work, prompting until they do
+
+        Uses the management API with the cached session key when there is one,
+        so a normal start doesn't log in at all. Falls back to `splunk login`
+        when splunkd's management port can't be reached.
+        """
+        while True:
+            if not os.path.exists(self.splunk_path):
+                self.print_error("Splunk binary not found at specified path.")
+                self.prompt_splunk_path()
+                self.save_config()
+                continue
+
+            try:
+                with self.progress("Verifying Splunk connection..."):
+                    login_failed = not self.check_credentials()
+            except Exception as e:
+                self.print_error(f"Error testing Splunk connection: {e}")
+                self.prompt_splunk_path()
+                self.save_config()
+                continue
+
+            if login_failed:
+                self.print_error("Login failed with provided credentials.")
+                self.prompt_credentials()
+                self.save_config()
+                self.reset_rest_client()
+                continue
+
+            self.print_success("Successfully connected to the local Splunk service! http://127.0.0.1:8000/")
+            print(f"{Style.BLUE}•{Style.END} Using Splunk binary at: {self.splunk_path}")
+            print(f"{Style.BLUE}•{Style.END} Authenticated as user: {self.username}\n")
+            return
+
+    def check_credentials(self):
+        """Return False if Splunk rejects the credentials, raises if Splunk can't be checked"""
+        client = self.get_rest_client()
+        if client:
+            try:
+                client.server_info()
+                return True
+            except SplunkRestError as e:
+                if e.status in (401, 403):
+                    return False
+                if e.status is not None:
+                    raise
+                self.fall_back_to_cli(e)
+
+        result = subprocess.run(
+            [self.splunk_path, 'login', '-auth', f'{self.username}:{self.password}'],
+            capture_output=True,
+            text=True
+        )
+        return "Login failed" not in result.stderr
+
+    def reset_rest_client(self):
+        """Drop the API client, e.g. after the credentials changed"""
+        if self.rest_client:
+            self.rest_client.close()
+            self.rest_client = None
+        self.use_rest = True
+
+    def get_rest_client(self):
+        """Return the management API client, or None once we've fallen back to the CLI"""
+        if not self.use_rest:
+            return None
+        if self.rest_client is None:
+            self.rest_client = SplunkRestClient(self.management_url, self.username, self.password,
+                                                session_cache=self.session_cache)
+        return self.rest_client
+
+    def fall_back_to_cli(self, error):
+        """Stop using the management API for the rest of this session"""
+        if not self.use_rest:
+            return
+        self.print_warning(f"Splunk management API unavailable ({error}), using the splunk CLI instead")
+        self.use_rest = False
+        if self.rest_client:
+            self.rest_client.close()
+            self.rest_client = None
+
+    def run_splunk_command(self, command):
+        """Run a Splunk CLI command with suppressed SSL warnings"""
+        full_cmd = [self.splunk_path] + command
+        try:
+            with Metrics.timed('cli'):
+                result = subprocess.run(
+                    full_cmd,
+                    capture_output=True,
+                    text=True,
+                    shell=True if os.name == 'nt' else False,
+                    env={**os.environ, 'SPLUNK_CLI_SERVER_CERT_VERIFY': '0'}  # Suppress SSL warning
+                )
+            # Filter out SSL warnings
+            filtered_output = '\n'.join(
+                line for line in result.stdout.split('\n') 
+                if 'Server Certificate Hostname Validation' not in line
+            )
+            filtered_errors = '\n'.join(
+                line for line in result.stderr.split('\n') 
+                if 'Server Certificate Hostname Validation' not in line
+            )
+            return filtered_output + filtered_errors
+        except Exception as e:
+            self.print_error(f"Error running Splunk command: {e}")
+            return None
+            
+    @instrumented('create_index', lambda a: {'index': a['index_name']}, lambda result: result[0])
+    def create_index(self, index_name):
+        """Create a new Splunk index"""
+        with self.progress(f"Creating index '{index_name}'..."):
+            return self.splunk_create_index(index_name)
+
+    def splunk_create_index(self, index_name):
+        """Ask Splunk to create an index (REST, else CLI), returns (success, message)"""
+        client = self.get_rest_client()
+        if client:
+            try:
+                created = client.create_index(index_name)
+                self.index_catalog.add(index_name)
+                if not created:
+                    return True, f"Index '{index_name}' already exists."
+                return True, f"Index '{index_name}' created successfully."
+            except SplunkRestError as e:
+                if e.status is not None:
+                    return False, f"Splunk error: {e}"
+                self.fall_back_to_cli(e)
+
+        result = self.run_splunk_command([
+            'add', 'index', index_name,
+            '-auth', f'{self.username}:{self.password}'
+        ])
+        
+        if result is None:
+            return False, "Failed to execute Splunk command"
+            
+        normalized_output = ' '.join(result.lower().split())
+        success_phrases = ['created', 'added', 'already exists', 'index created']
+        
+        if 'already exists' in normalized_output:
+            self.index_catalog.add(index_name)
+            return True, f"Index '{index_name}' already exists."
+        if any(phrase in normalized_output for phrase in success_phrases):
+            self.index_catalog.add(index_name)
+            return True, f"Index '{index_name}' created successfully."
+        elif "error" in normalized_output or "failed" in normalized_output:
+            return False, f"Splunk error: {result.strip()}"
+            
+        return False, f"Unexpected response: {result.strip()}"
+
+    @instrumented('create_indexes', succeeded=lambda results: all(r['success'] for r in results))
+    def create_indexes(self, index_names, concurrency=None):
+        """Create many indexes, sending a bounded number of Splunk calls at once
+
+        Returns one {'index', 'success', 'message'} dict per name, in order.
+        """
+        return self.run_bulk(self.splunk_create_index, index_names, "Creating", concurrency)
+
+    def run_bulk(self, action, index_names, verb, concurrency=None):
+        """Run action(index_name) -> (success, message) on a thread pool with one progress bar"""
+        names = list(dict.fromkeys(name.strip() for name in index_names if name.strip()))
+        results = {}
+        if not names:
+            return []
+        concurrency = max(1, min(concurrency or BULK_INDEX_CONCURRENCY, len(names)))
+        metrics = Metrics.current()
+
+        def run(name):
+            # Attribute the REST/CLI time of the pool threads to the calling operation
+            if metrics is None:
+                return action(name)
+            with metrics.bound():
+                return action(name)
+
+        with self.progress(f"{verb} {len(names)} indexes...", len(names)) as progress, \
+                ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(run, name): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    success, message = False, str(e)
+                results[name] = {'index': name, 'success': success, 'message': message}
+                progress.update(advance=1)
+        if metrics is not None:
+            metrics.count(indexes=len(names), failed=sum(1 for r in results.values() if not r['success']))
+        return [results[name] for name in names]
+    
+    def get_splunk_db(self):
+        """Return the Splunk DB directory (var/lib/splunk) for the configured binary"""
+        return os.path.join(
+            os.path.dirname(os.path.dirname(self.splunk_path)),
+            'var', 'lib', 'splunk'
+        )
+
+    def get_index_size(self, index_name):
+        """Get the size of an index in bytes"""
+        return self.scan_index_sizes([index_name])[index_name]['bytes']
+
+    def scan_index_sizes(self, index_names, workers=None):
+        """Scan index folders in parallel across indexes and buckets
+
+        Returns {index_name: {'bytes': int, 'files': int, 'buckets': int}}
+        """
+        splunk_db = self.get_splunk_db()
+        results = {
+            name: {'bytes': 0, 'files': 0, 'buckets': 0}
+            for name in index_names
+        }
+
+        with ThreadPoolExecutor(max_workers=workers or SCAN_WORKERS) as pool:
+            # First find the buckets of every index, then scan all of them together
+            unit_futures = {
+                pool.submit(list_scan_units, os.path.join(splunk_db, name)): name
+                for name in index_names
+            }
+            scan_futures = {}
+            for future in as_completed(unit_futures):
+                name = unit_futures[future]
+                buckets, folders, loose_bytes, loose_files = future.result()
+                results[name]['bytes'] += loose_bytes
+                results[name]['files'] += loose_files
+                results[name]['buckets'] = len(buckets)
+                self.size_cache.prune(os.path.join(splunk_db, name), buckets)
+                # Buckets go through the size cache, other folders are always walked
+                for path in buckets:
+                    scan_futures[pool.submit(self.size_cache.scan_bucket, path)] = name
+                for path in folders:
+                    scan_futures[pool.submit(scan_tree, path)] = name
+
+            for future in as_completed(scan_futures):
+                name = scan_futures[future]
+                size, count = future.result()
+                results[name]['bytes'] += size
+                results[name]['files'] += count
+
+        self.size_cache.save()
+        return results
+
+    def invalidate_size_cache(self, index_name=None):
+        """Clear cached bucket sizes for one index or for all indexes"""
+        index_path = os.path.join(self.get_splunk_db(), index_name) if index_name else None
+        return self.size_cache.invalidate(index_path)
+
+    def format_size(self, bytes):
+        """Convert bytes to human-readable format (MB or GB)"""
+        mb = bytes / (1024 * 1024)
+        if mb > 2000:  # More than 2GB
+            return f"{mb / 1024:.1f}GB"
+        return f"{mb:.1f}MB"
+
+    @instrumented('list_indexes')
+    def list_indexes(self, exclude_system=True):
+        """List all indexes with option to exclude system indexes
+
+        Returns a list of {'name', 'bytes', 'files', 'buckets'} dicts
+        """
+        metrics = Metrics.current()
+        names = self.list_index_names(exclude_system)
+        metrics.lap('names')
+
+        # Size every index in one parallel scan
+        with self.progress(f"Measuring {len(names)} indexes..."):
+            sizes = self.scan_index_sizes(names)
+        for name in names:
+            self.index_catalog.update(name, **sizes[name])
+        metrics.lap('scan')
+        metrics.count(indexes=len(names), files=sum(size['files'] for size in sizes.values()),
+                      bytes_in=sum(size['bytes'] for size in sizes.values()))
+        return [dict(name=name, **sizes[name]) for name in names]
+
+    def list_index_names(self, exclude_system=True):
+        """Return index names from Splunk with option to exclude system indexes"""
+        # List of indexes to exclude
+        excluded_indexes = {
+            '_',  # All system indexes starting with underscore
+            'summary',
+            'splunklogger',
+            "main",
+            'history'
+        } if exclude_system else set()
+        
+        return [
+            name for name in self.index_catalog.all_names()
+            if not any(name.lower().startswith(excluded) for excluded in excluded_indexes)
+        ]
+
+    def fetch_index_names(self):
+        """Ask Splunk for every index name, returns None if it couldn't be asked"""
+        result = None
+        client = self.get_rest_client()
+        if client:
+            try:
+                with self.progress("Fetching list of indexes..."):
+                    return client.list_indexes()
+            except SplunkRestError as e:
+                if e.status is not None:
+                    self.print_error(f"Splunk error: {e}")
+                    return None
+                self.fall_back_to_cli(e)
+        with self.progress("Fetching list of indexes..."):
+            result = self.run_splunk_command([
+                'list', 'index',
+                '-auth', f'{self.username}:{self.password}'
+            ])
+        if not result:
+            return None
+        
+        names = []
+        for line in result.split('\n'):
+            line = line.strip()
+            # Skip empty lines and paths
+            if not line or '\\' in line or '/' in line:
+                continue
+            names.append(line)
+        return names
+
+    def describe_index(self, index_name):
+        """Look up an index's indexes.conf paths and size on disk, for the catalog"""
+        details = {'conf_path': None, 'paths': {}}
+        found = IndexesConfEdit(self.indexes_conf_locations()).paths(index_name)
+        if found:
+            details['conf_path'], details['paths'] = found
+        details.update(self.scan_index_sizes([index_name])[index_name])
+        return details
+
+    @instrumented('delete_index', lambda a: {'index': a['index_name']}, lambda result: result[0])
+    def delete_index(self, index_name):
+        """Delete a Splunk index and remove its configuration from indexes.conf"""
+        with self.progress(f"Deleting index '{index_name}'..."):
+            success, message = self.splunk_remove_index(index_name)
+        if not success:
+            return False, message
+
+        # Now remove from indexes.conf
+        conf_updated = self.remove_index_from_conf(index_name)
+        if conf_updated:
+            return True, f"Index '{index_name}' deleted successfully and removed from indexes.conf"
+        else:
+            return True, (f"Index '{index_name}' deleted successfully but could not update indexes.conf\n"
+                         f"You may need to manually remove the [{index_name}] section")
+
+    def splunk_remove_index(self, index_name):
+        """Ask Splunk to remove an index (REST, else CLI), returns (success, message)"""
+        result = None
+        client = self.get_rest_client()
+        if client:
+            try:
+                client.remove_index(index_name)
+                # Reuse the CLI success handling below
+                result = f"Index '{index_name}' removed"
+            except SplunkRestError as e:
+                if e.status is not None:
+                    return False, f"Splunk error: {e}"
+                self.fall_back_to_cli(e)
+        if result is None:
+            result = self.run_splunk_command([
+                'remove', 'index', index_name,
+                '-auth', f'{self.username}:{self.password}'
+            ])
+        
+        if result is None:
+            return False, "Failed to execute Splunk command"
+            
+        normalized_output = ' '.join(result.lower().split())
+        success_phrases = ['removed', 'deleted', 'removal of index', 'successfully']
+        windows_success_phrases = ['admin handler not found']
+        
+        # Check if deletion was successful
+        if (any(phrase in normalized_output for phrase in success_phrases) or 
+            (os.name == 'nt' and any(phrase in normalized_output for phrase in windows_success_phrases))):
+            self.index_catalog.discard(index_name)
+            return True, f"Index '{index_name}' deleted successfully"
+        elif "error" in normalized_output or "failed" in normalized_output:
+            return False, f"Splunk error: {result.strip()}"
+            
+        return False, f"Unexpected response: {result.strip()}"
+
+    @instrumented('delete_indexes', succeeded=lambda results: all(r['success'] for r in results))
+    def delete_indexes(self, index_names, concurrency=None):
+        """Delete many indexes, then remove all their indexes.conf sections in one write
+
+        Returns one {'index', 'success', 'message'} dict per name, in order.
+        """
+        results = self.run_bulk(self.splunk_remove_index, index_names, "Deleting", concurrency)
+        deleted = [r['index'] for r in results if r['success']]
+        if deleted:
+            changes, _ = self.edit_indexes_conf(remove=deleted)
+            for r in results:
+                if not r['success']:
+                    continue
+                if changes is None:
+                    r['message'] += f" but could not update indexes.conf, remove the [{r['index']}] section manually"
+                else:
+                    r['message'] += " and removed from indexes.conf"
+        return results
+
+    def remove_index_from_conf(self, index_name):
+        """Remove an index section from indexes.conf"""
+        removed, _ = self.edit_indexes_conf(remove=[index_name])
+        if removed is None:
+            self.print_warning(f"Could not update indexes.conf - you'll need to manually remove the [{index_name}] section")
+            return False
+        return True
+
+    def edit_indexes_conf(self, define=None, remove=()):
+        """Apply many index stanza edits to indexes.conf in one pass
+
+        define maps index names to their settings, remove lists index names.
+        Every candidate indexes.conf is read once and each changed file is
+        written once, atomically; etc/system/default is never written.
+        Returns (changes, written paths), or (None, []) if no indexes.conf
+        could be found or written.
+        """
+        conf_locations = self.indexes_conf_locations()
+        default_path = None
+        if not any(os.path.exists(path) and not is_default_conf(path) for path in conf_locations):
+            # If we can't find it, ask the user
+            default_path = self.ask_indexes_conf_path()
+            if default_path:
+                conf_locations = [default_path]
+            elif define and any(os.path.exists(path) for path in conf_locations):
+                # A Splunk install with only the shipped defaults: start etc/system/local/indexes.conf
+                default_path = conf_locations[0]
+            elif define or self.interactive:
+                # Headless removals carry on: there is no local stanza to remove
+                return None, []
+
+        edit = IndexesConfEdit(conf_locations, default_path)
+        try:
+            with Metrics.timed('conf'):
+                for index_name in remove:
+                    edit.remove(index_name)
+                for index_name, settings in (define or {}).items():
+                    edit.define(index_name, settings)
+                written = edit.commit()
+        except (OSError, UnicodeDecodeError) as e:
+            self.print_warning(f"Could not update indexes.conf: {str(e)}")
+            return None, []
+
+        for action, index_name, path in edit.changes:
+            if action == 'remove':
+                self.print_info(f"Removed [{index_name}] section from {path}")
+            self.index_catalog.forget_details(index_name)
+        return edit.changes, written
+
+    def indexes_conf_locations(self):
+        """indexes.conf files to look in, most specific first"""
+        splunk_home = os.path.dirname(os.path.dirname(self.splunk_path))
+        return [
+            os.path.join(splunk_home, 'etc', 'system', 'local', 'indexes.conf'),
+            os.path.join(splunk_home, 'etc', 'apps', 'search', 'local', 'indexes.conf'),
+            os.path.join(splunk_home, 'etc', 'system', 'default', 'indexes.conf')
+        ]
+
+    def ask_indexes_conf_path(self):
+        """Ask the user to pick indexes.conf, returns None when running headless"""
+        if not self.interactive:
+            return None
+        from tkinter import Tk, filedialog, messagebox
+        root = Tk()
+        root.withdraw()
+        messagebox.showinfo(
+            "indexes.conf Location",
+            "Could not automatically find indexes.conf.\n"
+            "It's typically located in:\n"
+            "etc/system/local/ or etc/apps/search/local/"
+        )
+        conf_path = filedialog.askopenfilename(
+            title="Select indexes.conf file",
+            filetypes=[("Config files", "*.conf")]
+        )
+        root.destroy()
+        return conf_path
+
+    def index_exists(self, index_name):
+        """Check if an index exists in Splunk, from the cached catalog"""
+        return index_name in self.index_catalog
+        
+    @instrumented('backup', lambda a: {'index': a['index_name'], 'incremental': a['incremental']})
+    def run_backup(self, index_name, backup_dir, password=None, workers=None, progress=None,
+                   incremental=False, resume=True, volume_size=None):
+        """Create a backup archive of one index without printing, returns a summary dict
+
+        With incremental=True only buckets that are new or changed since the
+        latest backup of the index in backup_dir are stored; the manifest points
+        at the earlier archives for the rest. Raises BackupError if there is
+        nothing to back up or the backup directory can't be created. The bytes
+        to archive are added to `progress`'s total once the index is scanned,
+        and it is advanced as they are written. Phase timings and sizes are
+        exported as a 'backup' metrics record.
+
+        The archive is written as <name>.zip.partial and only renamed once
+        complete. Unencrypted backups keep a checkpoint as buckets are
+        written; with resume=True an interrupted backup of the index in
+        backup_dir carries on from its last checkpoint.
+
+        volume_size (bytes, volume_size from config.txt by default, 0 = one
+        archive) splits the backup into volumes of whole buckets, see
+        write_volumes. Split backups are full backups and are not resumed.
+
+        Index files are read within the throttle_* budget of config.txt
+        (see io_throttle), and with low_priority the compression workers run
+        at a lower CPU and disk priority.
+        """
+        metrics = Metrics.current()
+        throttle = self.io_throttle()
+        splunk_db = self.get_splunk_db()
+        index_folder = os.path.join(splunk_db, index_name)
+        dat_file = os.path.join(splunk_db, f"{index_name}.dat")
+
+        if not os.path.exists(index_folder) and not os.path.exists(dat_file):
+            raise BackupError("No index data found (neither folder nor .dat file exists)")
+
+        # Create backup directory if it doesn't exist
+        s3_target = is_s3_url(backup_dir)
+        if not s3_target and not os.path.exists(backup_dir):
+            try:
+                os.makedirs(backup_dir, exist_ok=True)
+            except OSError as e:
+                raise BackupError(f"Failed to create backup directory: {str(e)}")
+
+        # Streaming AES-GCM keeps the parallel compressor; pyzipper's per-member AES is the fallback
+        stream_encryption = bool(password) and self.encryption_mode == 'stream' and load_aesgcm() is not None
+        suffix = ENCRYPTED_SUFFIX if stream_encryption else '.zip'
+        volume_size = parse_size(self.volume_size or 0) if volume_size is None else volume_size
+        if volume_size:
+            if incremental:
+                raise BackupError("Split volumes can't be combined with incremental backups")
+            if password and not stream_encryption:
+                raise BackupError("Encrypted split backups need streaming encryption, "
+                                  "install cryptography: pip install cryptography")
+            suffix = '.vol001' + suffix
+        if s3_target and (incremental or volume_size):
+            raise BackupError("Backups to S3 are full backups, they can't be incremental or split into volumes")
+        if s3_target and password and not stream_encryption:
+            raise BackupError("Encrypted backups to S3 need streaming encryption, "
+                              "install cryptography: pip install cryptography")
+        zip_filename = self.new_backup_filename(backup_dir, index_name, suffix)
+        checkpoint = None
+        checkpoint_lock = None
+        s3_upload = None
+        if s3_target:
+            # An interrupted upload is carried on by sending only the parts that come out different
+            if resume and not password:
+                s3_upload = self.s3_storage().find_upload(backup_dir, index_name)
+                if s3_upload:
+                    zip_filename, checkpoint_lock = s3_upload[0], s3_upload[3]
+        elif resume and not password and not volume_size:
+            partial_filename, checkpoint, checkpoint_lock = self.find_partial_backup(backup_dir, index_name)
+            if checkpoint:
+                zip_filename = partial_filename
+        # Held for the whole run, so no other run resumes or writes over this archive
+        backup_lock = checkpoint_lock
+        if backup_lock is None:
+            zip_filename, backup_lock = self.claim_backup_filename(backup_dir, index_name, suffix)
+        try:
+            archive_name = os.path.basename(zip_filename)
+            start_time = time.time()
+            result = {
+                'index': index_name,
+                'archive': zip_filename,
+                'has_dat': os.path.exists(dat_file),
+                'base': None,
+                'files': 0,
+                'files_reused': 0,
+                'files_resumed': 0,
+                'bytes_in': 0,
+                'bytes_out': 0,
+                'duration': 0.0,
+                'throughput': 0.0,
+                'encryption': 'Disabled',
+                'volumes': [],
+                'compression': {},
+                'throttle_wait': 0.0,
+                'read_rate': None,
+                'warnings': [],
+                'error': None
+            }
+            policy = CompressionPolicy(**self.compression_policy)
+
+            # Stat the .dat file and index folder once; the scan drives sizing, progress and archive order.
+            # Split backups are scanned a bucket at a time while the volumes are written instead.
+            files, dirs = [], []
+            if not volume_size:
+                scan = scan_index(index_folder, dat_file)
+                files, dirs = scan.files, scan.dirs
+                for bucket_path, (size, count) in scan.buckets.items():
+                    self.size_cache.record(bucket_path, size, count)
+                self.size_cache.save()
+            metrics.lap('scan')
+
+            base_manifest = None
+            if incremental:
+                base_manifest = self.find_backup_base(backup_dir, index_name, password)
+                if base_manifest:
+                    result['base'] = base_manifest['archive']
+                else:
+                    result['warnings'].append("No earlier backup with a manifest found, creating a full backup")
+            if checkpoint and (checkpoint.header.get('incremental') != incremental or
+                               checkpoint.header.get('base') != result['base']):
+                result['warnings'].append(f"Interrupted backup {archive_name} used other settings, starting again")
+                self.discard_partial_backup(zip_filename)
+                checkpoint = None
+                backup_lock.release()
+                zip_filename, backup_lock = self.claim_backup_filename(backup_dir, index_name, suffix)
+                archive_name = os.path.basename(zip_filename)
+                result['archive'] = zip_filename
+            if base_manifest:
+                files_to_store, reused = select_changed_files(files, base_manifest)
+            else:
+                files_to_store, reused = files, {}
+            if s3_upload:
+                result['warnings'].append(f"Resuming interrupted upload of {archive_name}, "
+                                          f"{len(s3_upload[2])} parts already uploaded")
+            if s3_target:
+                # Unfinished uploads no live run owns are never resumed once this one is under way
+                aborted = self.s3_storage().abort_uploads(backup_dir, index_name)
+                if aborted:
+                    result['warnings'].append(f"Aborted {aborted} unfinished upload(s) of earlier backups")
+            if checkpoint:
+                # Files written to the partial archive that changed since (hot buckets) are archived again
+                changed = checkpoint.drop_changed(files_to_store)
+                files_to_store = [item for item in files_to_store if item[1] not in checkpoint.members]
+                result['files_resumed'] = len(checkpoint.members)
+                result['warnings'].append(f"Resuming interrupted backup {archive_name}, "
+                                          f"{len(checkpoint.members)} files already archived")
+                if changed:
+                    result['warnings'].append(f"{len(changed)} archived files changed or were removed since the backup "
+                                              f"was interrupted, they are taken from the index as it is now")
+            if progress:
+                progress.update(add_total=sum(item[2] for item in files_to_store))
+            metrics.lap('plan')
+
+            if password and self.encryption_mode == 'stream' and not stream_encryption:
+                result['warnings'].append("cryptography not available, using slower per-file ZIP encryption")
+                result['warnings'].append("For fast streaming AES-GCM encryption, install cryptography: "
+                                          "pip install cryptography")
+
+            # Try to use pyzipper for AES encryption if password is provided
+            use_pyzipper = False
+            if password and not stream_encryption:
+                try:
+                    import pyzipper
+                    use_pyzipper = True
+                except ImportError:
+                    result['warnings'].append("pyzipper not available, falling back to standard zipfile")
+                    result['warnings'].append("For proper encryption, install pyzipper: pip install pyzipper")
+
+            members = {}
+            partial_filename = zip_filename + PARTIAL_SUFFIX
+            if password and not stream_encryption:
+                if use_pyzipper:
+                    # Use pyzipper with AES encryption
+                    result['encryption'] = 'AES-256'
+                    zipf = pyzipper.AESZipFile(
+                        partial_filename,
+                        'w',
+                        compression=pyzipper.ZIP_DEFLATED,
+                        encryption=pyzipper.WZ_AES
+                    )
+                else:
+                    # Fallback to standard zipfile
+                    result['encryption'] = 'weak'
+                    result['warnings'].append("Using weak ZIP encryption (install pyzipper for AES encryption)")
+                    zipf = zipfile.ZipFile(partial_filename, 'w', zipfile.ZIP_DEFLATED)
+                with zipf:
+                    zipf.setpassword(password.encode('utf-8'))
+                    for file_path, arcname, file_size, *_ in files_to_store:
+                        category, method, level = policy.classify(arcname)
+                        if throttle:
+                            result['throttle_wait'] += throttle.acquire(file_size, 1)
+                        started = time.perf_counter()
+                        # Hash first so the second read by zipf.write comes from the page cache
+                        crc, digests, size = hash_file(file_path)
+                        metrics.add_phase('hash', time.perf_counter() - started)
+                        if throttle:
+                            throttle.observe(size, time.perf_counter() - started)
+                        if category == 'default' and policy.sample and size > policy.sample[0]:
+                            if throttle:
+                                result['throttle_wait'] += throttle.acquire(policy.sample[0])
+                            with open(file_path, 'rb') as f:
+                                if sample_is_incompressible(f.read(policy.sample[0]), policy.sample):
+                                    category, method, level = 'incompressible', zipfile.ZIP_STORED, None
+                        # zipf.write reads the file a second time, which counts against the budget too
+                        if throttle:
+                            result['throttle_wait'] += throttle.acquire(size)
+                        with metrics.phase('encrypt'):
+                            zipf.write(file_path, arcname, compress_type=method, compresslevel=level)
+                        policy.record(category, size, zipf.getinfo(arcname).compress_size,
+                                      time.perf_counter() - started)
+                        members[arcname] = {'size': size, 'crc': crc, 'sha256': digests}
+                        if progress:
+                            progress.update(advance=size)
+                    for arcname, mtime in dirs:
+                        info = zipfile.ZipInfo(arcname + '/', time.localtime(mtime)[:6])
+                        info.external_attr = (0o40755 << 16) | 0x10
+                        zipf.writestr(info, b'')
+                    metrics.lap('archive')
+                    manifest = self.build_backup_manifest(
+                        index_name, archive_name, files, dirs, members, reused, base_manifest
+                    )
+                    zipf.writestr(MANIFEST_NAME, json.dumps(manifest))
+                    metrics.lap('manifest')
+                os.replace(partial_filename, zip_filename)
+            elif volume_size:
+                if stream_encryption:
+                    result['encryption'] = 'AES-256-GCM'
+                workers = workers if workers is not None else self.compression_workers
+                units = self.scan_for_backup(index_folder, dat_file, progress)
+                result['volumes'], result['files'], result['bytes_in'], result['throttle_wait'] = self.write_volumes(
+                    zip_filename, index_name, units, volume_size, workers, policy, progress, password)
+            else:
+                # Deflate on every core and write from a single thread, encrypting the stream if asked
+                workers = workers if workers is not None else self.compression_workers
+                if s3_target:
+                    if stream_encryption:
+                        result['encryption'] = 'AES-256-GCM'
+                    f = self.s3_storage().upload(zip_filename, sum(item[2] for item in files_to_store),
+                                                 s3_upload[1:3] if s3_upload else None, backup_lock)
+                elif checkpoint:
+                    f = open(partial_filename, 'r+b')
+                    f.truncate(checkpoint.offset)
+                    f.seek(checkpoint.offset)
+                elif stream_encryption:
+                    # Encrypted backups are not resumable, the key is only held for this run
+                    result['encryption'] = 'AES-256-GCM'
+                    f = open(partial_filename, 'wb')
+                else:
+                    checkpoint = BackupCheckpoint.create(zip_filename, {
+                        'index': index_name, 'archive': archive_name, 'incremental': incremental,
+                        'base': result['base'], 'created': time.strftime('%Y-%m-%dT%H:%M:%S')
+                    })
+                    f = open(partial_filename, 'wb')
+                with f:
+                    out = EncryptingWriter(f, password) if stream_encryption else f
+                    archive = ParallelArchiveWriter(out, workers=workers, policy=policy, checkpoint=checkpoint,
+                                                    throttle=throttle, low_priority=self.low_priority)
+                    archive.add_files(files_to_store, progress)
+                    for arcname, mtime in dirs:
+                        archive.add_directory(arcname, mtime)
+                    metrics.lap('archive')
+                    metrics.add_phase('compress', archive.compress_seconds)
+                    metrics.add_phase('write', archive.write_seconds)
+                    result['throttle_wait'] = archive.throttle_seconds
+                    manifest = self.build_backup_manifest(
+                        index_name, archive_name, files, dirs, archive.members, reused, base_manifest
+                    )
+                    archive.write_member(MANIFEST_NAME, json.dumps(manifest).encode('utf-8'))
+                    archive.close()
+                    if stream_encryption:
+                        out.finish()
+                        metrics.add_phase('encrypt', out.seconds)
+                    metrics.lap('manifest')
+                    if s3_target:
+                        f.complete()
+                        metrics.add_phase('upload', f.seconds)
+                    else:
+                        os.fsync(f.fileno())
+                # Drop the checkpoint first: a crash in between leaves a .partial, never a .zip that looks unfinished
+                if checkpoint:
+                    checkpoint.remove()
+                if s3_target:
+                    result['bytes_out'] = f.bytes
+                    if f.parts_reused:
+                        result['warnings'].append(f"{f.parts_reused} of {len(f.parts)} parts matched the interrupted "
+                                                  f"upload and were not sent again")
+                else:
+                    os.replace(partial_filename, zip_filename)
+
+            if not volume_size:
+                result['files'] = len(files_to_store)
+                result['bytes_in'] = sum(size for _, _, size, _, _ in files_to_store)
+            result['files_reused'] = len(reused)
+            result['compression'] = policy.report()
+            if throttle:
+                metrics.add_phase('throttle', result['throttle_wait'])
+                result['read_rate'] = throttle.rate
+            if not s3_target:
+                result['bytes_out'] = sum(os.path.getsize(path) for path in result['volumes'] or [zip_filename])
+            result['duration'] = time.time() - start_time
+            result['throughput'] = result['bytes_in'] / result['duration'] if result['duration'] > 0 else 0.0
+            metrics.lap('finalize')
+            metrics.count(files=result['files'], bytes_in=result['bytes_in'], bytes_out=result['bytes_out'])
+            return result
+        finally:
+            if backup_lock:
+                backup_lock.release()
+
+    def scan_for_backup(self, index_folder, dat_file, progress=None):
+        """iter_index_scan that records bucket sizes and grows the progress total as it goes"""
+        for files, dirs, bucket_path in iter_index_scan(index_folder, dat_file):
+            if bucket_path:
+                self.size_cache.record(bucket_path, sum(item[2] for item in files), len(files))
+            if progress:
+                progress.update(add_total=sum(item[2] for item in files))
+            yield files, dirs, bucket_path
+        self.size_cache.save()
+
+    def write_volumes(self, first_filename, index_name, units, volume_size, workers, policy,
+                      progress=None, password=None):
+        """Write a split backup of whole buckets per volume
+
+        Returns (volume paths, files, bytes in, seconds throttled). units are
+        those of iter_index_scan (see scan_for_backup), written as they are
+        scanned and cut into volumes by VolumeSplitter. first_filename is the
+        .vol001 path, the rest are numbered on from it. Every volume is a
+        complete archive with its own central directory and a manifest of just
+        its files, so only one volume's entries are ever held, however big the
+        index. The last volume's manifest also has the count. With a password
+        each volume is stream encrypted.
+        """
+        metrics = Metrics.current()
+        match = VOLUME_NAME.match(os.path.basename(first_filename))
+        stem = os.path.join(os.path.dirname(first_filename), match.group('stem'))
+        splitter = VolumeSplitter(units, volume_size)
+        paths = []
+        file_count = 0
+        bytes_in = 0
+        throttle_seconds = 0.0
+        while not paths or not splitter.done:
+            number = len(paths) + 1
+            zip_filename = volume_filename(stem, number, match.group('suffix'))
+            partial_filename = zip_filename + PARTIAL_SUFFIX
+            with open(partial_filename, 'wb') as f:
+                out = EncryptingWriter(f, password) if password else f
+                archive = ParallelArchiveWriter(out, workers=workers, policy=policy,
+                                                throttle=self.io_throttle(), low_priority=self.low_priority)
+                archive.add_files(splitter.volume_files(), progress)
+                throttle_seconds += archive.throttle_seconds
+                for arcname, mtime in splitter.dirs:
+                    archive.add_directory(arcname, mtime)
+                metrics.lap('archive')
+                metrics.add_phase('compress', archive.compress_seconds)
+                metrics.add_phase('write', archive.write_seconds)
+                manifest = self.build_backup_manifest(
+                    index_name, os.path.basename(zip_filename), splitter.files, splitter.dirs, archive.members, {}, None
+                )
+                manifest['volume'] = {'number': number}
+                if splitter.done:
+                    manifest['volume']['count'] = number
+                archive.write_member(MANIFEST_NAME, json.dumps(manifest).encode('utf-8'))
+                archive.close()
+                if password:
+                    out.finish()
+                    metrics.add_phase('encrypt', out.seconds)
+                metrics.lap('manifest')
+                os.fsync(f.fileno())
+            os.replace(partial_filename, zip_filename)
+            paths.append(zip_filename)
+            file_count += len(splitter.files)
+            bytes_in += sum(item[2] for item in splitter.files)
+        return paths, file_count, bytes_in, throttle_seconds
+
+    @instrumented('stream_backup', lambda a: {'index': a['index_name']})
+    def run_stream_backup(self, index_name, output, password=None, workers=None, progress=None):
+        """Write a full backup of one index as a tar stream, returns a summary dict like run_backup
+
+        output is a writable binary file object (e.g. stdout) or a path: a
+        named pipe is written as is, a folder gets a new <index>_backup_*.tar.zst
+        and a file is written as .partial and renamed once complete. The stream
+        is zstd compressed on `workers` threads (stream_codec in config.txt,
+        gzip when zstandard is missing) and AES-GCM sealed with a password.
+        Files are read within the io_throttle budget.
+        """
+        metrics = Metrics.current()
+        throttle = self.io_throttle()
+        throttle_wait = 0.0
+        splunk_db = self.get_splunk_db()
+        index_folder = os.path.join(splunk_db, index_name)
+        dat_file = os.path.join(splunk_db, f"{index_name}.dat")
+        if not os.path.exists(index_folder) and not os.path.exists(dat_file):
+            raise BackupError("No index data found (neither folder nor .dat file exists)")
+        if password and load_aesgcm() is None:
+            raise BackupError("Encrypted streaming backups need cryptography: pip install cryptography")
+
+        warnings = []
+        codec = self.stream_codec if self.stream_codec in STREAM_SUFFIXES else 'zstd'
+        if codec == 'zstd' and load_zstandard() is None:
+            codec = 'gzip'
+            warnings.append("zstandard not available, compressing the stream with gzip on one core")
+            warnings.append("For faster multi-threaded zstd streams, install zstandard: pip install zstandard")
+        suffix = STREAM_SUFFIXES[codec] + ('.aes' if password else '')
+
+        target = None
+        to_pipe = False
+        if isinstance(output, str):
+            if os.path.isdir(output):
+                output = self.new_backup_filename(output, index_name, suffix)
+            target = output
+            try:
+                to_pipe = stat.S_ISFIFO(os.stat(target).st_mode)
+            except OSError:
+                pass
+            archive_name = os.path.basename(target)
+        else:
+            archive_name = f"{index_name}_backup_{time.strftime('%Y%m%d-%H%M%S')}{suffix}"
+
+        start_time = time.time()
+        scan = scan_index(index_folder, dat_file)
+        files, dirs = scan.files, scan.dirs
+        for bucket_path, (size, count) in scan.buckets.items():
+            self.size_cache.record(bucket_path, size, count)
+        self.size_cache.save()
+        total_bytes = sum(item[2] for item in files)
+        if progress:
+            progress.update(add_total=total_bytes)
+        metrics.lap('scan')
+
+        # A pipe is written in place, a file only appears under its name once complete
+        partial_filename = target + PARTIAL_SUFFIX if target and not to_pipe else target
+        fileobj = open(partial_filename, 'wb') if target else output
+        try:
+            counter = CountingWriter(fileobj)
+            out = EncryptingWriter(counter, password) if password else counter
+            compressor = open_stream_compressor(out, codec, workers if workers is not None else self.compression_workers)
+            members = {}
+            with tarfile.open(fileobj=compressor, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+                tar.copybufsize = STREAM_COPY_SIZE
+                # The header goes first so a restore knows the index and size before any data
+                add_json_member(tar, STREAM_HEADER_NAME, {
+                    'format': MANIFEST_FORMAT, 'index': index_name, 'archive': archive_name,
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'codec': codec,
+                    'files': len(files), 'bytes': total_bytes, 'chunk_size': COMPRESS_CHUNK_SIZE
+                })
+                for arcname, mtime in dirs:
+                    info = tarfile.TarInfo(arcname)
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    info.mtime = mtime
+                    tar.addfile(info)
+                for file_path, arcname, _, mtime, mode in files:
+                    if throttle:
+                        throttle_wait += throttle.acquire(0, 1)
+                    with open(file_path, 'rb') as f:
+                        # Hot buckets grow while we read: store the size the file had when opened
+                        info = tarfile.TarInfo(arcname)
+                        info.size = os.fstat(f.fileno()).st_size
+                        info.mtime = mtime
+                        info.mode = stat.S_IMODE(mode)
+                        reader = HashingReader(f, info.size, throttle=throttle)
+                        tar.addfile(info, reader)
+                    throttle_wait += reader.throttle_seconds
+                    crc, digests, size = reader.hasher.result()
+                    members[arcname] = {'size': size, 'crc': crc, 'sha256': digests}
+                    if progress:
+                        progress.update(advance=size)
+                metrics.lap('archive')
+                manifest = self.build_backup_manifest(index_name, archive_name, files, dirs, members, {}, None)
+                add_json_member(tar, MANIFEST_NAME, manifest)
+            compressor.close()
+            if password:
+                out.finish()
+                metrics.add_phase('encrypt', out.seconds)
+            counter.flush()
+            metrics.add_phase('write', counter.seconds)
+            metrics.lap('manifest')
+            if target and not to_pipe:
+                os.fsync(fileobj.fileno())
+        except BaseException:
+            if target:
+                fileobj.close()
+                if not to_pipe:
+                    os.remove(partial_filename)
+            raise
+        if target:
+            fileobj.close()
+            if not to_pipe:
+                os.replace(partial_filename, target)
+
+        duration = time.time() - start_time
+        result = {
+            'index': index_name,
+            'archive': target or archive_name,
+            'has_dat': os.path.exists(dat_file),
+            'base': None,
+            'files': len(files),
+            'files_reused': 0,
+            'bytes_in': sum(entry['size'] for entry in members.values()),
+            'bytes_out': counter.bytes,
+            'duration': duration,
+            'throughput': 0.0,
+            'encryption': 'AES-256-GCM' if password else 'Disabled',
+            'codec': codec,
+            'throttle_wait': throttle_wait,
+            'read_rate': throttle.rate if throttle else None,
+            'warnings': warnings,
+            'error': None
+        }
+        if throttle:
+            metrics.add_phase('throttle', throttle_wait)
+        result['throughput'] = result['bytes_in'] / duration if duration > 0 else 0.0
+        metrics.lap('finalize')
+        metrics.count(files=result['files'], bytes_in=result['bytes_in'], bytes_out=result['bytes_out'])
+        return result
+
+    def new_backup_filename(self, backup_dir, index_name, suffix='.zip'):
+        """Return an unused <index>_backup_<timestamp>.zip (or other suffix) path in backup_dir"""
+        stem = f"{index_name}_backup_{time.strftime('%Y%m%d-%H%M%S')}"
+        if is_s3_url(backup_dir):
+            return s3_join(backup_dir, f"{stem}{suffix}")
+        zip_filename = os.path.join(backup_dir, f"{stem}{suffix}")
+        counter = 1
+        while any(os.path.exists(zip_filename + extra) for extra in ('', PARTIAL_SUFFIX, LOCK_SUFFIX)):
+            zip_filename = os.path.join(backup_dir, f"{stem}-{counter}{suffix}")
+            counter += 1
+        return zip_filename
+
+    def claim_backup_filename(self, backup_dir, index_name, suffix='.zip'):
+        """Return (zip_filename, lock) of a new backup path, locked for this run"""
+        if is_s3_url(backup_dir):
+            # Runs started in the same second would otherwise upload to the same key
+            storage = self.s3_storage()
+            url = self.new_backup_filename(backup_dir, index_name, suffix)
+            counter = 1
+            while True:
+                lock = S3UploadLock.acquire(storage.client, url)
+                if lock and not storage.in_use(url):
+                    return url, lock
+                if lock:
+                    lock.release()
+                url = self.new_backup_filename(backup_dir, index_name, f"-{counter}{suffix}")
+                counter += 1
+        while True:
+            zip_filename = self.new_backup_filename(backup_dir, index_name, suffix)
+            lock = BackupLock.acquire(zip_filename)
+            if lock is None:
+                continue
+            # Another run may have taken the name and finished with it before we locked
+            if not os.path.exists(zip_filename) and not os.path.exists(zip_filename + PARTIAL_SUFFIX):
+                return zip_filename, lock
+            lock.release()
+
+    def find_partial_backup(self, backup_dir, index_name):
+        """Return (zip_filename, checkpoint, lock) of the newest resumable backup of an index
+
+        Partials another run holds the lock of are still being written and
+        are skipped. Returns (None, None, None) if there is nothing to resume.
+        """
+        prefix = f"{index_name}_backup_"
+        suffix = '.zip' + PARTIAL_SUFFIX
+        try:
+            candidates = sorted(
+                (name for name in os.listdir(backup_dir) if name.startswith(prefix) and name.endswith(suffix)),
+                key=lambda name: os.path.getmtime(os.path.join(backup_dir, name)),
+                reverse=True
+            )
+        except OSError:
+            return None, None, None
+        for name in candidates:
+            zip_filename = os.path.join(backup_dir, name[:-len(PARTIAL_SUFFIX)])
+            lock = BackupLock.acquire(zip_filename)
+            if lock is None:
+                continue
+            # Only load the checkpoint once locked: the owner may have been rewriting it
+            checkpoint = BackupCheckpoint.load(zip_filename)
+            if checkpoint and checkpoint.header.get('index') == index_name:
+                return zip_filename, checkpoint, lock
+            lock.release()
+        return None, None, None
+
+    def discard_partial_backup(self, zip_filename):
+        """Delete an unfinished archive and its checkpoint"""
+        for path in (zip_filename + PARTIAL_SUFFIX, BackupCheckpoint.path_for(zip_filename)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def find_backup_base(self, backup_dir, index_name, password=None):
+        """Return the manifest of the latest readable backup of an index in backup_dir, or None"""
+        prefix = f"{index_name}_backup_"
+        try:
+            candidates = sorted(
+                (name for name in os.listdir(backup_dir)
+                 if name.startswith(prefix) and name.endswith(('.zip', ENCRYPTED_SUFFIX))),
+                key=lambda name: os.path.getmtime(os.path.join(backup_dir, name)),
+                reverse=True
+            )
+        except OSError:
+            return None
+
+        for name in candidates:
+            path = os.path.join(backup_dir, name)
+            try:
+                open_archive, _ = self.archive_opener(path, password)
+                with open_archive(path) as zip_ref:
+                    manifest = read_backup_manifest(zip_ref)
+                if manifest and manifest.get('volume'):
+                    manifest = load_volume_set(path, manifest, open_archive)
+            except Exception:
+                # Unreadable, foreign password or pyzipper/cryptography missing: try an older one
+                continue
+            if manifest and manifest.get('index') == index_name:
+                return manifest
+        return None
+
+    def build_backup_manifest(self, index_name, archive_name, files, dirs, members, reused, base_manifest):
+        """Build the manifest for a backup: every file of the index and the archive holding it"""
+        entries = {}
+        for _, arcname, _, mtime, _ in files:
+            if arcname in reused:
+                entries[arcname] = reused[arcname]
+            else:
+                entries[arcname] = dict(members[arcname], mtime=mtime, archive=archive_name)
+
+        # Only keep the earlier archives that still hold some of the files
+        chain = list(base_manifest.get('chain') or [base_manifest['archive']]) if base_manifest else []
+        chain.append(archive_name)
+        used = {entry['archive'] for entry in entries.values()}
+        return {
+            'format': MANIFEST_FORMAT,
+            'index': index_name,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'archive': archive_name,
+            'base': base_manifest['archive'] if base_manifest else None,
+            'chain': [archive for archive in chain if archive in used or archive == archive_name],
+            'chunk_size': COMPRESS_CHUNK_SIZE,
+            'files': entries,
+            'dirs': [arcname for arcname, _ in dirs]
+        }
+
+    def backup_index(self, index_name, backup_dir, password=None, workers=None, incremental=False,
+                     volume_size=None):
+        """Backup an entire index folder (including empty subfolders) and its .dat file
+
+        Unencrypted backups are compressed on `workers` processes
+        (compression_workers from config.txt, 0 = all cores). With
+        incremental=True only new or changed buckets are stored, with
+        volume_size the backup is split into volumes of about that many bytes.
+        """
+        splunk_db = self.get_splunk_db()
+        
+        # Paths we want to back up
+        index_folder = os.path.join(splunk_db, index_name)
+        dat_file = os.path.join(splunk_db, f"{index_name}.dat")
+
+        print(f"\n{Style.BLUE}📦 Backing up index data from:{Style.END}")
+        if os.path.exists(dat_file):
+            print(f" {Style.BLUE}•{Style.END} DAT file: {dat_file}")
+        print(f" {Style.BLUE}•{Style.END} Index folder: {index_folder}")
+        
+        try:
+            print(f"\n{Style.BLUE}⏳ Creating backup archive...{Style.END}")
+            with self.progress("Archiving index folder...", unit='bytes') as progress:
+                result = self.run_backup(index_name, backup_dir, password, workers, progress, incremental,
+                                         volume_size=volume_size)
+        except BackupError as e:
+            return False, str(e)
+        except Exception as e:
+            return False, f"Backup failed: {str(e)}"
+
+        for warning in result['warnings']:
+            self.print_warning(warning)
+        if result['has_dat']:
+            print(f" {Style.GREEN}✓{Style.END} Added .dat file to backup")
+        print(f"{Style.GREEN}✓{Style.END} Backup completed in {result['duration']:.1f} seconds!")
+        self.print_compression_stats(result['compression'])
+        zip_filename = result['archive']
+            
+        # Check the finished archive against its manifest (and the password, if one was used)
+        verification = self.verify_backup(zip_filename, password)
+        if verification['ok']:
+            if result['encryption'] in ('AES-256', 'AES-256-GCM'):
+                self.print_success(f"Backup successfully encrypted with {result['encryption']}")
+            self.print_success(f"Backup verified: {verification['files']} files match the manifest")
+        else:
+            self.print_warning("Backup verification found problems:")
+            self.print_verify_result(verification)
+            
+        processed_files = result['files'] - result['has_dat']
+        encryption = {'AES-256': 'Enabled (AES-256)', 'AES-256-GCM': 'Enabled (AES-256-GCM, streaming)',
+                      'weak': 'Enabled (weak)'}.get(result['encryption'], 'Disabled')
+        incremental_line = ""
+        if result['volumes']:
+            incremental_line = (f"{Style.BLUE}Volumes:{Style.END} {len(result['volumes'])} "
+                                f"({os.path.basename(result['volumes'][0])} … "
+                                f"{os.path.basename(result['volumes'][-1])})\n")
+        if result['base']:
+            incremental_line = (f"{Style.BLUE}Incremental:{Style.END} based on {result['base']}, "
+                                f"{result['files_reused']} unchanged files not stored again\n")
+        if result['throttle_wait'] >= 1:
+            rate = f", reading at {self.format_size(result['read_rate'])}/s" if result['read_rate'] else ""
+            incremental_line += (f"{Style.BLUE}Throttled:{Style.END} waited {result['throttle_wait']:.1f} "
+                                 f"seconds for the I/O budget{rate}\n")
+        return True, (f"\n{Style.GREEN}Backup completed successfully!{Style.END}\n"
+              f"{Style.BLUE}Location:{Style.END} {zip_filename if is_s3_url(zip_filename) else os.path.normpath(zip_filename)}\n"
+              f"{Style.BLUE}Contents:{Style.END} {'DAT file + ' if result['has_dat'] else ''}{processed_files} files from index folder\n"
+              f"{incremental_line}"
+              f"{Style.BLUE}Encryption:{Style.END} {encryption}")
+
+    def print_compression_stats(self, report):
+        """Print ratio and speed per compression category, to help tune compression_policy"""
+        if not report:
+            return
+        print(f"\n{Style.BOLD}{'Category':<16} {'Files':>8} {'In':>10} {'Out':>10} {'Ratio':>7} {'MB/s':>8}{Style.END}")
+        for category, stats in sorted(report.items()):
+            print(f"{category:<16} {stats['files']:>8} {self.format_size(stats['bytes_in']):>10} "
+                  f"{self.format_size(stats['bytes_out']):>10} {stats['ratio']:>6.0%} {stats['mb_per_second']:>8.1f}")
+
+    def expand_index_patterns(self, patterns):
+        """Turn index names and glob patterns (e.g. case_2024_*) into a list of index names"""
+        names = []
+        known = None
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern:
+                continue
+            if any(c in pattern for c in '*?['):
+                if known is None:
+                    known = self.list_index_names()
+                matches = fnmatch.filter(known, pattern)
+                if not matches:
+                    self.print_warning(f"No indexes match '{pattern}'")
+                names.extend(matches)
+            else:
+                names.append(pattern)
+        # Drop duplicates but keep the order given
+        return list(dict.fromkeys(names))
+
+    def backup_indexes(self, patterns, backup_dir, password=None, concurrency=None, workers=None,
+                       incremental=False, resume=True, volume_size=None):
+        """Back up many indexes into one directory, running a bounded number of backups at once
+
+        Keeps going past indexes that fail. Returns a summary dict with one
+        result per index (bytes in/out, duration, throughput, error).
+        """
+        names = self.expand_index_patterns(patterns)
+        summary = {'results': [], 'succeeded': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0, 'duration': 0.0}
+        if not names:
+            return summary
+
+        concurrency = max(1, min(concurrency or BATCH_BACKUP_CONCURRENCY, len(names)))
+        # Share the compression cores between the backups running at the same time
+        total_workers = workers if workers is not None else self.compression_workers
+        per_backup_workers = max(1, (total_workers or os.cpu_count() or 1) // concurrency)
+
+        start_time = time.time()
+        results = {}
+        # Each backup adds its bytes to the shared total once it has scanned its index
+        with self.progress(f"Backing up {len(names)} indexes...", unit='bytes') as progress, \
+                ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {
+                pool.submit(self.run_backup, name, backup_dir, password, per_backup_workers, progress,
+                            incremental, resume, volume_size): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = {
+                        'index': name, 'archive': None, 'base': None, 'files': 0, 'files_reused': 0,
+                        'bytes_in': 0, 'bytes_out': 0,
+                        'duration': 0.0, 'throughput': 0.0, 'warnings': [], 'error': str(e)
+                    }
+                progress.update(detail=f"({len(results)}/{len(names)} indexes done)")
+
+        summary['results'] = [results[name] for name in names]
+        summary['succeeded'] = sum(1 for r in summary['results'] if not r['error'])
+        summary['failed'] = len(names) - summary['succeeded']
+        summary['bytes_in'] = sum(r['bytes_in'] for r in summary['results'])
+        summary['bytes_out'] = sum(r['bytes_out'] for r in summary['results'])
+        summary['duration'] = time.time() - start_time
+        return summary
+
+    def print_backup_summary(self, summary):
+        """Print the per-index results of a batch backup"""
+        print(f"\n{Style.BOLD}{'Index':<30} {'In':>10} {'Out':>10} {'Time':>8} {'MB/s':>8}  Result{Style.END}")
+        for r in summary['results']:
+            if r['error']:
+                print(f"{r['index']:<30} {'-':>10} {'-':>10} {'-':>8} {'-':>8}  {Style.RED}{Style.ERROR} {r['error']}{Style.END}")
+            else:
+                print(f"{r['index']:<30} {self.format_size(r['bytes_in']):>10} {self.format_size(r['bytes_out']):>10} "
+                      f"{r['duration']:>7.1f}s {r['throughput'] / (1024 * 1024):>8.1f}  {Style.GREEN}{Style.SUCCESS}{Style.END}")
+        self.print_divider()
+        print(f"{summary['succeeded']} succeeded, {summary['failed']} failed in {summary['duration']:.1f} seconds "
+              f"({self.format_size(summary['bytes_in'])} → {self.format_size(summary['bytes_out'])})")
+
+    
+    @instrumented('verify', lambda a: {'index': backup_index_name(a['backup_file']),
+                                       'mode': 'full' if a['full'] else 'quick'},
+                  lambda result: result['ok'])
+    def verify_backup(self, backup_file, password=None, full=False, workers=None, progress=None):
+        """Check a backup against its manifest, returns a result dict with one entry per archive
+
+        The quick check only reads central directories: every file in the
+        manifest must be present with the recorded size and CRC. full=True also
+        decompresses every member on `workers` threads and compares the SHA-256
+        of each chunk. Incremental backups are checked along their whole chain.
+        """
+        metrics = Metrics.current()
+        start_time = time.time()
+        result = {'backup': backup_file, 'mode': 'full' if full else 'quick', 'ok': False,
+                  'archives': [], 'files': 0, 'bytes': 0, 'duration': 0.0, 'throughput': 0.0,
+                  'errors': [], 'warnings': []}
+        manifest = None
+        volumes = None
+        is_encrypted = False
+        if is_stream_backup(backup_file):
+            return self.verify_stream(backup_file, password, result, progress)
+        if is_partial_backup(backup_file):
+            result['errors'].append("Unfinished backup, run the backup again to complete it")
+            result['duration'] = time.time() - start_time
+            return result
+        try:
+            open_archive, is_encrypted = self.archive_opener(backup_file, password)
+            with open_archive(backup_file) as zip_ref:
+                manifest = read_backup_manifest(zip_ref)
+            if manifest and manifest.get('volume'):
+                # Volumes are checked one at a time against their own manifests
+                volumes = volume_paths(backup_file, manifest, open_archive)
+                chain = [(path, None) for path in volumes]
+            elif manifest:
+                chain = plan_restore_chain(backup_file, manifest)
+            else:
+                result['warnings'].append("Backup has no manifest, only CRCs can be checked")
+                chain = [(backup_file, None)]
+        except RuntimeError as e:
+            if is_encrypted and not password:
+                e = "backup is encrypted, a password is needed"
+            result['errors'].append(f"Unable to read backup: {e}")
+            chain = []
+        except Exception as e:
+            result['errors'].append(f"Unable to read backup: {e}")
+            chain = []
+
+        chunk_size = manifest.get('chunk_size', COMPRESS_CHUNK_SIZE) if manifest else COMPRESS_CHUNK_SIZE
+        handles = ArchiveHandles(open_archive) if chain else None
+        metrics.lap('plan')
+        try:
+            for number, (archive_path, members) in enumerate(chain, 1):
+                archive_manifest = manifest
+                if volumes:
+                    try:
+                        archive_manifest = read_volume(archive_path, number, open_archive)
+                    except BackupError as e:
+                        result['errors'].append(str(e))
+                        continue
+                    except Exception as e:
+                        result['errors'].append(f"{os.path.basename(archive_path)}: unable to read manifest: {e}")
+                        continue
+                    members = list(archive_manifest['files'])
+                archive = self.verify_archive(archive_path, members, archive_manifest, handles, chunk_size,
+                                              full, workers, progress)
+                if volumes:
+                    # Only one volume's central directory is held at a time
+                    handles.close()
+                    handles = ArchiveHandles(open_archive)
+                result['archives'].append(archive)
+                result['errors'].extend(f"{os.path.basename(archive_path)}: {error}" for error in archive['errors'])
+                result['files'] += archive['files']
+                result['bytes'] += archive['bytes']
+        finally:
+            if handles:
+                handles.close()
+
+        result['ok'] = not result['errors']
+        result['duration'] = time.time() - start_time
+        if full and result['duration'] > 0:
+            result['throughput'] = result['bytes'] / result['duration']
+        metrics.count(files=result['files'], bytes_in=result['bytes'])
+        return result
+
+    def verify_stream(self, backup_file, password, result, progress=None):
+        """verify_backup for a streaming backup: there is no central directory, so every file is hashed"""
+        metrics = Metrics.current()
+        start_time = time.time()
+        if result['mode'] == 'quick':
+            result['warnings'].append("Streaming backups have no central directory, checked every file")
+        result['mode'] = 'full'
+        try:
+            with open_backup_stream(backup_file) as fileobj:
+                _, _, seen, errors = read_stream_backup(fileobj, password, progress=progress)
+        except (RuntimeError, OSError) as e:
+            seen, errors = {}, [f"Unable to read backup: {e}"]
+        metrics.lap('hash')
+        archive = {'archive': backup_file, 'files': len(seen), 'bytes': sum(size for _, _, size in seen.values()),
+                   'duration': time.time() - start_time, 'throughput': 0.0, 'errors': errors}
+        if archive['duration'] > 0:
+            archive['throughput'] = archive['bytes'] / archive['duration']
+        result['archives'].append(archive)
+        result['errors'].extend(errors)
+        result['files'] = archive['files']
+        result['bytes'] = archive['bytes']
+        result['ok'] = not errors
+        result['duration'] = archive['duration']
+        result['throughput'] = archive['throughput']
+        metrics.count(files=result['files'], bytes_in=result['bytes'])
+        return result
+
+    def verify_archive(self, archive_path, members, manifest, handles, chunk_size, full, workers, progress):
+        """Check the manifest members stored in one archive, see verify_backup"""
+        metrics = Metrics.current()
+        start_time = time.time()
+        archive = {'archive': archive_path, 'files': 0, 'bytes': 0, 'duration': 0.0,
+                   'throughput': 0.0, 'errors': []}
+        try:
+            infos = {info.filename: info for info in handles.get(archive_path).infolist()}
+        except Exception as e:
+            archive['errors'].append(f"unable to read central directory: {e}")
+            return archive
+        metrics.lap('central_directory')
+
+        # Quick check: names, sizes and CRCs from the central directory
+        to_check = []
+        if members is None:
+            to_check = [(info, None) for info in infos.values() if not info.is_dir()]
+        else:
+            for arcname in members:
+                entry = manifest['files'][arcname]
+                info = infos.get(arcname)
+                if info is None:
+                    archive['errors'].append(f"{arcname}: missing from archive")
+                elif info.file_size != entry['size']:
+                    archive['errors'].append(f"{arcname}: size {info.file_size} does not match manifest ({entry['size']})")
+                elif info.CRC != entry['crc']:
+                    archive['errors'].append(f"{arcname}: CRC does not match manifest")
+                else:
+                    to_check.append((info, entry))
+        archive['files'] = len(to_check)
+        metrics.lap('check')
+
+        if full:
+            if progress:
+                progress.update(add_total=sum(info.file_size for info, _ in to_check))
+            errors = []
+
+            def verify_batch(batch):
+                zip_ref = handles.get(archive_path)
+                for info, entry in batch:
+                    error = verify_member(zip_ref, info, entry, chunk_size)
+                    if error:
+                        errors.append(error)
+                    if progress:
+                        progress.update(advance=info.file_size)
+
+            run_batches(verify_batch, batch_members(to_check, lambda item: item[0].file_size),
+                        workers or RESTORE_WORKERS)
+            archive['errors'].extend(sorted(errors))
+            archive['bytes'] = sum(info.file_size for info, _ in to_check)
+            metrics.lap('hash')
+
+        archive['duration'] = time.time() - start_time
+        if full and archive['duration'] > 0:
+            archive['throughput'] = archive['bytes'] / archive['duration']
+        return archive
+
+    def print_verify_result(self, result):
+        """Print per-archive results of verify_backup"""
+        for warning in result['warnings']:
+            self.print_warning(warning)
+        for archive in result['archives']:
+            name = os.path.basename(archive['archive'])
+            status = f"{Style.GREEN}{Style.SUCCESS}{Style.END}" if not archive['errors'] else \
+                f"{Style.RED}{Style.ERROR} {len(archive['errors'])} problem(s){Style.END}"
+            speed = f", {archive['throughput'] / (1024 * 1024):.1f} MB/s" if result['mode'] == 'full' else ""
+            print(f" {Style.BLUE}•{Style.END} {name}: {archive['files']} files in {archive['duration']:.1f}s{speed} {status}")
+        for error in result['errors'][:20]:
+            print(f"   {Style.RED}{error}{Style.END}")
+        if len(result['errors']) > 20:
+            print(f"   {Style.RED}... and {len(result['errors']) - 20} more{Style.END}")
+
+    def run_job(self, job, progress=None):
+        """Run one job from the job queue, returns its result dict ('error' is None on success)"""
+        params = job['params']
+        password = None
+        if params.get('password_env'):
+            password = os.environ.get(params['password_env'])
+            if password is None:
+                raise ConfigError(f"Environment variable {params['password_env']} is not set for the worker")
+
+        if job['kind'] == 'backup':
+            names = self.expand_index_patterns(params['indexes'])
+            if not names:
+                return {'results': [], 'error': "No indexes to back up"}
+            results = []
+            for name in names:
+                try:
+                    result = self.run_backup(name, params['backup_dir'], password, params.get('workers'),
+                                             progress, params.get('incremental', False),
+                                             volume_size=params.get('volume_size'))
+                except Exception as e:
+                    result = {'index': name, 'archive': None, 'error': str(e)}
+                if not result['error']:
+                    verification = self.verify_backup(result['archive'], password)
+                    if not verification['ok']:
+                        result['error'] = f"verification failed: {verification['errors'][0]}"
+                results.append(result)
+            failed = sum(1 for r in results if r['error'])
+            return {'results': results, 'error': f"{failed} of {len(results)} backups failed" if failed else None}
+
+        if job['kind'] == 'restore':
+            success, message = self.restore_backup(params['backup'], params.get('workers'), password)
+            return {'backup': params['backup'], 'message': plain(message),
+                    'error': None if success else plain(message)}
+
+        if job['kind'] == 'verify':
+            result = self.verify_backup(params['backup'], password, params.get('full', False),
+                                        params.get('workers'), progress)
+            result['error'] = None if result['ok'] else f"{len(result['errors'])} problem(s) found"
+            return result
+
+        raise ValueError(f"Unknown job kind '{job['kind']}'")
+
+    @instrumented('restore', lambda a: {'index': backup_index_name(a['backup_file'])},
+                  lambda result: result[0])
+    def restore_backup(self, backup_file, workers=None, password=None):
+        """Restore an index from backup zip file
+
+        The central directory is read once to plan the restore, folders are
+        created up front and files are extracted on `workers` threads, each
+        with its own handle on the archive. The password of an encrypted
+        backup is prompted for unless given. Streaming backups ('-' reads
+        stdin) are handed to restore_stream.
+        """
+        if is_stream_backup(backup_file):
+            return self.restore_stream(backup_file, password)
+        metrics = Metrics.current()
+        splunk_db = self.get_splunk_db()
+        
+        if not is_s3_url(backup_file) and not os.path.exists(backup_file):
+            return False, "Backup file not found"
+        if is_partial_backup(backup_file):
+            return False, "This is an unfinished backup, run the backup again to complete it"
+        
+        print(f"\n{Style.BLUE}♻ Restoring backup from:{Style.END} {backup_file}")
+        print(f"{Style.BLUE}•{Style.END} Target location: {splunk_db}")
+        
+        # Check if the backup is encrypted from its header or central directory
+        try:
+            with self.progress("Preparing to restore backup..."):
+                _, is_encrypted = self.archive_opener(backup_file)
+        except Exception as e:
+            return False, f"Unable to read backup file: {str(e)}"
+        
+        if is_encrypted and password is None:
+            if not self.interactive:
+                return False, "Backup is password protected but no password was given"
+            print(f"\n{Style.YELLOW}🔑 This backup is password protected{Style.END}")
+            password = getpass.getpass(f"{Style.PROMPT} Enter backup password: ")
+        
+        try:
+            # Extract the index name from the backup filename
+            index_name = backup_index_name(backup_file)
+            
+            # Streaming AES-GCM backups are decrypted on the fly, ZIP-encrypted ones need pyzipper for AES
+            if is_encrypted and not is_stream_encrypted(backup_file, self.open_raw):
+                try:
+                    import pyzipper
+                except ImportError:
+                    self.print_warning("pyzipper not available, falling back to standard zipfile for encrypted backup")
+                    self.print_warning("For better compatibility with encrypted backups, install pyzipper: pip install pyzipper")
+            open_archive, _ = self.archive_opener(backup_file, password)
+
+            # Backups with a manifest may be incremental and need earlier archives too
+            first_archive = open_archive(backup_file)
+            with first_archive:
+                manifest = read_backup_manifest(first_archive)
+                if manifest and manifest.get('volume'):
+                    # Volumes are restored one at a time, each from its own manifest
+                    volumes = volume_paths(backup_file, manifest, open_archive)
+                    print(f"{Style.BLUE}•{Style.END} Split backup, restoring from {len(volumes)} volumes")
+                    return self.restore_volumes(volumes, manifest['index'], open_archive, workers)
+                if manifest:
+                    index_name = manifest['index']
+                    chain = plan_restore_chain(backup_file, manifest)
+                    if len(chain) > 1:
+                        print(f"{Style.BLUE}•{Style.END} Incremental backup, restoring from {len(chain)} archives")
+                else:
+                    chain = [(backup_file, None)]
+
+                # One pass over each central directory: what to extract and where. Earlier
+                # increments are opened side by side.
+                def read_infolist(archive_path):
+                    with open_archive(archive_path) as zip_ref:
+                        return zip_ref.infolist()
+
+                others = [archive_path for archive_path, _ in chain if archive_path != backup_file]
+                infolists = {backup_file: first_archive.infolist()}
+                if others:
+                    with ThreadPoolExecutor(max_workers=min(RESTORE_WORKERS, len(others))) as pool:
+                        infolists.update(zip(others, pool.map(read_infolist, others)))
+                plan = RestorePlan(splunk_db)
+                for archive_path, members in chain:
+                    plan.add_archive(archive_path, infolists[archive_path], index_name, members)
+            if manifest:
+                plan.add_dirs(manifest.get('dirs', []))
+
+            plan.create_dirs()
+            metrics.lap('plan')
+            print(f"\n{Style.BLUE}⏳ Restoring {len(plan.files)} files "
+                  f"({self.format_size(plan.total_bytes)}) to {index_name}...{Style.END}")
+            with self.progress("Extracting files...", plan.total_bytes, unit='bytes') as progress:
+                plan.extract(open_archive, workers or RESTORE_WORKERS, progress)
+            metrics.lap('extract')
+            metrics.count(files=len(plan.files), bytes_in=plan.total_bytes)
+
+            if plan.has_dat(index_name):
+                print(f" {Style.GREEN}✓{Style.END} Restored {index_name}.dat to {splunk_db}")
+            print(f" {Style.GREEN}✓{Style.END} Restored {plan.folder_files(index_name)} files to {index_name} folder")
+        except RuntimeError as e:
+            if 'Bad password' in str(e):
+                return False, "Incorrect password provided for encrypted backup"
+            elif 'compression method' in str(e):
+                return False, "Compression method not supported - try installing pyzipper: pip install pyzipper"
+            return False, f"Restore failed: {str(e)}"
+        except Exception as e:
+            return False, f"Restore failed: {str(e)}"
+
+        return self.register_restored_index(index_name)
+
+    def restore_volumes(self, volumes, index_name, open_archive, workers=None):
+        """Restore a split backup a volume at a time, see restore_backup
+
+        Only one volume's manifest and central directory are held at once, so
+        memory doesn't grow with the number of files in the backup.
+        """
+        metrics = Metrics.current()
+        splunk_db = self.get_splunk_db()
+        files = 0
+        folder_files = 0
+        total_bytes = 0
+        has_dat = False
+        metrics.lap('plan')
+        print(f"\n{Style.BLUE}⏳ Restoring {len(volumes)} volumes to {index_name}...{Style.END}")
+        with self.progress("Extracting files...", unit='bytes') as progress:
+            for number, path in enumerate(volumes, 1):
+                with open_archive(path) as zip_ref:
+                    manifest = read_volume(path, number, open_archive, read_backup_manifest(zip_ref))
+                    plan = RestorePlan(splunk_db)
+                    plan.add_archive(path, zip_ref.infolist(), index_name, list(manifest['files']))
+                plan.add_dirs(manifest.get('dirs', []))
+                plan.create_dirs()
+                progress.update(add_total=plan.total_bytes)
+                plan.extract(open_archive, workers or RESTORE_WORKERS, progress)
+                files += len(plan.files)
+                folder_files += plan.folder_files(index_name)
+                total_bytes += plan.total_bytes
+                has_dat = has_dat or plan.has_dat(index_name)
+        metrics.lap('extract')
+        metrics.count(files=files, bytes_in=total_bytes)
+
+        if has_dat:
+            print(f" {Style.GREEN}✓{Style.END} Restored {index_name}.dat to {splunk_db}")
+        print(f" {Style.GREEN}✓{Style.END} Restored {folder_files} files ({self.format_size(total_bytes)}) "
+              f"to {index_name} folder")
+        return self.register_restored_index(index_name)
+
+    def restore_stream(self, source, password=None):
+        """Restore an index from a streaming backup: '-' for stdin, a named pipe or a .tar.zst file
+
+        The stream is extracted as it arrives and every file is hashed; the
+        manifest at its end is checked once everything is written.
+        """
+        metrics = Metrics.current()
+        splunk_db = self.get_splunk_db()
+        if source != '-' and not os.path.exists(source):
+            return False, "Backup file not found"
+
+        print(f"\n{Style.BLUE}♻ Restoring backup stream from:{Style.END} {'standard input' if source == '-' else source}")
+        print(f"{Style.BLUE}•{Style.END} Target location: {splunk_db}")
+        try:
+            with open_backup_stream(source) as fileobj:
+                stream, is_encrypted = sniff_stream(fileobj)
+                if is_encrypted and password is None:
+                    if not self.interactive:
+                        return False, "Backup is password protected but no password was given"
+                    print(f"\n{Style.YELLOW}🔑 This backup is password protected{Style.END}")
+                    password = getpass.getpass(f"{Style.PROMPT} Enter backup password: ")
+                metrics.lap('plan')
+                with self.progress("Extracting files...", unit='bytes') as progress:
+                    header, _, seen, errors = read_stream_backup(stream, password, splunk_db, progress)
+            metrics.lap('extract')
+        except RuntimeError as e:
+            if 'Bad password' in str(e):
+                return False, "Incorrect password provided for encrypted backup"
+            return False, f"Restore failed: {str(e)}"
+        except Exception as e:
+            return False, f"Restore failed: {str(e)}"
+        metrics.count(files=len(seen), bytes_in=sum(size for _, _, size in seen.values()))
+        if errors:
+            more = f" (and {len(errors) - 1} more problems)" if len(errors) > 1 else ""
+            return False, f"Restore failed: {errors[0]}{more}"
+
+        index_name = header['index']
+        if f"{index_name}.dat" in seen:
+            print(f" {Style.GREEN}✓{Style.END} Restored {index_name}.dat to {splunk_db}")
+        print(f" {Style.GREEN}✓{Style.END} Restored {len(seen) - (f'{index_name}.dat' in seen)} files to "
+              f"{index_name} folder, all match the manifest")
+        return self.register_restored_index(index_name)
+
+    def register_restored_index(self, index_name):
+        """Create the index in Splunk if needed and point indexes.conf at the restored data"""
+        metrics = Metrics.current()
+        splunk_db = self.get_splunk_db()
+        # The restored data changes the index's size and buckets
+        self.index_catalog.forget_details(index_name)
+        try:
+            # Verify the index exists in Splunk
+            if not self.index_exists(index_name):
+                print(f"\n{Style.BLUE}⏳ Creating index {index_name} in Splunk...{Style.END}")
+                success, message = self.create_index(index_name)
+                if not success:
+                    return False, f"Restore failed: {message}"
+            
+            # Update indexes.conf
+            conf_updated = self.update_indexes_conf(index_name)
+            metrics.lap('configure')
+            
+            return True, (f"\n{Style.GREEN}✓ Restore completed successfully!{Style.END}\n"
+                     f"{Style.BLUE}Index:{Style.END} {index_name}\n"
+                     f"{Style.BLUE}Location:{Style.END} {splunk_db}\n"
+                     f"{Style.BLUE}Configuration:{Style.END} {'updated' if conf_updated else 'update attempted'}\n"
+                     f"{Style.YELLOW}Note:{Style.END} You may need to manually restart Splunk for changes to take effect")
+        
+        except Exception as e:
+            return False, f"Restore failed: {str(e)}"
+
+    def update_indexes_conf(self, index_name):
+        """Update indexes.conf with the restored index configuration"""
+        changes, written = self.edit_indexes_conf(define={index_name: restored_index_settings(index_name)})
+        if changes is None:
+            self.print_warning("Could not update indexes.conf - index paths may need manual configuration")
+            return False
+        for _, _, path in changes:
+            self.print_success(f"Updated {path} with {index_name} configuration")
+        return True
+
+    def main_menu(self):
+        """Display the main menu"""
+        while True:
+            self.print_divider()
+            print(f"\n{Style.BOLD}{Style.BLUE}📋 Splunk Index Management Tool{Style.END}")
+            print(f"{Style.BLUE}1:{Style.END} 🆕 Create an index")
+            print(f"{Style.BLUE}2:{Style.END} 🛠  Manage indexes")
+            print(f"{Style.BLUE}3:{Style.END} 💾 Restore from backup")
+            print(f"{Style.BLUE}4:{Style.END} 🧹 Clear index size cache")
+            print(f"{Style.BLUE}5:{Style.END} 📦 Batch backup indexes")
+            print(f"{Style.BLUE}6:{Style.END} ✅ Verify a backup")
+            print(f"{Style.BLUE}0:{Style.END} 🚪 Exit")
+            
+            choice = input(f"\n{Style.PROMPT} Enter your choice: ")
+            
+            if choice == "1":
+                self.create_index_menu()
+            elif choice == "2":
+                self.manage_indexes_menu()
+            elif choice == "3":
+                self.restore_backup_menu()
+            elif choice == "4":
+                self.size_cache_menu()
+            elif choice == "5":
+                self.batch_backup_menu()
+            elif choice == "6":
+                self.verify_backup_menu()
+            elif choice == "0":
+                self.print_success("Goodbye!")
+                break
+            else:
+                self.print_error("Invalid choice, please try again.")
+
+    def create_index_menu(self):
+        """Menu for creating a new index"""
+        self.print_divider()
+        print(f"\n{Style.BOLD}🆕 Create New Index{Style.END}")
+        index_name = input(f"{Style.PROMPT} Enter the name for the new index: ")
+        
+        if not index_name:
+            self.print_error("Index name cannot be empty.")
+            return
+            
+        success, message = self.create_index(index_name)
+        if success:
+            self.print_success(message)
+        else:
+            self.print_error(message)
+
+    def manage_indexes_menu(self):
+        """Menu for managing existing indexes"""
+        self.print_divider()
+        print(f"\n{Style.BOLD}🛠 Manage Indexes{Style.END}")
+        indexes = self.list_indexes()
+        
+        if not indexes:
+            self.print_warning("No non-system indexes found.")
+            return
+            
+        # Format as "name - size" for display and selection
+        indexes = [f"{index['name']} - {self.format_size(index['bytes'])}" for index in indexes]
+
+        print(f"\n{Style.BLUE}📋 Available indexes:{Style.END}")
+        for i, index in enumerate(indexes, 1):
+            print(f"{Style.BLUE}{i}:{Style.END} {index}")
+        print(f"{Style.BLUE}0:{Style.END} ↩ Back to main menu")
+        
+        try:
+            choice = input(f"\n{Style.PROMPT} Select an index to manage: ")
+            if choice == "0":
+                return
+            choice = int(choice)
+            if 1 <= choice <= len(indexes):
+                # Pass the complete display string (with size) to operations menu
+                self.index_operations_menu(indexes[choice-1])
+            else:
+                self.print_error("Invalid selection.")
+        except ValueError:
+            self.print_error("Please enter a number.")
+            
+    def index_operations_menu(self, index_display):
+        """Menu for operations on a specific index (index_display includes size info)"""
+        # Extract just the index name (before the "-" for size)
+        index_name = index_display.split(' - ')[0].strip()
+        
+        while True:
+            self.print_divider()
+            print(f"\n{Style.BOLD}🛠 Operations for index:{Style.END} {Style.BLUE}{index_display}{Style.END}")
+            print(f"{Style.BLUE}1:{Style.END} 🗑 Delete index")
+            print(f"{Style.BLUE}2:{Style.END} 💾 Backup index")
+            print(f"{Style.BLUE}3:{Style.END} 💾🗑 Backup and delete index")
+            print(f"{Style.BLUE}0:{Style.END} ↩ Back to index list")
+            
+            choice = input(f"\n{Style.PROMPT} Enter your choice: ")
+            
+            if choice == "1":
+                confirm = input(f"\n{Style.RED}⚠ Are you absolutely sure you want to permanently delete index '{index_name}'? (y/n): {Style.END}")
+                if confirm.lower() == 'y':
+                    success, message = self.delete_index(index_name)  # Use cleaned index_name
+                    if success:
+                        self.print_success(message)
+                    else:
+                        self.print_error(message)
+                else:
+                    self.print_warning("Index deletion cancelled.")
+                break
+                
+            elif choice == "2":
+                self.backup_index_menu(index_name)  # Use cleaned index_name
+                break
+                
+            elif choice == "3":
+                if self.backup_index_menu(index_name):  # Use cleaned index_name
+                    confirm = input(f"\n{Style.RED}⚠ Are you absolutely sure you want to permanently delete index '{index_name}'? (y/n): {Style.END}")
+                    if confirm.lower() == 'y':
+                        success, message = self.delete_index(index_name)  # Use cleaned index_name
+                        if success:
+                            self.print_success(message)
+                        else:
+                            self.print_error(message)
+                    else:
+                        self.print_warning("Index deletion cancelled.")
+                break
+                
+            elif choice == "0":
+                break
+            else:
+                self.print_error("Invalid choice, please try again.")
+
+                
+    def delete_index_menu(self, index_name):
+        """Menu for deleting an index"""
+        confirm = input(f"\n{Style.RED}⚠ Are you absolutely sure you want to permanently delete index '{index_name}'? (y/n): {Style.END}")
+        if confirm.lower() == 'y':
+            success, message = self.delete_index(index_name)
+            if success:
+                self.print_success(message)
+            else:
+                self.print_error(message)
+        else:
+            self.print_warning("Index deletion cancelled.")
+                
+    def backup_index_menu(self, index_name):
+        """Menu for backing up an index - returns True if backup was initiated"""
+        print(f"\n{Style.BLUE}📁 Select backup directory{Style.END}")
+        backup_dir = input(f"{Style.PROMPT} Enter backup directory path or s3://bucket/prefix (or leave blank to browse): ")
+        
+        if not backup_dir:
+            from tkinter import Tk, filedialog
+            root = Tk()
+            root.withdraw()
+            backup_dir = filedialog.askdirectory(title="Select backup directory")
+            root.destroy()
+            
+        if not backup_dir:
+            self.print_warning("Backup cancelled.")
+            return False
+            
+        password = None
+        use_password = input(f"{Style.PROMPT} Would you like to password protect the backup? (y/n): ")
+        if use_password.lower() == 'y':
+            password = getpass.getpass(f"{Style.PROMPT} Enter backup password: ")
+
+        incremental = input(f"{Style.PROMPT} Only store buckets changed since the last backup in this folder? (y/n): ")
+            
+        success, message = self.backup_index(index_name, backup_dir, password,
+                                             incremental=incremental.lower() == 'y')
+        if success:
+            self.print_success(message)
+        else:
+            self.print_error(message)
+        return success
+
+    def size_cache_menu(self):
+        """Menu for showing and clearing the index size cache"""
+        self.print_divider()
+        print(f"\n{Style.BOLD}🧹 Index Size Cache{Style.END}")
+        stats = self.size_cache.stats()
+        print(f"{Style.BLUE}•{Style.END} Cached buckets: {stats['entries']}")
+        print(f"{Style.BLUE}•{Style.END} This session: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate)")
+
+        index_name = input(f"\n{Style.PROMPT} Index to clear (leave blank for all, 0 to cancel): ").strip()
+        if index_name == "0":
+            return
+        removed = self.invalidate_size_cache(index_name or None)
+        self.print_success(f"Removed {removed} cached bucket sizes")
+
+    def batch_backup_menu(self):
+        """Menu for backing up many indexes in one run"""
+        self.print_divider()
+        print(f"\n{Style.BOLD}📦 Batch Backup{Style.END}")
+        patterns = input(f"{Style.PROMPT} Index names or patterns, separated by spaces (e.g. case_2024_*): ").split()
+        names = self.expand_index_patterns(patterns)
+        if not names:
+            self.print_warning("No indexes selected.")
+            return
+
+        print(f"\n{Style.BLUE}📋 {len(names)} indexes selected:{Style.END} {', '.join(names)}")
+        backup_dir = input(f"{Style.PROMPT} Enter backup directory path or s3://bucket/prefix (or leave blank to browse): ")
+        if not backup_dir:
+            from tkinter import Tk, filedialog
+            root = Tk()
+            root.withdraw()
+            backup_dir = filedialog.askdirectory(title="Select backup directory")
+            root.destroy()
+        if not backup_dir:
+            self.print_warning("Backup cancelled.")
+            return
+
+        password = None
+        use_password = input(f"{Style.PROMPT} Would you like to password protect the backups? (y/n): ")
+        if use_password.lower() == 'y':
+            password = getpass.getpass(f"{Style.PROMPT} Enter backup password: ")
+
+        incremental = input(f"{Style.PROMPT} Only store buckets changed since the last backups in this folder? (y/n): ")
+
+        summary = self.backup_indexes(names, backup_dir, password, incremental=incremental.lower() == 'y')
+        self.print_backup_summary(summary)
+
+    def restore_backup_menu(self):
+        """Menu for restoring from backup"""
+        self.print_divider()
+        print(f"\n{Style.BOLD}💾 Restore from Backup{Style.END}")
+        from tkinter import Tk, filedialog
+        root = Tk()
+        root.withdraw()
+        
+        backup_file = filedialog.askopenfilename(
+            title="Select backup file to restore",
+            filetypes=[("Backups", "*.zip *.aes *.tar.zst *.tar.gz")]
+        )
+        root.destroy()
+        
+        if not backup_file:
+            self.print_warning("Restore cancelled.")
+            return
+        
+        if not self.confirm_restore():
+            self.print_warning("Restore cancelled.")
+            return
+        
+        success, message = self.restore_backup(backup_file)
+        if success:
+            self.print_success(message)
+        else:
+            self.print_error(message)
+
+    def verify_backup_menu(self):
+        """Menu for verifying a backup against its manifest"""
+        self.print_divider()
+        print(f"\n{Style.BOLD}✅ Verify a Backup{Style.END}")
+        from tkinter import Tk, filedialog
+        root = Tk()
+        root.withdraw()
+        
+        backup_file = filedialog.askopenfilename(
+            title="Select backup file to verify",
+            filetypes=[("Backups", "*.zip *.aes *.tar.zst *.tar.gz")]
+        )
+        root.destroy()
+        
+        if not backup_file:
+            self.print_warning("Verification cancelled.")
+            return
+        
+        full = input(f"{Style.PROMPT} Decompress and check every file's hash? (y/n, default: n - central directory only): ").lower() == 'y'
+        password = None
+        try:
+            if is_stream_backup(backup_file):
+                is_encrypted = is_stream_encrypted(backup_file)
+            else:
+                _, is_encrypted = self.archive_opener(backup_file)
+        except Exception as e:
+            self.print_error(f"Unable to read backup file: {str(e)}")
+            return
+        if is_encrypted:
+            print(f"\n{Style.YELLOW}🔑 This backup is password protected{Style.END}")
+            password = getpass.getpass(f"{Style.PROMPT} Enter backup password: ")
+        
+        with self.progress("Verifying backup...", unit='bytes') as progress:
+            result = self.verify_backup(backup_file, password, full, progress=progress)
+        self.print_verify_result(result)
+        speed = f" ({result['throughput'] / (1024 * 1024):.1f} MB/s)" if full else ""
+        if result['ok']:
+            self.print_success(f"Backup OK: {result['files']} files checked in {result['duration']:.1f} seconds{speed}")
+        else:
+            self.print_error(f"Backup verification failed with {len(result['errors'])} problem(s)")
+
+    def confirm_restore(self):
+        """Confirm the user wants to proceed with restore"""
+        from tkinter import Tk, messagebox
+        root = Tk()
+        root.withdraw()
+        response = messagebox.askyesno(
+            "Confirm Restore",
+            "WARNING: This will overwrite any existing index data.\n\n"
+            "Are you sure you want to continue?"
+        )
+        root.destroy()
+        return response
+
+ANSI_ESCAPE = re.compile(r'\033\[[0-9;]*m')
+
+def plain(text):
+    """Strip colour codes from a message, for JSON output"""
+    return ANSI_ESCAPE.sub('', text).strip()
+
+def build_cli_parser():
+    """Subcommands for running without the menu (from cron, scripts, CI)"""
+    parser = argparse.ArgumentParser(
+        prog="SplunkManager.py",
+        description="Splunk Index Manager. Run without arguments for the interactive menu.")
+    parser.add_argument('--json', action='store_true', help="print the result as JSON on stdout")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help="list indexes and their size")
+    list_parser.add_argument('--all', action='store_true', help="include system indexes")
+
+    create_parser = commands.add_parser('create', help="create indexes")
+    delete_parser = commands.add_parser('delete', help="delete indexes and their indexes.conf sections")
+    for command_parser in (create_parser, delete_parser):
+        command_parser.add_argument('indexes', nargs='*', metavar='index')
+        command_parser.add_argument('--file', help="read index names from this file, one per line")
+        command_parser.add_argument('--concurrency', type=int, help="Splunk calls sent at once")
+    delete_parser.add_argument('--yes', action='store_true', help="confirm the deletion")
+
+    backup_parser = commands.add_parser('backup', help="back up indexes (names or patterns like case_2024_*)")
+    backup_parser.add_argument('indexes', nargs='+')
+    backup_parser.add_argument('--dir', help="backup directory")
+    backup_parser.add_argument('--stream', metavar='TARGET',
+                               help="write one index as a tar.zst stream to TARGET instead: "
+                                    "'-' for stdout, a named pipe, a file or a folder")
+    backup_parser.add_argument('--incremental', action='store_true',
+                               help="only store buckets changed since the last backup in --dir")
+    backup_parser.add_argument('--volume-size', type=parse_size, metavar='SIZE',
+                               help="split each backup into volumes of about this size, e.g. 4G")
+    backup_parser.add_argument('--concurrency', type=int, help="indexes backed up at once")
+    backup_parser.add_argument('--workers', type=int, help="compression processes (0 = all cores)")
+    backup_parser.add_argument('--no-verify', action='store_true', help="skip checking the archives afterwards")
+    backup_parser.add_argument('--restart', action='store_true',
+                               help="start afresh instead of resuming an interrupted backup")
+
+    restore_parser = commands.add_parser('restore', help="restore an index from a backup archive")
+    restore_parser.add_argument('backup', help="backup archive, or '-' to read a streaming backup from stdin")
+    restore_parser.add_argument('--workers', type=int, help="extraction threads")
+
+    verify_parser = commands.add_parser('verify', help="check a backup against its manifest")
+    verify_parser.add_argument('backup', help="backup archive, or '-' to read a streaming backup from stdin")
+    verify_parser.add_argument('--full', action='store_true', help="decompress and hash every file")
+    verify_parser.add_argument('--workers', type=int, help="verification threads")
+
+    for command_parser in (backup_parser, restore_parser, verify_parser):
+        command_parser.add_argument('--password-env', metavar='VAR',
+                                    help="read the backup password from this environment variable")
+
+    cache_parser = commands.add_parser('cache-invalidate', help="clear cached bucket sizes")
+    cache_parser.add_argument('index', nargs='?', help="only this index (default: all)")
+
+    jobs_parser = commands.add_parser('jobs', help="queue, schedule and run backup/restore/verify jobs")
+    job_commands = jobs_parser.add_subparsers(dest='jobs_command', required=True)
+    submit_parser = job_commands.add_parser(
+        'submit', help="queue a job (or schedule it with --cron)",
+        description="backup takes index names/patterns, restore and verify take one backup file")
+    submit_parser.add_argument('kind', choices=JOB_KINDS)
+    submit_parser.add_argument('targets', nargs='+', metavar='target')
+    submit_parser.add_argument('--dir', help="backup directory (backup jobs)")
+    submit_parser.add_argument('--incremental', action='store_true')
+    submit_parser.add_argument('--volume-size', type=parse_size, metavar='SIZE',
+                               help="split backups into volumes of about this size")
+    submit_parser.add_argument('--full', action='store_true', help="full verification (verify jobs)")
+    submit_parser.add_argument('--workers', type=int)
+    submit_parser.add_argument('--password-env', metavar='VAR',
+                               help="environment variable the worker reads the backup password from")
+    submit_parser.add_argument('--priority', type=int, default=0, help="higher runs first")
+    submit_parser.add_argument('--cron', help="run on this schedule instead of once, e.g. '0 2 * * *'")
+    submit_parser.add_argument('--name', help="schedule name (default: derived from the job)")
+    list_jobs_parser = job_commands.add_parser('list', help="show recent jobs")
+    list_jobs_parser.add_argument('--status', choices=JOB_STATES)
+    list_jobs_parser.add_argument('--limit', type=int, default=50)
+    status_parser = job_commands.add_parser('status', help="show one job with its result")
+    status_parser.add_argument('job_id', type=int)
+    cancel_parser = job_commands.add_parser('cancel', help="cancel a queued job")
+    cancel_parser.add_argument('job_id', type=int)
+    job_commands.add_parser('schedules', help="list schedules")
+    unschedule_parser = job_commands.add_parser('unschedule', help="remove a schedule")
+    unschedule_parser.add_argument('name')
+    worker_parser = job_commands.add_parser('worker', help="run queued and scheduled jobs")
+    worker_parser.add_argument('--workers', type=int, default=JOB_WORKERS, help="jobs run at once")
+    worker_parser.add_argument('--once', action='store_true', help="exit when the queue is empty")
+
+    for command_parser in (backup_parser, worker_parser):
+        command_parser.add_argument('--limit-rate', type=parse_size, metavar='SIZE',
+                                    help="read index files at most this fast per second, e.g. 50M")
+        command_parser.add_argument('--limit-files', type=float, metavar='N',
+                                    help="open at most this many index files per second")
+        command_parser.add_argument('--low-priority', action='store_true',
+                                    help="run at a lower CPU and disk priority")
+    return parser
+
+def read_index_list(path):
+    """Index names from a file, one per line; blank lines and # comments are skipped"""
+    try:
+        with open(path, 'r') as f:
+            lines = [line.split('#', 1)[0].strip() for line in f]
+    except OSError as e:
+        raise ConfigError(f"Cannot read index list {path}: {e}")
+    return [line for line in lines if line]
+
+def cli_password(args):
+    """Return the backup password named by --password-env, or None"""
+    if not getattr(args, 'password_env', None):
+        return None
+    password = os.environ.get(args.password_env)
+    if password is None:
+        raise ConfigError(f"Environment variable {args.password_env} is not set")
+    return password
+
+def apply_io_limits(manager, args):
+    """Put --limit-rate, --limit-files and --low-priority over config.txt for this process
+
+    Low priority is set on the process itself before any threads start, so
+    the threads and worker processes of the backups inherit it.
+    """
+    if args.limit_rate is not None:
+        manager.throttle_bytes_per_second = args.limit_rate
+    if args.limit_files is not None:
+        manager.throttle_files_per_second = args.limit_files
+    if args.low_priority:
+        manager.low_priority = True
+    if manager.low_priority:
+        for warning in lower_priority():
+            manager.print_warning(warning)
+
+def run_cli_command(manager, args):
+    """Run one subcommand, returns (success, JSON-serialisable result)"""
+    if args.command == 'backup' or getattr(args, 'jobs_command', None) == 'worker':
+        apply_io_limits(manager, args)
+
+    if args.command == 'list':
+        indexes = manager.list_indexes(exclude_system=not args.all)
+        if not args.json:
+            for index in indexes:
+                print(f"{index['name']} - {manager.format_size(index['bytes'])}")
+        return True, {'indexes': indexes}
+
+    if args.command in ('create', 'delete'):
+        names = list(args.indexes)
+        if args.file:
+            names.extend(read_index_list(args.file))
+        if not names:
+            message = "No index names given"
+        elif args.command == 'delete' and not args.yes:
+            message = f"Not deleting {len(names)} index(es) without --yes"
+        else:
+            message = None
+        if message:
+            if not args.json:
+                manager.print_error(message)
+            return False, {'results': [], 'message': message}
+
+        action = manager.create_indexes if args.command == 'create' else manager.delete_indexes
+        results = action(names, args.concurrency)
+        for result in results:
+            result['message'] = plain(result['message'])
+            if not args.json:
+                (manager.print_success if result['success'] else manager.print_error)(result['message'])
+        succeeded = sum(1 for r in results if r['success'])
+        return succeeded == len(results), {'results': results, 'succeeded': succeeded,
+                                           'failed': len(results) - succeeded}
+
+    if args.command == 'backup':
+        names = manager.expand_index_patterns(args.indexes) if args.stream else None
+        if not args.stream and not args.dir:
+            message = "Backups need --dir (or --stream)"
+        elif args.stream and (args.dir or args.incremental or args.volume_size):
+            message = "--stream writes one full backup, it can't be combined with --dir, --incremental or --volume-size"
+        elif args.stream and not isinstance(args.stream, str) and args.stream.isatty():
+            message = "Not writing a backup stream to a terminal, redirect or pipe stdout"
+        elif args.stream and len(names) != 1:
+            message = f"--stream takes exactly one index, got {len(names)}"
+        else:
+            message = None
+        if message:
+            if not args.json:
+                manager.print_error(message)
+            return False, {'results': [], 'message': message}
+
+    if args.command == 'backup' and args.stream:
+        password = cli_password(args)
+        try:
+            with manager.progress(f"Streaming {names[0]}...", unit='bytes') as progress:
+                result = manager.run_stream_backup(names[0], args.stream, password, args.workers, progress)
+        except Exception as e:
+            result = {'index': names[0], 'archive': None, 'bytes_in': 0, 'bytes_out': 0, 'duration': 0.0,
+                      'throughput': 0.0, 'warnings': [], 'error': str(e)}
+        for warning in result['warnings']:
+            manager.print_warning(warning)
+        # Only a finished file can be read back, a pipe or stdout is gone once written
+        if not result['error'] and not args.no_verify and os.path.isfile(result['archive']):
+            verification = manager.verify_backup(result['archive'], password)
+            result['verified'] = verification['ok']
+            if not verification['ok']:
+                result['error'] = f"verification failed: {verification['errors'][0]}"
+        summary = {'results': [result], 'succeeded': int(not result['error']), 'failed': int(bool(result['error'])),
+                   'bytes_in': result['bytes_in'], 'bytes_out': result['bytes_out'], 'duration': result['duration']}
+        if not args.json:
+            manager.print_backup_summary(summary)
+        return not summary['failed'], summary
+
+    if args.command == 'backup':
+        password = cli_password(args)
+        summary = manager.backup_indexes(args.indexes, args.dir, password, args.concurrency,
+                                         args.workers, args.incremental, not args.restart, args.volume_size)
+        if not summary['results']:
+            return False, dict(summary, message="No indexes to back up")
+        if not args.no_verify:
+            for result in summary['results']:
+                if result['error']:
+                    continue
+                verification = manager.verify_backup(result['archive'], password)
+                result['verified'] = verification['ok']
+                if not verification['ok']:
+                    result['error'] = f"verification failed: {verification['errors'][0]}"
+            summary['succeeded'] = sum(1 for r in summary['results'] if not r['error'])
+            summary['failed'] = len(summary['results']) - summary['succeeded']
+        if not args.json:
+            manager.print_backup_summary(summary)
+        return not summary['failed'], summary
+
+    if args.command == 'restore':
+        success, message = manager.restore_backup(args.backup, args.workers, cli_password(args))
+        if not args.json:
+            (manager.print_success if success else manager.print_error)(message)
+        return success, {'backup': args.backup, 'message': plain(message)}
+
+    if args.command == 'verify':
+        result = manager.verify_backup(args.backup, cli_password(args), args.full, args.workers)
+        if not args.json:
+            manager.print_verify_result(result)
+            if result['ok']:
+                manager.print_success(f"Backup OK: {result['files']} files checked in {result['duration']:.1f} seconds")
+            else:
+                manager.print_error(f"Backup verification failed with {len(result['errors'])} problem(s)")
+        return result['ok'], result
+
+    if args.command == 'jobs':
+        return run_jobs_command(manager, args)
+
+    if args.command == 'cache-invalidate':
+        removed = manager.invalidate_size_cache(args.index)
+        if not args.json:
+            manager.print_success(f"Removed {removed} cached bucket sizes")
+        return True, {'index': args.index, 'removed': removed}
+
+def job_params(args):
+    """Job parameters from `jobs submit` arguments"""
+    if args.kind == 'backup':
+        if not args.dir:
+            raise ConfigError("Backup jobs need --dir")
+        params = {'indexes': args.targets, 'backup_dir': args.dir if is_s3_url(args.dir) else os.path.abspath(args.dir),
+                  'incremental': args.incremental}
+        if args.volume_size:
+            params['volume_size'] = args.volume_size
+    else:
+        if len(args.targets) != 1:
+            raise ConfigError(f"{args.kind.capitalize()} jobs take one backup file")
+        target = args.targets[0]
+        params = {'backup': target if is_s3_url(target) else os.path.abspath(target)}
+        if args.kind == 'verify':
+            params['full'] = args.full
+    if args.workers is not None:
+        params['workers'] = args.workers
+    if args.password_env:
+        params['password_env'] = args.password_env
+    return params
+
+def format_job(job):
+    """One line per job for `jobs list`"""
+    progress = ""
+    if job['status'] == 'running' and job['progress_total']:
+        progress = f" {job['progress_done'] / job['progress_total']:.0%}"
+    created = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created']))
+    target = ' '.join(job['params'].get('indexes') or [job['params'].get('backup', '')])
+    error = f" - {job['error']}" if job['error'] else ""
+    return f"{job['id']:>5}  {job['status']:<9}{progress:<5} {job['kind']:<8} p{job['priority']:<3} {created}  {target}{error}"
+
+def run_jobs_command(manager, args):
+    """Run one `jobs` subcommand, returns (success, result)"""
+    queue = JobQueue()
+    if args.jobs_command == 'submit':
+        params = job_params(args)
+        if args.cron:
+            name = args.name or f"{args.kind}-{'-'.join(args.targets)}"
+            try:
+                next_run = queue.add_schedule(name, args.kind, params, args.cron, args.priority)
+            except ValueError as e:
+                raise ConfigError(str(e))
+            if not args.json:
+                manager.print_success(f"Scheduled '{name}', next run {time.strftime('%Y-%m-%d %H:%M', time.localtime(next_run))}")
+            return True, {'schedule': name, 'next_run': next_run}
+        job_id = queue.submit(args.kind, params, args.priority)
+        if not args.json:
+            manager.print_success(f"Queued job {job_id}")
+        return True, {'job_id': job_id}
+
+    if args.jobs_command == 'list':
+        jobs = queue.list(args.status, args.limit)
+        if not args.json:
+            for job in jobs:
+                print(format_job(job))
+        return True, {'jobs': jobs}
+
+    if args.jobs_command == 'status':
+        job = queue.get(args.job_id)
+        if job is None:
+            if not args.json:
+                manager.print_error(f"No job {args.job_id}")
+            return False, {'job_id': args.job_id, 'error': "not found"}
+        if not args.json:
+            print(format_job(job))
+            if job['result'] is not None:
+                print(json.dumps(job['result'], indent=2))
+        return job['status'] != 'failed', {'job': job}
+
+    if args.jobs_command == 'cancel':
+        cancelled = queue.cancel(args.job_id)
+        if not args.json:
+            if cancelled:
+                manager.print_success(f"Cancelled job {args.job_id}")
+            else:
+                manager.print_error(f"Job {args.job_id} is not queued")
+        return cancelled, {'job_id': args.job_id, 'cancelled': cancelled}
+
+    if args.jobs_command == 'schedules':
+        schedules = queue.schedules()
+        if not args.json:
+            for schedule in schedules:
+                next_run = time.strftime('%Y-%m-%d %H:%M', time.localtime(schedule['next_run']))
+                print(f"{schedule['name']:<30} {schedule['cron']:<15} next {next_run}  {schedule['kind']}")
+        return True, {'schedules': schedules}
+
+    if args.jobs_command == 'unschedule':
+        removed = queue.remove_schedule(args.name)
+        if not args.json:
+            (manager.print_success if removed else manager.print_error)(
+                f"Removed schedule '{args.name}'" if removed else f"No schedule '{args.name}'")
+        return removed, {'schedule': args.name, 'removed': removed}
+
+    if args.jobs_command == 'worker':
+        worker = JobWorker(manager, queue, args.workers)
+        manager.print_info(f"Job worker {worker.name} running {worker.workers} job(s) at a time")
+        try:
+            worker.run(once=args.once)
+        except KeyboardInterrupt:
+            worker.stop()
+            manager.print_warning("Worker stopped, running jobs will be requeued by the next worker")
+        return True, {'worker': worker.name}
+
+def run_cli(argv):
+    """Headless entry point, returns the process exit code
+
+    With --json, progress and messages go to stderr and stdout only carries
+    the JSON result.
+    """
+    args = build_cli_parser().parse_args(argv)
+    output = sys.stdout
+    # A backup streamed to stdout needs it for the data, the JSON result goes to stderr then
+    streaming = getattr(args, 'stream', None) == '-'
+    if streaming:
+        args.stream = sys.stdout.buffer
+        output = sys.stderr
+    try:
+        # Keep stdout clean for the JSON result
+        with contextlib.redirect_stdout(sys.stderr if args.json or streaming else sys.stdout):
+            manager = SplunkManager(interactive=False)
+            success, result = run_cli_command(manager, args)
+    except ConfigError as e:
+        if args.json:
+            print(json.dumps({'success': False, 'error': str(e)}, indent=2), file=output)
+        else:
+            print(f"{Style.RED}{Style.ERROR} {e}{Style.END}", file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(dict(result, success=success), indent=2, default=str), file=output)
+    return 0 if success else 1
+
+def main(argv=None):
+    """Run a command line command, or the interactive menu without arguments; returns the exit code"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+    print_header()
+    try:
+        manager = SplunkManager()
+        manager.main_menu()
+    except KeyboardInterrupt:
+        print("\n\n" + Style.HEADER)
+        print(f"{Style.RED}{Style.ERROR} Operation cancelled by user{Style.END}")
+        print(Style.HEADER + "\n")
+    except Exception as e:
+        print("\n\n" + Style.HEADER)
+        print(f"{Style.RED}{Style.ERROR} Critical error: {str(e)}{Style.END}")
+        print(Style.HEADER + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Local stand-in for the splunkd management API
+
+Implements just enough of /services/auth/login and /services/data/indexes for
+SplunkManager's REST client to be exercised without a Splunk install:
+
+    python splunkd_standin.py --port 8089 --username admin --password changeme
+
+Use --certfile/--keyfile to serve HTTPS, otherwise point management_url in
+config.txt at http://127.0.0.1:<port>. With --splunk-db the index folders are
+created and removed on disk like splunkd would.
+"""
+import os
+import json
+import ssl
+import shutil
+import argparse
+import secrets
+import time
+from threading import Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+DEFAULT_INDEXES = [
+    '_audit', '_internal', '_introspection', '_metrics', '_telemetry', '_thefishbucket',
+    'history', 'main', 'summary', 'splunklogger'
+]
+DEFAULT_METRIC_INDEXES = ['_metrics']
+
+
+class StandinState:
+    """Indexes and session keys held by the stand-in server"""
+
+    def __init__(self, username, password, splunk_db=None, session_timeout=None):
+        self.username = username
+        self.password = password
+        self.splunk_db = splunk_db
+        self.session_timeout = session_timeout
+        self.indexes = set(DEFAULT_INDEXES)
+        self.metric_indexes = set(DEFAULT_METRIC_INDEXES)
+        self.sessions = {}
+        self.requests = 0
+        self.logins = 0
+        self.lock = Lock()
+
+    def add_index(self, name, datatype='event'):
+        with self.lock:
+            if name in self.indexes:
+                return False
+            self.indexes.add(name)
+            if datatype == 'metric':
+                self.metric_indexes.add(name)
+        if self.splunk_db:
+            for folder in ('db', 'colddb', 'thaweddb'):
+                os.makedirs(os.path.join(self.splunk_db, name, folder), exist_ok=True)
+        return True
+
+    def remove_index(self, name):
+        with self.lock:
+            if name not in self.indexes:
+                return False
+            self.indexes.discard(name)
+            self.metric_indexes.discard(name)
+        if self.splunk_db:
+            shutil.rmtree(os.path.join(self.splunk_db, name), ignore_errors=True)
+        return True
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Request handler mimicking the splunkd JSON responses"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'Splunkd'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, text):
+        self._reply(status, {'messages': [{'type': 'ERROR', 'text': text}]})
+
+    def _params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        params = parse_qs(urlsplit(self.path).query)
+        params.update(parse_qs(body))
+        return {key: values[-1] for key, values in params.items()}
+
+    def _authorized(self):
+        header = self.headers.get('Authorization', '')
+        token = header[len('Splunk '):] if header.startswith('Splunk ') else None
+        with self.state.lock:
+            self.state.requests += 1
+            if token in self.state.sessions:
+                timeout = self.state.session_timeout
+                if timeout is None or time.time() - self.state.sessions[token] < timeout:
+                    # Like splunkd, the timeout counts from the last request
+                    self.state.sessions[token] = time.time()
+                    return True
+                del self.state.sessions[token]
+        self._error(401, 'call not properly authenticated')
+        return False
+
+    def _route(self):
+        return urlsplit(self.path).path.rstrip('/')
+
+    def do_POST(self):
+        path = self._route()
+        params = self._params()
+        if path == '/services/auth/login':
+            with self.state.lock:
+                self.state.requests += 1
+            if params.get('username') != self.state.username or params.get('password') != self.state.password:
+                self._error(401, 'Login failed')
+                return
+            session_key = secrets.token_hex(16)
+            with self.state.lock:
+                self.state.sessions[session_key] = time.time()
+                self.state.logins += 1
+            self._reply(200, {'sessionKey': session_key})
+            return
+
+        if not self._authorized():
+            return
+        if path == '/services/data/indexes':
+            name = params.get('name')
+            if not name:
+                self._error(400, "Argument 'name' is required")
+            elif not self.state.add_index(name, params.get('datatype', 'event')):
+                self._error(409, f"In handler 'indexes': Index name={name} already exists")
+            else:
+                self._reply(201, {'entry': [{'name': name, 'content': {}}]})
+            return
+        self._error(404, 'Not Found')
+
+    def do_GET(self):
+        path = self._route()
+        params = self._params()
+        if not self._authorized():
+            return
+        if path == '/services/data/indexes':
+            # Like splunkd, only event indexes are listed unless datatype=metric or all is asked for
+            datatype = params.get('datatype', 'event')
+            with self.state.lock:
+                if datatype == 'all':
+                    names = sorted(self.state.indexes)
+                elif datatype == 'metric':
+                    names = sorted(self.state.metric_indexes)
+                else:
+                    names = sorted(self.state.indexes - self.state.metric_indexes)
+            self._reply(200, {'entry': [{'name': name, 'content': {}} for name in names]})
+            return
+        if path == '/services/server/info':
+            self._reply(200, {'entry': [{'name': 'server-info', 'content': {'version': 'standin'}}]})
+            return
+        self._error(404, 'Not Found')
+
+    def do_DELETE(self):
+        path = self._route()
+        self._params()
+        if not self._authorized():
+            return
+        prefix = '/services/data/indexes/'
+        if path.startswith(prefix):
+            name = unquote(path[len(prefix):])
+            if self.state.remove_index(name):
+                self._reply(200, {'entry': []})
+            else:
+                self._error(404, f"Could not find object id={name}")
+            return
+        self._error(404, 'Not Found')
+
+
+def make_server(host='127.0.0.1', port=0, username='admin', password='changeme',
+                splunk_db=None, certfile=None, keyfile=None, verbose=False, session_timeout=None):
+    """Create a stand-in server (port 0 picks a free port), call serve_forever() to run it"""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(username, password, splunk_db, session_timeout)
+    server.verbose = verbose
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the splunkd management API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='changeme')
+    parser.add_argument('--splunk-db', help="create/remove index folders under this var/lib/splunk")
+    parser.add_argument('--certfile', help="serve HTTPS with this certificate")
+    parser.add_argument('--keyfile')
+    parser.add_argument('--session-timeout', type=float, help="expire idle session keys after this many seconds")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.username, args.password,
+                         args.splunk_db, args.certfile, args.keyfile, args.verbose, args.session_timeout)
+    scheme = 'https' if args.certfile else 'http'
+    print(f"splunkd stand-in listening on {scheme}://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()